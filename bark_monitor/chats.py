@@ -1,11 +1,33 @@
+import threading
 from pathlib import Path
+from typing import Optional
 
 import jsonpickle
 from telegram import Chat
 
+from bark_monitor import serialization
+from bark_monitor.recorders.journal import write_atomic
+
 
 class Chats:
+    """Chats registered to the bot, saved in `chats.json` in the config folder.
+
+    `read` returns the same object for a folder as long as the file is not modified,
+    so that commands do not read the file every time they check a chat. The file is
+    read again when its modification time or size changes.
+
+    `add` replaces the set of chats instead of modifying it, so a set returned by
+    `chats` can be iterated while another thread adds a chat.
+    """
+
     __create_key = object()
+    # Version of the format written by `save`
+    version = 1
+
+    # Chats by config folder, with the modification time and size of the file they
+    # were read from
+    _cache: dict[Path, tuple[Optional[tuple[int, int]], "Chats"]] = {}
+    lock = threading.RLock()
 
     def __init__(self, create_key, config_folder: str) -> None:
         self._chats: set[int] = set()
@@ -20,9 +42,10 @@ class Chats:
         return self._chats
 
     def add(self, chat: Chat) -> None:
-        # Comment to not add new users to the bot
-        self._chats.add(chat.id)
-        self.save()
+        with Chats.lock:
+            # Comment to not add new users to the bot
+            self._chats = self._chats | {chat.id}
+            self.save()
 
     @staticmethod
     def folder(config_folder: Path) -> Path:
@@ -35,20 +58,53 @@ class Chats:
         return str(Path(Chats.folder(self._config_folder), "chats.json"))
 
     def save(self):
-        # Using a JSON string
-        encoded = jsonpickle.encode(self)
-        assert encoded is not None
-        with open(self._path, "w") as outfile:
-            outfile.write(encoded)
+        encoded = serialization.dumps(
+            {"version": Chats.version, "chats": sorted(self._chats)}
+        )
+        with Chats.lock:
+            write_atomic(Path(self._path), encoded)
+            Chats._cache[self._config_folder] = (
+                Chats._file_key(Path(self._path)),
+                self,
+            )
 
-    @classmethod
-    def read(cls, config_folder: str) -> "Chats":
-        state = Chats(cls.__create_key, config_folder)
+    @staticmethod
+    def _file_key(path: Path) -> Optional[tuple[int, int]]:
+        """Modification time and size of `path`, None if it does not exist."""
         try:
-            with open(state._path, "r") as file:
-                # dict = json.load(file)
-                lines = file.read()
-                state = jsonpickle.decode(lines)
-                return state  # type: ignore
+            stat = path.stat()
         except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    @classmethod
+    def read(cls, config_folder: str) -> "Chats":
+        folder = Path(config_folder).absolute()
+        with cls.lock:
+            key = cls._file_key(Path(folder, "chats.json"))
+            cached = cls._cache.get(folder)
+            if cached is not None and cached[0] == key:
+                return cached[1]
+
+            state = Chats(cls.__create_key, config_folder)
+            path = Path(state._path)
+            if key is not None:
+                state = cls._decode(state, path.read_bytes())
+                # The chats live where they are read from, even if the folder moved
+                state._config_folder = folder
+            cls._cache[folder] = (key, state)
             return state
+
+    @classmethod
+    def _decode(cls, state: "Chats", encoded: bytes) -> "Chats":
+        data = serialization.loads(encoded)
+        if serialization.is_jsonpickle(data):
+            return jsonpickle.decode(encoded, keys=False)  # type: ignore
+        if data["version"] > Chats.version:
+            raise ValueError(
+                "Chats of version "
+                + str(data["version"])
+                + " are too recent, update bark_monitor"
+            )
+        state._chats = set(data["chats"])
+        return state
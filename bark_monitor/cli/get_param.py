@@ -1,8 +1,89 @@
 import argparse
 import json
+from typing import NamedTuple
 
+from bark_monitor.recorders.chunk_queue import BackpressurePolicy
+from bark_monitor.recorders.clip_writer import AudioCodec
 
-def get_parameters() -> tuple[bool, str, str, str, str | None, int, int, str | None]:
+
+class Parameters(NamedTuple):
+    accept_new_users: bool
+    api_key: str
+    output_folder: str
+    config_folder: str
+    things_board_url: str | None
+    microphone_framerate: int
+    sampling_time_bark_seconds: int
+    google_cred: str | None
+    pre_roll_seconds: float
+    clip_fsync_seconds: float
+    audio_codec: AudioCodec
+    sync_interval_seconds: float | None
+    recording_database: bool
+    activity_retention_days: float | None
+    queue_size: int
+    backpressure: BackpressurePolicy
+    tflite_threads: int | None
+    tflite_xnnpack: bool
+    hop_seconds: float | None
+    score_smoothing: float
+    energy_gate: bool
+    gate_margin_db: float
+    amplitude_on_ratio: float
+    amplitude_off_ratio: float
+    notification_queue_size: int
+    notification_timeout_seconds: float
+    notification_coalesce_seconds: float
+    notification_digest_seconds: float | None
+    chat_messages_per_minute: float
+    metrics_port: int | None
+    tracing: bool
+    trace_memory: bool
+
+    @property
+    def recorder_options(self) -> dict:
+        """Keyword arguments common to all recorders."""
+        return {
+            "pre_roll_seconds": self.pre_roll_seconds,
+            "fsync_seconds": self.clip_fsync_seconds,
+            "codec": self.audio_codec,
+            "sync_interval_seconds": self.sync_interval_seconds,
+            "database": self.recording_database,
+            "retention_days": self.activity_retention_days,
+            "queue_size": self.queue_size,
+            "backpressure": self.backpressure,
+            "metrics_port": self.metrics_port,
+            "tracing": self.tracing,
+            "trace_memory": self.trace_memory,
+        }
+
+    @property
+    def bot_options(self) -> dict:
+        """Keyword arguments of the bot."""
+        return {
+            "api_key": self.api_key,
+            "config_folder": self.config_folder,
+            "accept_new_users": self.accept_new_users,
+            "google_creds": self.google_cred,
+            "notification_queue_size": self.notification_queue_size,
+            "notification_timeout_seconds": self.notification_timeout_seconds,
+            "notification_coalesce_seconds": self.notification_coalesce_seconds,
+            "notification_digest_seconds": self.notification_digest_seconds,
+            "chat_messages_per_minute": self.chat_messages_per_minute,
+        }
+
+    @property
+    def detector_options(self) -> dict:
+        """Keyword arguments common to the neural network recorders."""
+        return {
+            "hop_seconds": self.hop_seconds,
+            "score_smoothing": self.score_smoothing,
+            "energy_gate": self.energy_gate,
+            "gate_margin_db": self.gate_margin_db,
+        }
+
+
+def get_parameters() -> Parameters:
     parser = argparse.ArgumentParser()
     parser.add_argument(
         "--config-file",
@@ -52,13 +133,140 @@ def get_parameters() -> tuple[bool, str, str, str, str | None, int, int, str | N
         json_data["google credentials"] if "google credentials" in json_data else None
     )
 
-    return (
-        args.accept_new_users,
-        json_data["api_key"],
-        json_data["output_folder"],
-        json_data["config_folder"],
-        things_board_url,
-        microphone_framerate,
-        sampling_time_bark_seconds,
-        google_cred,
+    pre_roll_seconds = (
+        json_data["pre roll seconds"] if "pre roll seconds" in json_data else 2
+    )
+
+    clip_fsync_seconds = (
+        json_data["clip fsync seconds"] if "clip fsync seconds" in json_data else 5
+    )
+
+    audio_codec = AudioCodec.from_name(
+        json_data["audio codec"] if "audio codec" in json_data else "wav"
+    )
+
+    sync_interval_seconds = (
+        json_data["google sync interval seconds"]
+        if "google sync interval seconds" in json_data
+        else 600
+    )
+
+    recording_database = (
+        json_data["recording database"] if "recording database" in json_data else False
+    )
+
+    # Old activities are only rolled up, and deleted, if the user asks for it
+    activity_retention_days = (
+        json_data["activity retention days"]
+        if "activity retention days" in json_data
+        else None
+    )
+
+    queue_size = json_data["queue size"] if "queue size" in json_data else 32
+
+    backpressure = BackpressurePolicy.from_name(
+        json_data["backpressure policy"]
+        if "backpressure policy" in json_data
+        else "drop_oldest"
+    )
+
+    tflite_threads = (
+        json_data["tflite threads"] if "tflite threads" in json_data else None
+    )
+
+    tflite_xnnpack = (
+        json_data["tflite xnnpack"] if "tflite xnnpack" in json_data else True
+    )
+
+    hop_seconds = json_data["hop seconds"] if "hop seconds" in json_data else None
+
+    score_smoothing = (
+        json_data["score smoothing"] if "score smoothing" in json_data else 0
+    )
+
+    energy_gate = json_data["energy gate"] if "energy gate" in json_data else False
+
+    gate_margin_db = (
+        json_data["energy gate margin db"]
+        if "energy gate margin db" in json_data
+        else 6
+    )
+
+    amplitude_on_ratio = (
+        json_data["amplitude on ratio"] if "amplitude on ratio" in json_data else 2
+    )
+
+    amplitude_off_ratio = (
+        json_data["amplitude off ratio"] if "amplitude off ratio" in json_data else 1.5
+    )
+
+    notification_queue_size = (
+        json_data["notification queue size"]
+        if "notification queue size" in json_data
+        else 100
+    )
+
+    notification_timeout_seconds = (
+        json_data["notification timeout seconds"]
+        if "notification timeout seconds" in json_data
+        else 10
+    )
+
+    notification_coalesce_seconds = (
+        json_data["notification coalesce seconds"]
+        if "notification coalesce seconds" in json_data
+        else 30
+    )
+
+    notification_digest_seconds = (
+        json_data["notification digest seconds"]
+        if "notification digest seconds" in json_data
+        else 3600
+    )
+
+    chat_messages_per_minute = (
+        json_data["chat messages per minute"]
+        if "chat messages per minute" in json_data
+        else 20
+    )
+
+    metrics_port = json_data["metrics port"] if "metrics port" in json_data else None
+
+    tracing = json_data["tracing"] if "tracing" in json_data else False
+
+    trace_memory = json_data["trace memory"] if "trace memory" in json_data else False
+
+    return Parameters(
+        accept_new_users=args.accept_new_users,
+        api_key=json_data["api_key"],
+        output_folder=json_data["output_folder"],
+        config_folder=json_data["config_folder"],
+        things_board_url=things_board_url,
+        microphone_framerate=microphone_framerate,
+        sampling_time_bark_seconds=sampling_time_bark_seconds,
+        google_cred=google_cred,
+        pre_roll_seconds=pre_roll_seconds,
+        clip_fsync_seconds=clip_fsync_seconds,
+        audio_codec=audio_codec,
+        sync_interval_seconds=sync_interval_seconds,
+        recording_database=recording_database,
+        activity_retention_days=activity_retention_days,
+        queue_size=queue_size,
+        backpressure=backpressure,
+        tflite_threads=tflite_threads,
+        tflite_xnnpack=tflite_xnnpack,
+        hop_seconds=hop_seconds,
+        score_smoothing=score_smoothing,
+        energy_gate=energy_gate,
+        gate_margin_db=gate_margin_db,
+        amplitude_on_ratio=amplitude_on_ratio,
+        amplitude_off_ratio=amplitude_off_ratio,
+        notification_queue_size=notification_queue_size,
+        notification_timeout_seconds=notification_timeout_seconds,
+        notification_coalesce_seconds=notification_coalesce_seconds,
+        notification_digest_seconds=notification_digest_seconds,
+        chat_messages_per_minute=chat_messages_per_minute,
+        metrics_port=metrics_port,
+        tracing=tracing,
+        trace_memory=trace_memory,
     )
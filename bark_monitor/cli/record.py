@@ -4,24 +4,15 @@ from bark_monitor.very_bark_bot import VeryBarkBot
 
 
 def main():
-    (
-        accept_new_users,
-        api_key,
-        output_folder,
-        config_folder,
-        _,
-        _,
-        _,
-        google_creds,
-    ) = get_parameters()
+    parameters = get_parameters()
 
-    recorder = Recorder(output_folder)
-    bot = VeryBarkBot(
-        api_key=api_key,
-        config_folder=config_folder,
-        accept_new_users=accept_new_users,
-        google_creds=google_creds,
+    recorder = Recorder(
+        parameters.output_folder,
+        on_ratio=parameters.amplitude_on_ratio,
+        off_ratio=parameters.amplitude_off_ratio,
+        **parameters.recorder_options,
     )
+    bot = VeryBarkBot(**parameters.bot_options)
     recorder.start_bot(bot)
 
 
@@ -4,28 +4,18 @@ from bark_monitor.very_bark_bot import VeryBarkBot
 
 
 def main():
-    (
-        accept_new_users,
-        api_key,
-        output_folder,
-        config_folder,
-        things_board_device,
-        microphone_framerate,
-        _,
-        google_creds,
-    ) = get_parameters()
+    parameters = get_parameters()
 
     recorder = YamnetLiteRecorder(
-        output_folder=output_folder,
-        http_url=things_board_device,
-        framerate=microphone_framerate,
-    )
-    bot = VeryBarkBot(
-        api_key=api_key,
-        config_folder=config_folder,
-        accept_new_users=accept_new_users,
-        google_creds=google_creds,
+        output_folder=parameters.output_folder,
+        http_url=parameters.things_board_url,
+        framerate=parameters.microphone_framerate,
+        num_threads=parameters.tflite_threads,
+        use_xnnpack=parameters.tflite_xnnpack,
+        **parameters.recorder_options,
+        **parameters.detector_options,
     )
+    bot = VeryBarkBot(**parameters.bot_options)
     recorder.start_bot(bot)
 
 
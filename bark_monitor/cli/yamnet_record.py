@@ -4,29 +4,17 @@ from bark_monitor.very_bark_bot import VeryBarkBot
 
 
 def main():
-    (
-        accept_new_users,
-        api_key,
-        output_folder,
-        config_folder,
-        things_board_device,
-        microphone_framerate,
-        sampling_time_bark_seconds,
-        google_creds,
-    ) = get_parameters()
+    parameters = get_parameters()
 
     recorder = YamnetRecorder(
-        output_folder=output_folder,
-        sampling_time_bark_seconds=sampling_time_bark_seconds,
-        http_url=things_board_device,
-        framerate=microphone_framerate,
-    )
-    bot = VeryBarkBot(
-        api_key=api_key,
-        config_folder=config_folder,
-        accept_new_users=accept_new_users,
-        google_creds=google_creds,
+        output_folder=parameters.output_folder,
+        sampling_time_bark_seconds=parameters.sampling_time_bark_seconds,
+        http_url=parameters.things_board_url,
+        framerate=parameters.microphone_framerate,
+        **parameters.recorder_options,
+        **parameters.detector_options,
     )
+    bot = VeryBarkBot(**parameters.bot_options)
     recorder.start_bot(bot)
 
 
@@ -0,0 +1,292 @@
+import bisect
+import os
+import resource
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import perf_counter
+from typing import Callable, Iterator, Optional
+
+# Upper bounds in seconds of the buckets of the histograms of durations
+DURATION_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+)
+
+
+class Counter:
+    def __init__(self, name: str, help: str) -> None:
+        self.name = name
+        self.help = help
+        self._value = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def value(self) -> float:
+        return self._value
+
+    def inc(self, amount: float = 1) -> None:
+        with self._lock:
+            self._value += amount
+
+    def render(self) -> str:
+        return f"{self.name} {self._value}\n"
+
+
+class Histogram:
+    """Distribution of observed values, counted in buckets of upper bounds
+    `buckets`."""
+
+    def __init__(
+        self, name: str, help: str, buckets: tuple[float, ...] = DURATION_BUCKETS
+    ) -> None:
+        self.name = name
+        self.help = help
+        self._buckets = buckets
+        # The last count is for the values above all the buckets
+        self._counts = [0] * (len(buckets) + 1)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def count(self) -> int:
+        return sum(self._counts)
+
+    @property
+    def sum(self) -> float:
+        return self._sum
+
+    def observe(self, value: float) -> None:
+        with self._lock:
+            self._counts[bisect.bisect_left(self._buckets, value)] += 1
+            self._sum += value
+
+    @contextmanager
+    def time(self) -> Iterator[None]:
+        """Observe the duration in seconds of the `with` block."""
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(perf_counter() - start)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket of the `q` quantile, None if nothing was
+        observed."""
+        with self._lock:
+            counts = list(self._counts)
+        total = sum(counts)
+        if total == 0:
+            return None
+        cumulative = 0
+        for bound, count in zip(self._buckets + (float("inf"),), counts):
+            cumulative += count
+            if cumulative >= q * total:
+                return bound
+        return float("inf")
+
+    def render(self) -> str:
+        with self._lock:
+            counts = list(self._counts)
+            total = self._sum
+        lines = ""
+        cumulative = 0
+        for bound, count in zip(self._buckets + (float("inf"),), counts):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else str(bound)
+            lines += f'{self.name}_bucket{{le="{le}"}} {cumulative}\n'
+        lines += f"{self.name}_sum {total}\n"
+        lines += f"{self.name}_count {cumulative}\n"
+        return lines
+
+
+class Gauge:
+    """Value read from `function` when the metrics are collected, None when there is
+    no value. A gauge of `kind` "counter" reports a value that only grows."""
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        function: Callable[[], Optional[float]],
+        kind: str = "gauge",
+    ) -> None:
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self._function = function
+
+    @property
+    def value(self) -> Optional[float]:
+        return self._function()
+
+    def render(self) -> str:
+        value = self.value
+        return "" if value is None else f"{self.name} {value}\n"
+
+
+class MetricsRegistry:
+    """Metrics of the process, rendered in the text format of Prometheus.
+
+    Metrics are created on first use: asking twice for the same name returns the same
+    counter or histogram, and replaces a gauge.
+    """
+
+    def __init__(self) -> None:
+        self._metrics: dict[str, Counter | Histogram | Gauge] = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, help: str) -> Counter:
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = Counter(name, help)
+            metric = self._metrics[name]
+        assert isinstance(metric, Counter)
+        return metric
+
+    def histogram(
+        self, name: str, help: str, buckets: tuple[float, ...] = DURATION_BUCKETS
+    ) -> Histogram:
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = Histogram(name, help, buckets)
+            metric = self._metrics[name]
+        assert isinstance(metric, Histogram)
+        return metric
+
+    def gauge(
+        self,
+        name: str,
+        help: str,
+        function: Callable[[], Optional[float]],
+        kind: str = "gauge",
+    ) -> Gauge:
+        gauge = Gauge(name, help, function, kind)
+        with self._lock:
+            self._metrics[name] = gauge
+        return gauge
+
+    def _sorted(self) -> list[Counter | Histogram | Gauge]:
+        with self._lock:
+            return [self._metrics[name] for name in sorted(self._metrics)]
+
+    def render(self) -> str:
+        text = ""
+        for metric in self._sorted():
+            if isinstance(metric, Counter):
+                kind = "counter"
+            elif isinstance(metric, Histogram):
+                kind = "histogram"
+            else:
+                kind = metric.kind
+            text += f"# HELP {metric.name} {metric.help}\n"
+            text += f"# TYPE {metric.name} {kind}\n"
+            text += metric.render()
+        return text
+
+    def summary(self) -> str:
+        """One readable line per metric with a value."""
+        lines = []
+        for metric in self._sorted():
+            if isinstance(metric, Histogram):
+                if metric.count == 0:
+                    continue
+                p95 = metric.quantile(0.95)
+                lines.append(
+                    f"{metric.name}: {metric.count} times, "
+                    + f"mean {metric.sum / metric.count * 1000:.1f} ms, "
+                    + f"p95 < {p95 * 1000:.1f} ms"
+                )
+            elif metric.value is not None:
+                lines.append(f"{metric.name}: {metric.value:g}")
+        return "\n".join(lines)
+
+
+def _resident_memory() -> float:
+    """Resident memory of the process in bytes."""
+    try:
+        with open("/proc/self/statm", "r") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        # The peak is the best estimate available without /proc, in kB on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _cpu_seconds() -> float:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+registry = MetricsRegistry()
+registry.gauge(
+    "process_resident_memory_bytes", "Resident memory size in bytes", _resident_memory
+)
+registry.gauge(
+    "process_cpu_seconds_total",
+    "User and system CPU time spent in seconds",
+    _cpu_seconds,
+    kind="counter",
+)
+registry.gauge(
+    "process_threads", "Number of Python threads", lambda: threading.active_count()
+)
+
+
+class MetricsServer:
+    """Serve the metrics of `registry` at http://`host`:`port`/metrics from a
+    background thread. The host defaults to localhost, the metrics are not exposed to
+    the network."""
+
+    def __init__(
+        self,
+        port: int,
+        host: str = "127.0.0.1",
+        metrics: MetricsRegistry = registry,
+    ) -> None:
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format: str, *args) -> None:
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._t: Optional[threading.Thread] = None
+
+    @property
+    def port(self) -> int:
+        return self._server.server_port
+
+    def start(self) -> None:
+        if self._t is not None:
+            return
+        self._t = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._t.start()
+
+    def stop(self) -> None:
+        if self._t is None:
+            return
+        self._server.shutdown()
+        self._server.server_close()
+        self._t.join()
+        self._t = None
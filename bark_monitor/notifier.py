@@ -0,0 +1,336 @@
+import logging
+import threading
+from collections import Counter, deque
+from time import monotonic, perf_counter
+from typing import Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from bark_monitor import metrics
+from bark_monitor.chats import Chats
+
+_send_time = metrics.registry.histogram(
+    "bark_monitor_telegram_send_seconds", "Time of a request to the Telegram API"
+)
+_delivery_time = metrics.registry.histogram(
+    "bark_monitor_notification_latency_seconds",
+    "Time from queueing a message to sending it to all the chats",
+)
+
+
+class TokenBucket:
+    """Allow `rate` events per second on average, with bursts of up to `capacity`
+    events."""
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self._rate = rate
+        self._capacity = capacity
+        self._tokens = capacity
+        self._updated_at = monotonic()
+
+    def reserve(self) -> float:
+        """Take a token for an event.
+
+        :return: how long to wait in seconds before the event is allowed.
+        """
+        now = monotonic()
+        self._tokens = min(
+            self._capacity, self._tokens + (now - self._updated_at) * self._rate
+        )
+        self._updated_at = now
+        self._tokens -= 1
+        return max(0, -self._tokens / self._rate)
+
+
+def _format_counts(counts: Counter[str]) -> str:
+    return ", ".join(label + " ×" + str(count) for label, count in counts.most_common())
+
+
+class Notifier:
+    """Send text messages to the registered chats from a background thread.
+
+    `send` only queues the message, so that the recorder never waits on the network.
+    Messages are sent by a worker thread through one `requests.Session`, which keeps
+    the connection to the Telegram API open between messages. Each request times out
+    after `timeout_seconds` and is retried `retries` times, waiting `backoff_seconds`
+    and then twice as long after each failure, or as long as Telegram asks when
+    messages are sent too fast.
+
+    When `queue_size` messages are waiting, the oldest one is dropped to make room for
+    the new one.
+
+    Detections reported with `detect` are merged into one message for every
+    `coalesce_seconds` window, such as "Bark ×14, Dog ×3 over 42 s", and into a digest
+    sent every `digest_seconds`---None for no digest. At most
+    `chat_messages_per_minute` messages are sent to a chat and `messages_per_second`
+    messages in total, so that the number of requests does not grow with the number of
+    detections.
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        config_folder: str,
+        queue_size: int = 100,
+        timeout_seconds: float = 10,
+        retries: int = 3,
+        backoff_seconds: float = 1,
+        coalesce_seconds: float = 30,
+        digest_seconds: Optional[float] = 3600,
+        chat_messages_per_minute: float = 20,
+        messages_per_second: float = 30,
+        api_url: str = "https://api.telegram.org",
+    ) -> None:
+        self._url = api_url + "/bot" + api_key + "/sendMessage"
+        self._config_folder = config_folder
+        self._queue_size = queue_size
+        self._timeout_seconds = timeout_seconds
+        self._retries = retries
+        self._backoff_seconds = backoff_seconds
+        self._coalesce_seconds = coalesce_seconds
+        self._digest_seconds = digest_seconds
+
+        self._session = requests.Session()
+        self._session.mount("https://", HTTPAdapter(pool_connections=1))
+        self._session.mount("http://", HTTPAdapter(pool_connections=1))
+
+        self._chat_rate = chat_messages_per_minute / 60
+        self._chat_buckets: dict[int, TokenBucket] = {}
+        self._bucket = TokenBucket(messages_per_second, messages_per_second)
+
+        # Messages, detections and the closing flag are guarded by the condition
+        self._condition = threading.Condition()
+        self._messages: deque[tuple[str, float]] = deque()
+        self._detections: Counter[str] = Counter()
+        self._first_detection: Optional[float] = None
+        self._last_detection: Optional[float] = None
+        self._digest: Counter[str] = Counter()
+        self._digest_start = monotonic()
+        self._closing = threading.Event()
+
+        self._t: Optional[threading.Thread] = None
+        self._bark_logger = logging.getLogger("bark_monitor")
+
+        self._sent = 0
+        self._failed = 0
+        self._dropped = 0
+        self._latencies: deque[float] = deque(maxlen=100)
+
+        metrics.registry.gauge(
+            "bark_monitor_notification_queue_depth",
+            "Messages waiting to be sent",
+            lambda: self.queue_depth,
+        )
+        metrics.registry.gauge(
+            "bark_monitor_notifications_sent_total",
+            "Messages sent to a chat",
+            lambda: self.sent,
+            kind="counter",
+        )
+        metrics.registry.gauge(
+            "bark_monitor_notifications_failed_total",
+            "Messages not sent to a chat after all retries",
+            lambda: self.failed,
+            kind="counter",
+        )
+        metrics.registry.gauge(
+            "bark_monitor_notifications_dropped_total",
+            "Messages dropped because the queue was full",
+            lambda: self.dropped,
+            kind="counter",
+        )
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of messages waiting to be sent."""
+        return len(self._messages)
+
+    @property
+    def sent(self) -> int:
+        return self._sent
+
+    @property
+    def failed(self) -> int:
+        """Number of messages that could not be sent to a chat after all retries."""
+        return self._failed
+
+    @property
+    def dropped(self) -> int:
+        """Number of messages dropped because the queue was full."""
+        return self._dropped
+
+    @property
+    def latency(self) -> Optional[float]:
+        """Mean time in seconds from `send` to the delivery of the last messages."""
+        if len(self._latencies) == 0:
+            return None
+        return sum(self._latencies) / len(self._latencies)
+
+    def start(self) -> None:
+        if self._t is not None:
+            return
+        self._closing.clear()
+        self._t = threading.Thread(target=self._run, daemon=True)
+        self._t.start()
+
+    def stop(self, timeout_seconds: Optional[float] = None) -> None:
+        """Send the queued messages and detections, without retrying, and stop the
+        worker."""
+        if self._t is None:
+            return
+        with self._condition:
+            self._closing.set()
+            self._condition.notify()
+        self._t.join(timeout_seconds)
+        self._t = None
+
+    def send(self, text: str) -> None:
+        """Queue `text` to be sent to every registered chat."""
+        with self._condition:
+            if len(self._messages) >= self._queue_size:
+                dropped, _ = self._messages.popleft()
+                self._dropped += 1
+                self._bark_logger.warning("Dropping message: " + dropped)
+            self._messages.append((text, perf_counter()))
+            self._condition.notify()
+
+    def detect(self, label: str) -> None:
+        """Report a detection of `label`, sent with the others of the same window."""
+        with self._condition:
+            now = monotonic()
+            if self._first_detection is None:
+                self._first_detection = now
+                self._condition.notify()
+            self._last_detection = now
+            self._detections[label] += 1
+            self._digest[label] += 1
+
+    def _coalesced(self, now: float) -> Optional[str]:
+        """The message of the detections if their window is over, or if closing."""
+        if self._first_detection is None or (
+            now < self._first_detection + self._coalesce_seconds
+            and not self._closing.is_set()
+        ):
+            return None
+        assert self._last_detection is not None
+        if sum(self._detections.values()) == 1:
+            text = "detected: " + next(iter(self._detections))
+        else:
+            text = (
+                _format_counts(self._detections)
+                + f" over {self._last_detection - self._first_detection:.0f} s"
+            )
+        self._detections.clear()
+        self._first_detection = None
+        return text
+
+    def _digested(self, now: float) -> Optional[str]:
+        """The digest of the detections if it is time to send it."""
+        if self._digest_seconds is None or now < self._digest_start + (
+            self._digest_seconds
+        ):
+            return None
+        text = None
+        if len(self._digest) > 0:
+            text = (
+                f"Detections of the last {self._digest_seconds / 60:.0f} min: "
+                + _format_counts(self._digest)
+            )
+        self._digest.clear()
+        self._digest_start = now
+        return text
+
+    def _timeout(self, now: float) -> Optional[float]:
+        """Time until a coalesced message or a digest is due."""
+        deadlines = []
+        if self._first_detection is not None:
+            deadlines.append(self._first_detection + self._coalesce_seconds)
+        if self._digest_seconds is not None:
+            deadlines.append(self._digest_start + self._digest_seconds)
+        if len(deadlines) == 0:
+            return None
+        return max(0, min(deadlines) - now)
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                messages: list[tuple[str, float]] = []
+                while True:
+                    now = monotonic()
+                    for text in (self._coalesced(now), self._digested(now)):
+                        if text is not None:
+                            messages.append((text, perf_counter()))
+                    messages.extend(self._messages)
+                    self._messages.clear()
+                    if len(messages) > 0 or self._closing.is_set():
+                        break
+                    self._condition.wait(self._timeout(now))
+                closing = self._closing.is_set()
+
+            for text, queued_at in messages:
+                try:
+                    self._deliver(text)
+                except Exception as e:
+                    self._bark_logger.error("Error while sending a message: " + str(e))
+                self._latencies.append(perf_counter() - queued_at)
+                _delivery_time.observe(self._latencies[-1])
+            if closing:
+                return
+
+    def _deliver(self, text: str) -> None:
+        for chat in Chats.read(self._config_folder).chats:
+            if self._post(chat, text):
+                self._sent += 1
+            else:
+                self._failed += 1
+
+    def _wait_for_rate_limits(self, chat: int) -> None:
+        if chat not in self._chat_buckets:
+            # A short burst is allowed, such as the messages of a clip following a
+            # detection
+            self._chat_buckets[chat] = TokenBucket(self._chat_rate, 3)
+        wait = max(self._chat_buckets[chat].reserve(), self._bucket.reserve())
+        if wait > 0:
+            self._bark_logger.debug(f"Rate limited, waiting {wait:.1f} s")
+            self._closing.wait(wait)
+
+    def _post(self, chat: int, text: str) -> bool:
+        """Send `text` to `chat`, retrying on errors.
+
+        :return: True if the message was sent.
+        """
+        delay = self._backoff_seconds
+        for attempt in range(self._retries + 1):
+            self._wait_for_rate_limits(chat)
+            wait = delay
+            try:
+                with _send_time.time():
+                    response = self._session.post(
+                        self._url,
+                        json={"chat_id": chat, "text": text},
+                        timeout=self._timeout_seconds,
+                    )
+                if response.ok:
+                    return True
+                if response.status_code == 429:
+                    # Telegram tells how long to wait when messages are sent too fast
+                    wait = (
+                        response.json().get("parameters", {}).get("retry_after", delay)
+                    )
+                elif response.status_code < 500:
+                    self._bark_logger.error(
+                        "Message to " + str(chat) + " rejected: " + response.text
+                    )
+                    return False
+                error = "HTTP " + str(response.status_code)
+            except requests.RequestException as e:
+                error = str(e)
+
+            self._bark_logger.warning(
+                "Failed to send message to " + str(chat) + ": " + error
+            )
+            if attempt == self._retries or self._closing.wait(wait):
+                break
+            delay *= 2
+        return False
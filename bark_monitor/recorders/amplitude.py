@@ -0,0 +1,176 @@
+from typing import Optional
+
+import numpy as np
+
+
+def rms(samples: np.ndarray) -> float:
+    """Root mean square of `samples`, computed without temporary arrays for floats."""
+    if len(samples) == 0:
+        return 0
+    if samples.dtype.kind != "f":
+        samples = samples.astype(np.float32)
+    return float(np.sqrt(np.dot(samples, samples) / len(samples)))
+
+
+def signal_to_intensity(signal: bytes, frames: int = 8) -> int:
+    """Intensity of a chunk of int16 samples, the median of the RMS of `frames` frames
+    of the chunk.
+
+    A click of a few samples only raises the RMS of one frame and leaves the
+    intensity unchanged, while a bark lasts over most of a chunk.
+    """
+    samples = np.frombuffer(signal, dtype=np.int16)
+    if len(samples) < frames:
+        return round(rms(samples))
+    frame_size = len(samples) // frames
+    blocks = samples[: frames * frame_size].astype(np.float32).reshape(frames, -1)
+    levels = np.sqrt(np.einsum("ij,ij->i", blocks, blocks) / frame_size)
+    return round(float(np.median(levels)))
+
+
+class NoiseFloor:
+    """Track the background level of a signal.
+
+    The level is an exponential moving average that follows quieter values quickly,
+    with weight `fall`, and louder values slowly, with weight `rise`. Short loud
+    events barely move it while a lasting change of background is followed.
+    """
+
+    def __init__(self, rise: float = 0.01, fall: float = 0.3) -> None:
+        self._rise = rise
+        self._fall = fall
+        self._level: Optional[float] = None
+
+    @property
+    def level(self) -> Optional[float]:
+        return self._level
+
+    def update(self, value: float) -> float:
+        if self._level is None:
+            self._level = value
+        else:
+            weight = self._rise if value > self._level else self._fall
+            self._level += weight * (value - self._level)
+        return self._level
+
+
+class EnergyGate:
+    """Cheap test deciding if a window is loud enough to run a neural network on it.
+
+    A window passes if its RMS is `margin_db` above the noise floor. The gate then stays
+    open for `hangover` more windows so that the end of an event is still analysed.
+    Windows of digital silence never pass.
+    """
+
+    def __init__(self, margin_db: float = 6, hangover: int = 2) -> None:
+        self._ratio = 10 ** (margin_db / 20)
+        self._hangover = hangover
+        self._noise_floor = NoiseFloor()
+
+        self._open_for = 0
+        self._windows = 0
+        self._skipped = 0
+        self._silent = 0
+
+    @property
+    def noise_floor(self) -> Optional[float]:
+        return self._noise_floor.level
+
+    @property
+    def skipped(self) -> int:
+        return self._skipped
+
+    @property
+    def silent(self) -> int:
+        """Number of windows of digital silence."""
+        return self._silent
+
+    @property
+    def skip_rate(self) -> float:
+        """Ratio of the windows that did not pass the gate."""
+        if self._windows == 0:
+            return 0
+        return self._skipped / self._windows
+
+    def is_open(self, waveform: np.ndarray) -> bool:
+        self._windows += 1
+        if not waveform.any():
+            self._silent += 1
+            self._skipped += 1
+            return False
+
+        level = rms(waveform)
+        floor = self._noise_floor.level
+        self._noise_floor.update(level)
+        if floor is None or level > floor * self._ratio:
+            self._open_for = self._hangover
+            return True
+        if self._open_for > 0:
+            self._open_for -= 1
+            return True
+
+        self._skipped += 1
+        return False
+
+
+class AmplitudeDetector:
+    """Detect loud events from the intensity of chunks of audio, as computed by
+    `signal_to_intensity` from the RMS of the chunks.
+
+    The noise floor of the intensities is tracked continuously, so detection starts
+    with the first chunk and the thresholds follow slow changes of the background, such
+    as day and night, without restarting. An event starts when an intensity is
+    `on_ratio` times the noise floor and lasts until an intensity falls under
+    `off_ratio` times the noise floor. The noise floor is never considered lower than
+    `minimum_level`.
+    """
+
+    def __init__(
+        self,
+        on_ratio: float = 2,
+        off_ratio: float = 1.5,
+        minimum_level: int = 50,
+    ) -> None:
+        if off_ratio > on_ratio:
+            raise ValueError("The off ratio must not be larger than the on ratio")
+        self._on_ratio = on_ratio
+        self._off_ratio = off_ratio
+        self._minimum_level = minimum_level
+        # The floor must not rise quickly during a long event
+        self._noise_floor = NoiseFloor(rise=0.001, fall=0.1)
+        self._active = False
+
+    @property
+    def _floor(self) -> Optional[float]:
+        if self._noise_floor.level is None:
+            return None
+        return max(self._noise_floor.level, self._minimum_level)
+
+    @property
+    def on_threshold(self) -> Optional[int]:
+        if self._floor is None:
+            return None
+        return int(self._on_ratio * self._floor)
+
+    @property
+    def off_threshold(self) -> Optional[int]:
+        if self._floor is None:
+            return None
+        return int(self._off_ratio * self._floor)
+
+    @property
+    def active(self) -> bool:
+        return self._active
+
+    def update(self, intensity: int) -> bool:
+        """Update the detector with the `intensity` of the next chunk.
+
+        :return: True if the chunk is part of an event.
+        """
+        if self._active:
+            threshold = self.off_threshold
+        else:
+            threshold = self.on_threshold
+        self._active = threshold is not None and intensity >= threshold
+        self._noise_floor.update(intensity)
+        return self._active
@@ -1,17 +1,44 @@
 import logging
 import threading
-import wave
 from abc import ABC, abstractmethod
 from datetime import datetime
+from enum import Enum
 from pathlib import Path
+from time import perf_counter
 from typing import Optional
 
+import numpy as np
 import pyaudio
 
+from bark_monitor import metrics
 from bark_monitor.google_sync import GoogleSync
-from bark_monitor.recorders.recording import Recording
+from bark_monitor.recorders.chunk_queue import BackpressurePolicy, ChunkQueue
+from bark_monitor.recorders.clip_catalog import ClipCatalog
+from bark_monitor.recorders.clip_writer import AudioCodec, ClipWriter
+from bark_monitor.recorders.recording import (
+    Recording,
+    RecordingRetention,
+    RecordingSync,
+)
+from bark_monitor.recorders.ring_buffer import RingBuffer
+from bark_monitor.tracing import tracer
 from bark_monitor.very_bark_bot import VeryBarkBot
 
+_read_wait_time = metrics.registry.histogram(
+    "bark_monitor_read_wait_seconds", "Time the record loop waits for captured audio"
+)
+_clip_write_time = metrics.registry.histogram(
+    "bark_monitor_clip_write_seconds", "Time to append captured audio to a clip"
+)
+
+
+class RecorderState(Enum):
+    idle = "not recording"
+    calibrating = "calibrating"
+    running = "recording"
+    paused = "paused"
+    stopping = "stopping"
+
 
 class BaseRecorder(ABC):
     _chat_bot: VeryBarkBot
@@ -21,16 +48,70 @@ class BaseRecorder(ABC):
         output_folder: str,
         framerate: int = 44100,
         chunk: int = 4096,
+        pre_roll_seconds: float = 2,
+        lookback_seconds: float = 30,
+        fsync_seconds: float = 5,
+        codec: AudioCodec = AudioCodec.wav,
+        queue_size: int = 32,
+        backpressure: BackpressurePolicy = BackpressurePolicy.drop_oldest,
+        suspend_stream_on_pause: bool = True,
+        sync_interval_seconds: Optional[float] = 600,
+        database: bool = False,
+        retention_days: Optional[float] = None,
+        metrics_port: Optional[int] = None,
+        tracing: bool = False,
+        trace_memory: bool = False,
     ) -> None:
-        self.running = False
-        self.is_paused = False
+        """The last `lookback_seconds` of captured audio, plus `pre_roll_seconds`, are
+        kept in a ring buffer so that a clip can start before the detection and
+        include the start of the bark. Clips are then written to disk as they are
+        recorded, encoded with `codec`, and synced every `fsync_seconds`.
+
+        Audio is captured by the PortAudio callback into a queue of `queue_size`
+        chunks consumed by `_record_loop`. `backpressure` decides what happens to
+        captured audio when the analysis is too slow to keep up.
+
+        If `suspend_stream_on_pause` is True, the audio stream is stopped while the
+        recorder is paused.
+
+        While recording, the recording state is merged with Google Drive every
+        `sync_interval_seconds`---defaults to 10 minutes, None to only merge when the
+        recorder starts and stops. If `database` is True, the recording state is stored
+        in a SQLite database, into which the existing state is imported. If
+        `retention_days` is given, activities older than `retention_days` are rolled
+        up into hourly counts by a background task, which deletes the individual
+        activities---defaults to None, all of them are kept. It is enabled with
+        "activity retention days" in config.json.
+
+        If `metrics_port` is given, the metrics of the pipeline are served in the
+        Prometheus format at http://localhost:`metrics_port`/metrics while the bot
+        runs. If `tracing` is True, the time of each stage of the record loop is
+        traced, and the allocations too if `trace_memory` is True.
+        """
+        self._state = RecorderState.idle
+        self._state_changed = threading.Condition()
+        # True once unpaused, until the record loop resumes
+        self._resumed = False
+        self._suspend_stream_on_pause = suspend_stream_on_pause
 
         self._chunk = chunk  # Record in chunks of 1024 samples
         self._sample_format = pyaudio.paInt16  # 16 bits per sample
         self._channels = 1
         self._fs = framerate
 
-        self._frames = []  # Initialize array to store frames
+        self._pre_roll = int(pre_roll_seconds * self._fs)
+        self._buffer = RingBuffer(int(lookback_seconds * self._fs) + self._pre_roll)
+        self._fsync_seconds = fsync_seconds
+        codec.check(self._fs)
+        self._codec = codec
+        self._clip: Optional[ClipWriter] = None
+
+        self._queue = ChunkQueue(
+            queue_size,
+            backpressure,
+            frame_size=pyaudio.get_sample_size(self._sample_format) * self._channels,
+        )
+        self._input_overflows = 0
 
         self._t: Optional[threading.Thread] = None
 
@@ -40,17 +121,65 @@ class BaseRecorder(ABC):
         self._bark_logger = logging.getLogger("bark_monitor")
 
         self.output_folder = output_folder
+        Path(output_folder).mkdir(parents=True, exist_ok=True)
+        self._catalog = ClipCatalog(
+            Path(output_folder, "clips.jsonl"), self.audio_folder
+        )
+        if database:
+            Recording.use_database(output_folder)
+        self._sync = (
+            RecordingSync(output_folder, sync_interval_seconds)
+            if sync_interval_seconds is not None
+            else None
+        )
+        self._retention = (
+            RecordingRetention(output_folder, retention_days)
+            if retention_days is not None
+            else None
+        )
+
+        if tracing:
+            tracer.enable(memory=trace_memory)
+        self._metrics_server = (
+            metrics.MetricsServer(metrics_port) if metrics_port is not None else None
+        )
+        metrics.registry.gauge(
+            "bark_monitor_dropped_frames_total",
+            "Captured frames dropped because the analysis was too slow",
+            lambda: self.dropped_frames,
+            kind="counter",
+        )
+        metrics.registry.gauge(
+            "bark_monitor_input_overflows_total",
+            "Times PortAudio lost input before the callback",
+            lambda: self.input_overflows,
+            kind="counter",
+        )
+        metrics.registry.gauge(
+            "bark_monitor_queue_depth",
+            "Captured chunks waiting for the analysis",
+            lambda: len(self._queue),
+        )
 
         self._bark_logger.info("Starting bot")
 
     def start_bot(self, bot: VeryBarkBot) -> None:
         self._chat_bot = bot
+        if self._metrics_server is not None:
+            self._metrics_server.start()
         self._chat_bot.start(self)
+        if self._metrics_server is not None:
+            self._metrics_server.stop()
 
     @property
     def audio_folder(self) -> Path:
         return Path(self.output_folder, "audio")
 
+    @property
+    def catalog(self) -> ClipCatalog:
+        """Index of the clips saved in `audio_folder`."""
+        return self._catalog
+
     @property
     def today_audio_folder(self) -> Path:
         return Path(
@@ -63,46 +192,184 @@ class BaseRecorder(ABC):
         now = datetime.now().strftime("%d-%m-%Y_%H-%M-%S")
         filename = Path(
             self.today_audio_folder,
-            now + ".wav",
+            now + self._codec.suffix,
         )
         if not filename.parent.exists():
             filename.parent.mkdir(parents=True)
         return filename.absolute()
 
+    @property
+    def state(self) -> RecorderState:
+        return self._state
+
+    @property
+    def running(self) -> bool:
+        """True from the start of the recording until it is asked to stop."""
+        return self._state in [
+            RecorderState.calibrating,
+            RecorderState.running,
+            RecorderState.paused,
+        ]
+
+    @property
+    def is_paused(self) -> bool:
+        return self._state == RecorderState.paused
+
+    def _set_state(self, state: RecorderState) -> None:
+        with self._state_changed:
+            self._bark_logger.debug(
+                "Recorder state " + self._state.name + " -> " + state.name
+            )
+            self._state = state
+            self._state_changed.notify_all()
+
+    def _transition(self, expected: RecorderState, state: RecorderState) -> bool:
+        """Change the state to `state` only if it is `expected`.
+
+        :return: True if the state changed.
+        """
+        with self._state_changed:
+            if self._state != expected:
+                return False
+            self._set_state(state)
+            return True
+
+    def _wait_while_paused(self) -> bool:
+        """Block, without using the CPU, while the recorder is paused. Calls
+        `_resume` if the recorder was unpaused since the last call.
+
+        :return: False if the recorder must stop.
+        """
+        with self._state_changed:
+            self._state_changed.wait_for(lambda: self._state != RecorderState.paused)
+            running = self.running
+            resumed = self._resumed
+            self._resumed = False
+        if resumed and running:
+            self._resume()
+        return running
+
+    def _resume(self) -> None:
+        """Called by the record loop when it resumes after a pause, before it reads
+        the audio captured since."""
+        pass
+
+    def pause(self) -> None:
+        with self._state_changed:
+            if self._state not in [RecorderState.calibrating, RecorderState.running]:
+                return
+            self._set_state(RecorderState.paused)
+            if self._suspend_stream_on_pause and self._stream is not None:
+                self._stream.stop_stream()
+        # Wake up the record loop waiting for audio so that it starts waiting for the
+        # recorder to be unpaused
+        self._queue.wake()
+
+    def unpause(self) -> None:
+        with self._state_changed:
+            if self._state != RecorderState.paused:
+                return
+            # Audio captured before the pause is not relevant anymore
+            self._queue.clear()
+            self._resumed = True
+            if self._suspend_stream_on_pause and self._stream is not None:
+                self._stream.start_stream()
+            self._set_state(RecorderState.running)
+
     def _init(self):
+        if self.audio_folder.exists():
+            # Clips that were being written when the program stopped unexpectedly
+            for path in ClipWriter.recover(self.audio_folder):
+                self._catalog.add(path)
         recording = Recording.read(self.output_folder)
         recording.start = datetime.now()
-        self.running = True
+        self._resumed = False
+        if self._sync is not None:
+            self._sync.start()
+        if self._retention is not None:
+            self._retention.start()
+        self._set_state(RecorderState.running)
 
     def record(self) -> None:
         self._init()
         self._record()
 
     def stop(self) -> None:
-        self.running = False
+        self._set_state(RecorderState.stopping)
+        self._queue.wake()
+        if self._sync is not None:
+            self._sync.stop()
+        if self._retention is not None:
+            self._retention.stop()
+        # The last clip must be complete before the audio is uploaded
+        self._stop()
         recording = Recording.read(self.output_folder)
         recording.end(datetime.now())
 
         # Sync with google
         recording.save_to_google()
         GoogleSync.save_audio(str(self.audio_folder))
-
-        self._stop()
+        self._set_state(RecorderState.idle)
 
     def _stop(self) -> None:
-        if self._t is None:
+        """Wait for the record loop to finish and close the current clip."""
+        if self._t is not None:
+            self._t.join()
+        if self._is_clipping:
+            self._end_clip()
+
+    def _capture(self, data: bytes) -> np.ndarray:
+        """Store `data` read from the stream in the ring buffer and in the current
+        clip.
+
+        :return: the samples in `data`.
+        """
+        with tracer.span("capture"):
+            samples = np.frombuffer(data, dtype=np.int16)
+            self._buffer.write(samples)
+            if self._clip is not None:
+                with _clip_write_time.time():
+                    self._clip.write(samples)
+        return samples
+
+    @property
+    def _is_clipping(self) -> bool:
+        return self._clip is not None
+
+    def _start_clip(self, n_samples: int) -> None:
+        """Start a clip with the last `n_samples` captured and the pre-roll before
+        them. The following captured samples are appended to the clip until
+        `_end_clip` is called.
+
+        Does nothing if a clip is already started.
+        """
+        if self._clip is not None:
             return
-        self._t.join()
+        self._clip = ClipWriter(
+            self._filename,
+            self._fs,
+            self._channels,
+            pyaudio.get_sample_size(self._sample_format),
+            self._fsync_seconds,
+            self._codec,
+        )
+        self._clip.write(
+            self._buffer.latest(min(n_samples + self._pre_roll, len(self._buffer)))
+        )
 
-    def _save_recording(self, frames: list[bytes], prefix: str | None = None) -> Path:
-        """Save a recording of `frames` to `self._filename`.
+    def _end_clip(self, prefix: str | None = None) -> Path:
+        """Finish the current clip, its file name starts with `prefix` if given.
 
-        :return: the path at which the recording is saved.
+        :return: the path at which the clip is saved.
         """
-        filepath = self._filename
+        assert self._clip is not None
+        filepath = self._clip.path
         if prefix is not None:
-            filepath = Path(self.today_audio_folder, prefix + " " + self._filename.name)
-        file = self._save_recording_to(frames, filepath)
+            filepath = filepath.with_name(prefix + " " + filepath.name)
+        duration = self._clip.duration
+        filepath = self._clip.close(filepath)
+        self._clip = None
+        self._catalog.add(filepath, duration)
         self._chat_bot.send_text(
             "Save file: "
             + str(filepath)
@@ -110,21 +377,6 @@ class BaseRecorder(ABC):
             + filepath.name
             + "\n```"
         )
-        return file
-
-    def _save_recording_to(self, frames: list[bytes], filepath: Path) -> Path:
-        """Save a recording of `frames` to `filepath`.
-
-        :return: the path at which the recording is saved.
-        """
-        # Save the recorded data as a WAV file
-        assert self._pyaudio_interface is not None
-        wf = wave.open(str(filepath), "wb")
-        wf.setnchannels(self._channels)
-        wf.setsampwidth(self._pyaudio_interface.get_sample_size(self._sample_format))
-        wf.setframerate(self._fs)
-        wf.writeframes(b"".join(frames))
-        wf.close()
         return filepath
 
     def _start_stream(self) -> None:
@@ -135,8 +387,43 @@ class BaseRecorder(ABC):
             rate=self._fs,
             frames_per_buffer=self._chunk,
             input=True,
+            stream_callback=self._on_audio,
         )
 
+    def _on_audio(
+        self, in_data: bytes, frame_count: int, time_info: dict, status_flags: int
+    ) -> tuple[None, int]:
+        """PortAudio callback, runs on the PortAudio thread and must not block."""
+        if status_flags & pyaudio.paInputOverflow:
+            self._input_overflows += 1
+        self._queue.put(in_data)
+        return None, pyaudio.paContinue
+
+    def _read(self, timeout: float = 0.5) -> Optional[bytes]:
+        """Wait for the next captured chunk.
+
+        :return: the chunk or None if nothing was captured during `timeout` seconds.
+        """
+        start = perf_counter()
+        with tracer.span("read"):
+            data = self._queue.get(timeout)
+        if data is not None:
+            _read_wait_time.observe(perf_counter() - start)
+        return data
+
+    @property
+    def dropped_frames(self) -> int:
+        """Number of captured frames dropped because the analysis was too slow."""
+        return self._queue.dropped_frames
+
+    @property
+    def input_overflows(self) -> int:
+        """Number of times PortAudio reported losing input before the callback.
+
+        PortAudio does not tell how many frames were lost in that case.
+        """
+        return self._input_overflows
+
     def _stop_stream(self) -> None:
         if self._stream is not None:
             # Stop and close the stream
@@ -147,6 +434,16 @@ class BaseRecorder(ABC):
             # Terminate the PortAudio interface
             self._pyaudio_interface.terminate()
 
+        if self._queue.dropped_frames > 0 or self._input_overflows > 0:
+            self._bark_logger.warning(
+                "Lost audio: "
+                + str(self._queue.dropped_frames)
+                + " frames dropped, "
+                + str(self._input_overflows)
+                + " input overflows"
+            )
+        self._queue.clear()
+
     def _record(self) -> None:
         self._t = threading.Thread(target=self._record_loop)
         self._t.start()
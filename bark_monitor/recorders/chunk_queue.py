@@ -0,0 +1,121 @@
+import threading
+from collections import deque
+from enum import Enum
+from typing import Optional
+
+
+class BackpressurePolicy(Enum):
+    drop_oldest = "Drop the oldest queued chunk to make room for the new one"
+    skip = "Drop the new chunk, skipping that part of the audio"
+    coalesce = "Append the new chunk to the last queued one so that no audio is lost"
+
+    @staticmethod
+    def from_name(name: str) -> "BackpressurePolicy":
+        try:
+            return BackpressurePolicy[name]
+        except KeyError:
+            raise ValueError(
+                "Unknown backpressure policy "
+                + name
+                + ", use one of "
+                + ", ".join(policy.name for policy in BackpressurePolicy)
+            )
+
+
+class ChunkQueue:
+    """Bounded queue of audio chunks between the capture and the analysis threads.
+
+    `put` never blocks so that it can be called from the audio callback. When the queue
+    holds `maxsize` chunks, `policy` decides what happens to the new chunk. With
+    `BackpressurePolicy.coalesce`, a queued chunk grows up to `coalesce_limit` times the
+    size of the incoming chunks before falling back to dropping the oldest chunk.
+
+    Every dropped byte is accounted for in `dropped_frames`, `frame_size` being the
+    number of bytes of one frame.
+    """
+
+    def __init__(
+        self,
+        maxsize: int,
+        policy: BackpressurePolicy = BackpressurePolicy.drop_oldest,
+        frame_size: int = 2,
+        coalesce_limit: int = 4,
+    ) -> None:
+        if maxsize <= 0:
+            raise ValueError("The size of the queue must be positive")
+        self._maxsize = maxsize
+        self._policy = policy
+        self._frame_size = frame_size
+        self._coalesce_limit = coalesce_limit
+
+        self._chunks: deque[bytes] = deque()
+        self._condition = threading.Condition()
+        self._woken = False
+
+        self._dropped_chunks = 0
+        self._dropped_bytes = 0
+        self._coalesced_chunks = 0
+
+    @property
+    def policy(self) -> BackpressurePolicy:
+        return self._policy
+
+    @property
+    def dropped_chunks(self) -> int:
+        return self._dropped_chunks
+
+    @property
+    def dropped_frames(self) -> int:
+        return self._dropped_bytes // self._frame_size
+
+    @property
+    def coalesced_chunks(self) -> int:
+        return self._coalesced_chunks
+
+    def __len__(self) -> int:
+        return len(self._chunks)
+
+    def _drop(self, chunk: bytes) -> None:
+        self._dropped_chunks += 1
+        self._dropped_bytes += len(chunk)
+
+    def put(self, chunk: bytes) -> None:
+        with self._condition:
+            if len(self._chunks) >= self._maxsize:
+                if self._policy == BackpressurePolicy.skip:
+                    self._drop(chunk)
+                    return
+                if self._policy == BackpressurePolicy.coalesce and len(
+                    self._chunks[-1]
+                ) < self._coalesce_limit * len(chunk):
+                    self._chunks[-1] += chunk
+                    self._coalesced_chunks += 1
+                    self._condition.notify()
+                    return
+                self._drop(self._chunks.popleft())
+            self._chunks.append(chunk)
+            self._condition.notify()
+
+    def get(self, timeout: Optional[float] = None) -> Optional[bytes]:
+        """Pop the oldest chunk, waiting at most `timeout` seconds for one.
+
+        :return: the chunk or None if the queue stayed empty or `wake` was called.
+        """
+        with self._condition:
+            self._condition.wait_for(
+                lambda: len(self._chunks) > 0 or self._woken, timeout
+            )
+            self._woken = False
+            if len(self._chunks) == 0:
+                return None
+            return self._chunks.popleft()
+
+    def wake(self) -> None:
+        """Make a thread waiting in `get` return immediately."""
+        with self._condition:
+            self._woken = True
+            self._condition.notify_all()
+
+    def clear(self) -> None:
+        with self._condition:
+            self._chunks.clear()
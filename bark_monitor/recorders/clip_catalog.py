@@ -0,0 +1,173 @@
+import bisect
+import json
+import logging
+import threading
+import wave
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import NamedTuple, Optional
+
+from bark_monitor.recorders.clip_writer import AudioCodec, ClipWriter, codec_of
+
+try:
+    import soundfile
+except ImportError:  # pragma: no cover - only needed for compressed clips
+    soundfile = None
+
+
+class Clip(NamedTuple):
+    """A clip saved by the recorder, `path` being relative to the audio folder."""
+
+    path: Path
+    start: datetime
+    duration: float
+    label: str
+    size: int
+
+    @property
+    def name(self) -> str:
+        return self.path.name
+
+
+def _clip_duration(path: Path) -> float:
+    """Duration in seconds of the clip at `path`, read from its header."""
+    if codec_of(path) == AudioCodec.wav:
+        with wave.open(str(path), "rb") as wf:
+            return wf.getnframes() / wf.getframerate()
+    if soundfile is None:
+        return 0
+    return soundfile.info(str(path)).duration
+
+
+class ClipCatalog:
+    """Index of the clips in `audio_folder`, saved in `path` as one JSON object per
+    line.
+
+    Clips are added as the recorder saves them, in time order, so that the last clip
+    and the clips of a day or of a time range are found without listing the folder.
+    If `path` does not exist, the catalog is built from the clips in `audio_folder`.
+    """
+
+    def __init__(self, path: Path, audio_folder: Path) -> None:
+        self._path = path
+        self._audio_folder = audio_folder
+        self._lock = threading.Lock()
+        self._clips: list[Clip] = []
+        # Start times of `_clips`, to search them
+        self._starts: list[datetime] = []
+        if path.exists():
+            self._load()
+        else:
+            self.rebuild()
+
+    def __len__(self) -> int:
+        return len(self._clips)
+
+    def _load(self) -> None:
+        with open(self._path, "r") as file:
+            for line in file:
+                try:
+                    data = json.loads(line)
+                except json.JSONDecodeError:
+                    logging.getLogger("bark_monitor").warning(
+                        "Ignoring a truncated clip in " + str(self._path)
+                    )
+                    continue
+                self._insert(
+                    Clip(
+                        Path(data["path"]),
+                        datetime.fromisoformat(data["start"]),
+                        data["duration"],
+                        data["label"],
+                        data["size"],
+                    )
+                )
+
+    def rebuild(self) -> None:
+        """Index again all the clips in the audio folder."""
+        clips = []
+        if self._audio_folder.exists():
+            for path in self._audio_folder.rglob("*"):
+                if path.is_dir() or path.suffix == ClipWriter.part_suffix:
+                    continue
+                try:
+                    clips.append(self._clip_of_file(path))
+                except (ValueError, EOFError, RuntimeError, wave.Error) as e:
+                    logging.getLogger("bark_monitor").warning(
+                        "Not indexing " + str(path) + ": " + str(e)
+                    )
+        with self._lock:
+            self._clips = []
+            self._starts = []
+            for clip in sorted(clips, key=lambda clip: clip.start):
+                self._insert(clip)
+            with open(self._path, "w") as file:
+                for clip in self._clips:
+                    file.write(self._encode(clip) + "\n")
+
+    def _clip_of_file(self, path: Path, duration: Optional[float] = None) -> Clip:
+        """Clip saved at `path`, its start and label are read from the file name and
+        its duration from the file if not given.
+
+        Raises a ValueError if `path` is not a clip.
+        """
+        label, _, start = path.stem.rpartition(" ")
+        if duration is None:
+            duration = _clip_duration(path)
+        return Clip(
+            path.absolute().relative_to(self._audio_folder.absolute()),
+            datetime.strptime(start, "%d-%m-%Y_%H-%M-%S"),
+            duration,
+            label,
+            path.stat().st_size,
+        )
+
+    @staticmethod
+    def _encode(clip: Clip) -> str:
+        return json.dumps(
+            {
+                "path": str(clip.path),
+                "start": clip.start.isoformat(),
+                "duration": clip.duration,
+                "label": clip.label,
+                "size": clip.size,
+            }
+        )
+
+    def _insert(self, clip: Clip) -> None:
+        index = bisect.bisect_right(self._starts, clip.start)
+        self._starts.insert(index, clip.start)
+        self._clips.insert(index, clip)
+
+    def add(self, path: Path, duration: Optional[float] = None) -> Clip:
+        """Index the clip saved by the recorder at `path`, lasting `duration` seconds.
+        The duration is read from the file if not given.
+
+        :return: the indexed clip.
+        """
+        clip = self._clip_of_file(path, duration)
+        with self._lock:
+            self._insert(clip)
+            with open(self._path, "a") as file:
+                file.write(self._encode(clip) + "\n")
+        return clip
+
+    def path(self, clip: Clip) -> Path:
+        """Absolute path of `clip`."""
+        return Path(self._audio_folder, clip.path)
+
+    def last(self) -> Optional[Clip]:
+        """The clip that started last."""
+        with self._lock:
+            return self._clips[-1] if len(self._clips) > 0 else None
+
+    def between(self, start: datetime, end: datetime) -> list[Clip]:
+        """Clips started in [`start`, `end`), in time order."""
+        with self._lock:
+            first = bisect.bisect_left(self._starts, start)
+            last = bisect.bisect_left(self._starts, end)
+            return self._clips[first:last]
+
+    def of_day(self, day: date) -> list[Clip]:
+        start = datetime.combine(day, datetime.min.time())
+        return self.between(start, start + timedelta(days=1))
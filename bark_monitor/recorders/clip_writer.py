@@ -0,0 +1,282 @@
+import logging
+import os
+import struct
+import wave
+from enum import Enum
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+try:
+    import soundfile
+except ImportError:  # pragma: no cover - only needed for compressed clips
+    soundfile = None
+
+
+class AudioCodec(Enum):
+    wav = "Uncompressed 16 bits PCM"
+    flac = "Lossless compression, about half the size of wav"
+    opus = "Lossy compression for voice, about a tenth of the size of wav"
+
+    @staticmethod
+    def from_name(name: str) -> "AudioCodec":
+        try:
+            return AudioCodec[name]
+        except KeyError:
+            raise ValueError(
+                "Unknown audio codec "
+                + name
+                + ", use one of "
+                + ", ".join(codec.name for codec in AudioCodec)
+            )
+
+    @property
+    def suffix(self) -> str:
+        return _SUFFIXES[self]
+
+    def check(self, framerate: int) -> None:
+        """Raise a ValueError if clips at `framerate` cannot be saved with this
+        codec."""
+        if self == AudioCodec.wav:
+            return
+        if soundfile is None:
+            raise ValueError(
+                "Saving clips as " + self.name + " requires the soundfile package"
+            )
+        if self == AudioCodec.opus and framerate not in _OPUS_RATES:
+            raise ValueError(
+                "Opus only supports the sample rates "
+                + ", ".join(str(rate) for rate in _OPUS_RATES)
+            )
+
+
+_SUFFIXES = {AudioCodec.wav: ".wav", AudioCodec.flac: ".flac", AudioCodec.opus: ".ogg"}
+# Format and subtype of the compressed codecs in soundfile
+_SOUNDFILE_FORMATS = {
+    AudioCodec.flac: ("FLAC", "PCM_16"),
+    AudioCodec.opus: ("OGG", "OPUS"),
+}
+_OPUS_RATES = (8000, 12000, 16000, 24000, 48000)
+
+
+def codec_of(path: Path) -> AudioCodec:
+    """Codec of a clip from the suffix of `path`, partial clips included."""
+    suffix = path.suffix
+    if suffix == ClipWriter.part_suffix:
+        suffix = Path(path.stem).suffix
+    for codec, codec_suffix in _SUFFIXES.items():
+        if suffix == codec_suffix:
+            return codec
+    raise ValueError("Unknown audio file type " + str(path))
+
+
+def read_clip(path: Path) -> tuple[int, np.ndarray]:
+    """Decode the clip saved at `path`, whatever its codec.
+
+    :return: the sample rate and the int16 samples of the clip.
+    """
+    if codec_of(path) == AudioCodec.wav and soundfile is None:
+        with wave.open(str(path), "rb") as wf:
+            samples = np.frombuffer(wf.readframes(wf.getnframes()), dtype=np.int16)
+            return wf.getframerate(), samples
+    if soundfile is None:
+        raise ValueError("Reading " + str(path) + " requires the soundfile package")
+    samples, framerate = soundfile.read(path, dtype="int16")
+    return framerate, samples
+
+
+_HEADER = struct.Struct("<4sI4s4sIHHIIHH4sI")
+
+
+def _wav_header(
+    data_size: int, framerate: int, channels: int, sample_width: int
+) -> bytes:
+    return _HEADER.pack(
+        b"RIFF",
+        _HEADER.size - 8 + data_size,
+        b"WAVE",
+        b"fmt ",
+        16,
+        1,  # PCM
+        channels,
+        framerate,
+        framerate * channels * sample_width,
+        channels * sample_width,
+        sample_width * 8,
+        b"data",
+        data_size,
+    )
+
+
+class ClipWriter:
+    """Write a clip to disk while it is being recorded.
+
+    Samples are appended to `<path>.part` as they arrive and the header is fixed when
+    the clip is closed, at which point the file is renamed. The file is synced to disk
+    every `fsync_seconds` of audio instead of on every write to spare the SD card. If
+    the program crashes, `ClipWriter.recover` turns the partial files back into valid
+    clips.
+
+    With a compressed `codec`, the samples are encoded by soundfile as they arrive.
+    """
+
+    part_suffix = ".part"
+
+    def __init__(
+        self,
+        path: Path,
+        framerate: int,
+        channels: int = 1,
+        sample_width: int = 2,
+        fsync_seconds: float = 5,
+        codec: AudioCodec = AudioCodec.wav,
+    ) -> None:
+        codec.check(framerate)
+        self._path = path
+        self._framerate = framerate
+        self._channels = channels
+        self._sample_width = sample_width
+        self._fsync_frames = int(fsync_seconds * framerate)
+
+        self._frames = 0
+        self._unsynced_frames = 0
+
+        self._file = open(self._part_path, "w+b")
+        self._encoder = None
+        if codec == AudioCodec.wav:
+            self._file.write(_wav_header(0, framerate, channels, sample_width))
+        else:
+            file_format, subtype = _SOUNDFILE_FORMATS[codec]
+            self._encoder = soundfile.SoundFile(  # type: ignore
+                self._file,
+                "w",
+                framerate,
+                channels,
+                format=file_format,
+                subtype=subtype,
+            )
+
+    @property
+    def _part_path(self) -> Path:
+        return self._path.with_name(self._path.name + self.part_suffix)
+
+    @property
+    def path(self) -> Path:
+        return self._path
+
+    @property
+    def duration(self) -> float:
+        """Duration of the clip in seconds."""
+        return self._frames / self._framerate
+
+    def write(self, samples: np.ndarray) -> None:
+        if self._encoder is None:
+            self._file.write(samples.data)
+        else:
+            self._encoder.write(samples)
+        self._frames += len(samples) // self._channels
+        self._unsynced_frames += len(samples) // self._channels
+        if self._unsynced_frames >= self._fsync_frames:
+            self._sync()
+
+    def _sync(self) -> None:
+        if self._encoder is not None:
+            self._encoder.flush()
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced_frames = 0
+
+    def close(self, path: Optional[Path] = None) -> Path:
+        """Finish the clip and move it to `path`---defaults to the path given at
+        creation.
+
+        :return: the path of the clip.
+        """
+        part_path = self._part_path
+        if path is not None:
+            self._path = path
+        if self._encoder is None:
+            data_size = self._frames * self._channels * self._sample_width
+            self._file.seek(0)
+            self._file.write(
+                _wav_header(
+                    data_size, self._framerate, self._channels, self._sample_width
+                )
+            )
+        else:
+            self._encoder.close()
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        os.replace(part_path, self._path)
+        return self._path
+
+    @staticmethod
+    def recover(folder: Path) -> list[Path]:
+        """Fix the partial clips left in `folder` by a crash.
+
+        :return: the paths of the recovered clips.
+        """
+        bark_logger = logging.getLogger("bark_monitor")
+        recovered = []
+        for part in sorted(folder.rglob("*" + ClipWriter.part_suffix)):
+            path = part.with_name(part.name[: -len(ClipWriter.part_suffix)])
+            if codec_of(part) != AudioCodec.wav:
+                if ClipWriter._recover_compressed(part, path):
+                    recovered.append(path)
+                continue
+            with open(part, "r+b") as file:
+                header = file.read(_HEADER.size)
+                if len(header) < _HEADER.size:
+                    bark_logger.warning("Removing empty partial clip " + str(part))
+                    file.close()
+                    part.unlink()
+                    continue
+                fields = list(_HEADER.unpack(header))
+                block_align = fields[9]
+                data_size = part.stat().st_size - _HEADER.size
+                data_size -= data_size % block_align
+                file.truncate(_HEADER.size + data_size)
+                fields[1] = _HEADER.size - 8 + data_size
+                fields[12] = data_size
+                file.seek(0)
+                file.write(_HEADER.pack(*fields))
+            os.replace(part, path)
+            bark_logger.info("Recovered partial clip " + str(path))
+            recovered.append(path)
+        return recovered
+
+    @staticmethod
+    def _recover_compressed(part: Path, path: Path) -> bool:
+        """Decode what can be read from the compressed partial clip `part` and encode
+        it again to `path`.
+
+        :return: True if some audio was recovered.
+        """
+        bark_logger = logging.getLogger("bark_monitor")
+        if soundfile is None:
+            bark_logger.warning("Cannot recover " + str(part) + " without soundfile")
+            return False
+        blocks = []
+        try:
+            with soundfile.SoundFile(part) as sound_file:
+                framerate = sound_file.samplerate
+                channels = sound_file.channels
+                # The end of the file is usually cut in the middle of a frame
+                for block in sound_file.blocks(4096, dtype="int16"):
+                    blocks.append(block)
+        except RuntimeError:
+            pass
+        if len(blocks) == 0:
+            bark_logger.warning("Removing unreadable partial clip " + str(part))
+            part.unlink()
+            return False
+
+        # The writer overwrites `part`, the audio is already in memory
+        writer = ClipWriter(path, framerate, channels, codec=codec_of(path))
+        for block in blocks:
+            writer.write(block)
+        writer.close()
+        bark_logger.info("Recovered partial clip " + str(path))
+        return True
@@ -0,0 +1,54 @@
+class DetectionRuns:
+    """Runs of consecutive windows in which an animal is detected, in a stream
+    analysed with windows of `window_size` samples every `hop_size` samples.
+
+    A detection only tells that the animal was heard somewhere in the window. The
+    time barked is the union of the positive windows, less the samples of the
+    negative windows around them, in which the animal was quiet. The samples of a
+    positive window are counted once the next window cannot rule them out anymore,
+    so that no sample is counted twice.
+    """
+
+    def __init__(self, window_size: int, hop_size: int) -> None:
+        self._window_size = window_size
+        self._hop_size = hop_size
+        self.reset()
+
+    def reset(self) -> None:
+        """Forget the windows analysed so far, for a new stream."""
+        self._running = False
+        self._started = False
+        # End of the samples counted as barked, and of the last negative window
+        self._counted_until = 0
+        self._quiet_until = 0
+
+    @property
+    def running(self) -> bool:
+        """True if the last window was positive."""
+        return self._running
+
+    @property
+    def started(self) -> bool:
+        """True if the last window started a run."""
+        return self._started
+
+    def update(self, positive: bool, end: int) -> int:
+        """Add the window ending at the sample `end` of the stream, `positive` if an
+        animal is detected in it.
+
+        :return: the number of samples counted as barked.
+        """
+        start = end - self._window_size
+        if not positive:
+            self._quiet_until = max(self._quiet_until, end)
+            self._running = False
+            self._started = False
+            return 0
+
+        self._started = not self._running
+        self._running = True
+        # The samples after the start of the next window may be in a negative one
+        until = start + self._hop_size
+        counted = max(0, until - max(self._counted_until, self._quiet_until, start))
+        self._counted_until = max(self._counted_until, until)
+        return counted
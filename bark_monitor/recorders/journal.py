@@ -0,0 +1,63 @@
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Iterator
+
+
+def write_atomic(path: Path, data: str | bytes) -> None:
+    """Replace the content of `path` with `data`.
+
+    The data is written to a temporary file which is synced and renamed to `path`, so
+    that `path` holds either the old or the new content even after a crash.
+    """
+    temp_path = path.with_name(path.name + ".tmp")
+    with open(temp_path, "wb" if isinstance(data, bytes) else "w") as file:
+        file.write(data)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_path, path)
+
+
+class Journal:
+    """Append-only log of events stored as one JSON object per line in `path`.
+
+    Appending costs the same however long the history is. Each event holds a sequence
+    number, `seq`, so that the events already included in a snapshot of the state can
+    be skipped when replaying the journal.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self._path = path
+
+    @property
+    def path(self) -> Path:
+        return self._path
+
+    def append(self, seq: int, event: dict) -> None:
+        line = json.dumps({"seq": seq} | event)
+        with open(self._path, "a") as file:
+            file.write(line + "\n")
+
+    def events(self, after: int = 0) -> Iterator[dict]:
+        """Events with a sequence number larger than `after`, in order.
+
+        A line cut by a crash at the end of the journal is ignored.
+        """
+        if not self._path.exists():
+            return
+        with open(self._path, "r") as file:
+            for line in file:
+                try:
+                    event = json.loads(line)
+                except json.JSONDecodeError:
+                    logging.getLogger("bark_monitor").warning(
+                        "Ignoring a truncated event in " + str(self._path)
+                    )
+                    continue
+                if event["seq"] > after:
+                    yield event
+
+    def clear(self) -> None:
+        """Remove the events, to call once they are saved in a snapshot."""
+        self._path.unlink(missing_ok=True)
@@ -1,10 +1,16 @@
 from datetime import datetime, timedelta
+from time import perf_counter
 from typing import Optional
 
-import numpy as np
-
-from bark_monitor.recorders.base_recorder import BaseRecorder
+from bark_monitor import metrics
+from bark_monitor.recorders.amplitude import AmplitudeDetector, signal_to_intensity
+from bark_monitor.recorders.base_recorder import BaseRecorder, RecorderState
 from bark_monitor.recorders.recording import Recording
+from bark_monitor.tracing import tracer
+
+_analysis_time = metrics.registry.histogram(
+    "bark_monitor_analysis_seconds", "Time to analyse a window of audio"
+)
 
 
 class Recorder(BaseRecorder):
@@ -13,70 +19,92 @@ class Recorder(BaseRecorder):
     def __init__(
         self,
         output_folder: str,
+        on_ratio: float = 2,
+        off_ratio: float = 1.5,
+        **kwargs,
     ) -> None:
-        self._bark_level: int = 0
-
-        self.running = False
-        self.is_paused = False
+        """A bark starts when the RMS of the signal is `on_ratio` times the
+        background noise level and stops when it falls under `off_ratio` times that
+        level. Other keyword arguments are passed to `BaseRecorder`.
+        """
+        self._on_ratio = on_ratio
+        self._off_ratio = off_ratio
+        self._detector = AmplitudeDetector(on_ratio, off_ratio)
 
         self._last_bark = datetime.now()
-        super().__init__(output_folder)
+        self._is_barking = False
+        # Samples of the current bark, added to the time barked when it ends
+        self._bark_samples = 0
+        super().__init__(output_folder, **kwargs)
 
     @property
     def bark_level(self) -> Optional[int]:
-        return self._bark_level
+        """Current intensity above which a bark starts."""
+        return self._detector.on_threshold
 
     def _init(self):
         super()._init()
+        self._detector = AmplitudeDetector(self._on_ratio, self._off_ratio)
         self._barking_at = datetime.now()
         self._is_barking = False
-
-    def _is_bark(self, value: int) -> bool:
-        if self._bark_level == 0:
-            return False
-        return value >= self._bark_level
+        self._bark_samples = 0
+        # Barks are detected from the first chunk but the noise floor settles during
+        # the first second
+        self._set_state(RecorderState.calibrating)
+        self._calibration_samples = self._fs
 
     def _signal_to_intensity(self, signal: bytes) -> int:
-        np_data = np.frombuffer(signal, dtype=np.int16)
-        return np.amax(np_data)  # type: ignore
-
-    def stop(self):
-        self._bark_level = 0
-        return super().stop()
-
-    def _set_bark_level(self, range_measurements: int = 100) -> None:
-        assert self._stream is not None
-        self._bark_level = 0
-        for _ in range(range_measurements):
-            data = self._stream.read(self._chunk)
-            self._bark_level = max(self._bark_level, self._signal_to_intensity(data))
-        self._bark_level *= 2
+        return signal_to_intensity(signal)
+
+    def _add_time_barked(self) -> timedelta:
+        """Add the duration of the current bark to the time barked.
+
+        :return: the duration of the bark.
+        """
+        duration = timedelta(seconds=self._bark_samples / self._fs)
+        self._bark_samples = 0
+        Recording.read(self.output_folder).add_time_barked(duration)
+        return duration
+
+    def _stop(self) -> None:
+        super()._stop()
+        # The recorder stopped before the end of a bark
+        if self._bark_samples > 0:
+            self._add_time_barked()
+        self._is_barking = False
 
     def _record_loop(self) -> None:
         self._start_stream()
         self._bark_logger.info("Recording started")
 
-        assert self._stream is not None
-        self._set_bark_level()
-
-        while self.running:
-            if self.is_paused:
+        while self._wait_while_paused():
+            data = self._read()
+            if data is None:
                 continue
-
-            data = self._stream.read(self._chunk, exception_on_overflow=False)
-            intensity = self._signal_to_intensity(data)
-
-            # Save data if dog is barking
-            is_bark = self._is_bark(intensity)
-            if is_bark:
-                self._frames.append(data)
+            samples = self._capture(data)
+            start = perf_counter()
+            with tracer.span("detect"):
+                intensity = self._signal_to_intensity(data)
+                # The threshold to compare to is the one before the update
+                bark_level = self.bark_level
+                is_bark = self._detector.update(intensity)
+
+            if self._calibration_samples > 0:
+                self._calibration_samples -= len(samples)
+                if self._calibration_samples <= 0:
+                    self._transition(RecorderState.calibrating, RecorderState.running)
 
             # If to update time and stop recording the bark
             if is_bark:
                 self._barking_at = datetime.now()
+                self._bark_samples += len(samples)
                 if not self._is_barking:
                     self._is_barking = True
-                    self._chat_bot.send_bark(intensity - self._bark_level)
+                    with tracer.span("state update"):
+                        self._start_clip(len(samples))
+                    assert bark_level is not None
+                    with tracer.span("notify"):
+                        self._chat_bot.send_bark(intensity - bark_level)
 
             elif self._is_barking and (datetime.now() - self._barking_at) > timedelta(
                 seconds=5
@@ -84,14 +112,14 @@ class Recorder(BaseRecorder):
                 assert self._barking_at is not None
                 self._is_barking = False
 
-                recording = Recording.read(self.output_folder)
-                duration = timedelta(
-                    seconds=(len(self._frames) * self._chunk) / self._fs
-                )
-                recording.add_time_barked(duration)
+                with tracer.span("state update"):
+                    duration = self._add_time_barked()
+
+                with tracer.span("notify"):
+                    self._chat_bot.send_end_bark(duration)
+                with tracer.span("save"):
+                    self._end_clip()
 
-                self._chat_bot.send_end_bark(duration)
-                self._save_recording(self._frames)
-                self._frames = []
+            _analysis_time.observe(perf_counter() - start)
 
         self._stop_stream()
@@ -1,10 +1,48 @@
-from datetime import datetime, timedelta
+import logging
+import re
+import socket
+import threading
+import uuid
+from collections import deque
+from datetime import date, datetime, timedelta
 from pathlib import Path
+from time import perf_counter
 from typing import Optional
 
 import jsonpickle
 
+from bark_monitor import metrics, serialization
 from bark_monitor.google_sync import GoogleSync
+from bark_monitor.recorders.journal import Journal, write_atomic
+from bark_monitor.recorders.recording_db import RecordingChanges, RecordingDatabase
+from bark_monitor.tracing import tracer
+
+
+def _parse_datetime_repr(time: datetime | str) -> datetime:
+    if isinstance(time, datetime):
+        return time
+    match = re.fullmatch(r"datetime\.datetime\(([\d, ]+)\)", time)
+    if match is None:
+        raise ValueError("Cannot read the activity time " + time)
+    return datetime(*(int(value) for value in match.group(1).split(",")))
+
+
+def _hour_of(time: datetime) -> datetime:
+    return time.replace(minute=0, second=0, microsecond=0)
+
+
+_save_time = metrics.registry.histogram(
+    "bark_monitor_recording_save_seconds", "Time to save the recording state"
+)
+_sync_time = metrics.registry.histogram(
+    "bark_monitor_google_sync_seconds",
+    "Time to merge the recording state with Google Drive",
+)
+metrics.registry.gauge(
+    "bark_monitor_recording_cache_hit_rate",
+    "Ratio of the reads of the recording state served from memory",
+    lambda: Recording.cache_hit_rate(),
+)
 
 
 class Recording:
@@ -12,16 +50,52 @@ class Recording:
 
     The recording state needs to be consistent for the whole app. This is a helper class
     to load and modify that state.
+
+    There is one `Recording` per output folder for the whole process, shared by the
+    recorder thread and the bot. It is loaded from disk and merged with the state on
+    Google Drive by the first call to `Recording.read`, later calls return the same
+    object. All the changes are made under `Recording.lock`.
+
+    Changes are appended to a journal instead of rewriting the whole state. The state
+    is saved in a snapshot, and the journal emptied, every `compact_every` changes and
+    before being uploaded to Google Drive.
+
+    Once `Recording.use_database` is called for a folder, changes are stored in a
+    SQLite database instead of the journal, and the state is loaded from it. Saves
+    still write the snapshot, from which the state is loaded again when the database
+    is not used anymore.
+
+    Activities older than the retention are rolled up into counts of each label by
+    hour, see `roll_up_activities`, so that the state does not grow forever.
     """
 
     __create_key = object()
 
+    # The states already read, by output folder
+    _cache: dict[Path, "Recording"] = {}
+    _cache_hits = 0
+    _cache_misses = 0
+    # The opened databases, by output folder
+    _databases: dict[Path, RecordingDatabase] = {}
+    lock = threading.RLock()
+    compact_every = 1000
+
     def __init__(self, create_key, output_folder: str) -> None:
         self._start: Optional[datetime] = None
         self._start_end: list[tuple[datetime, Optional[datetime]]] = []
-        self._time_barked: dict[str, timedelta] = {}
+        # Time barked by day, counted separately by each device sharing the state
+        self._time_barked: dict[str, dict[str, timedelta]] = {}
         self._output_folder = Path(output_folder).absolute()
         self._activity_tracker: dict[datetime, str] = {}
+        # Number of activities of each label by hour, for the rolled up activities
+        self._rolled_up: dict[datetime, dict[str, int]] = {}
+        # Sequence number of the last change, and of the last change in the snapshot
+        self._seq = 0
+        self._snapshot_seq = 0
+        # Rows changed by the merges since the last save
+        self._unsaved = RecordingChanges()
+        # Identifier of the device this state is recorded on
+        self._device = ""
 
         assert (
             create_key == Recording.__create_key
@@ -36,105 +110,678 @@ class Recording:
         self._output_folder = output_folder
         self.save()
 
-    def daily_activities_formated(self) -> str:
+    @property
+    def database(self) -> Optional[RecordingDatabase]:
+        return Recording._databases.get(Path(self.output_folder).absolute())
+
+    def daily_activities_formated(self, day: Optional[date] = None) -> str:
+        """List the activities of `day`---defaults to today. The rolled up hours are
+        listed with the number of activities of each label."""
+        if day is None:
+            day = datetime.today().date()
         activities = ""
-        for a_datetime, activity in self.activity_tracker.items():
-            if a_datetime.date() == datetime.today().date():
-                activities += a_datetime.strftime("%H %M %S") + ": " + activity + "\n"
+        database = self.database
+        with Recording.lock:
+            if database is not None:
+                raw_activities = database.activities_of_day(day)
+            else:
+                raw_activities = [
+                    (a_datetime, activity)
+                    for a_datetime, activity in self.activity_tracker.items()
+                    if a_datetime.date() == day
+                ]
+            rolled_up = sorted(
+                (hour, counts)
+                for hour, counts in self._rolled_up.items()
+                if hour.date() == day
+            )
+        for hour, counts in rolled_up:
+            activities += (
+                hour.strftime("%H h")
+                + ": "
+                + ", ".join(
+                    label + " x" + str(count) for label, count in sorted(counts.items())
+                )
+                + "\n"
+            )
+        for a_datetime, activity in raw_activities:
+            activities += a_datetime.strftime("%H %M %S") + ": " + activity + "\n"
         return activities
 
+    def activity_counts(self, day: date) -> dict[str, int]:
+        """Number of activities of each label on `day`, rolled up or not."""
+        counts: dict[str, int] = {}
+        with Recording.lock:
+            for time, label in self._activity_tracker.items():
+                if time.date() == day:
+                    counts[label] = counts.get(label, 0) + 1
+            for hour, hour_counts in self._rolled_up.items():
+                if hour.date() == day:
+                    for label, count in hour_counts.items():
+                        counts[label] = counts.get(label, 0) + count
+        return counts
+
+    def last_activity(self) -> Optional[tuple[datetime, str]]:
+        """:return: the time and label of the latest activity, None if there is no
+        activity."""
+        with Recording.lock:
+            if len(self._activity_tracker) == 0:
+                return None
+            time = max(self._activity_tracker)
+            return time, self._activity_tracker[time]
+
     @property
     def activity_tracker(self) -> dict[datetime, str]:
         return self._activity_tracker
 
     def add_activity(self, time: datetime, activity: str) -> None:
-        self._activity_tracker[time] = activity
-        self.save()
+        self._change({"type": "activity", "time": time.isoformat(), "label": activity})
 
     def clear_activity(self) -> None:
-        self._activity_tracker = {}
-        self.save()
+        self._change({"type": "clear_activity"})
+
+    @property
+    def rolled_up_activities(self) -> dict[datetime, dict[str, int]]:
+        return self._rolled_up
+
+    def roll_up_activities(
+        self, retention_days: float, now: Optional[datetime] = None
+    ) -> int:
+        """Replace the activities older than `retention_days` by the number of
+        activities of each label in each hour.
+
+        :return: the number of activities rolled up.
+        """
+        if now is None:
+            now = datetime.now()
+        before = _hour_of(now - timedelta(days=retention_days))
+        with Recording.lock:
+            count = sum(1 for time in self._activity_tracker if time < before)
+            if count > 0:
+                self._change({"type": "roll_up", "before": before.isoformat()})
+        return count
 
     @property
     def start_end(self) -> list[tuple[datetime, Optional[datetime]]]:
         return self._start_end
 
+    @property
+    def device(self) -> str:
+        return self._device
+
     @property
     def all_time_barked(self) -> dict[str, timedelta]:
+        """Time barked by day, all devices together."""
+        with Recording.lock:
+            return {
+                day: sum(devices.values(), timedelta(0))
+                for day, devices in self._time_barked.items()
+            }
+
+    @property
+    def time_barked_by_device(self) -> dict[str, dict[str, timedelta]]:
         return self._time_barked
 
     @property
     def time_barked(self) -> timedelta:
         now = datetime.now().strftime("%d-%m-%Y")
-        if now not in self._time_barked:
-            return timedelta(0)
-        return self._time_barked[now]
+        with Recording.lock:
+            return sum(self._time_barked.get(now, {}).values(), timedelta(0))
 
     def add_time_barked(self, value: timedelta, day: Optional[str] = None) -> None:
         if day is None:
             day = datetime.now().strftime("%d-%m-%Y")
-        if day not in self._time_barked:
-            self._time_barked[day] = timedelta(0)
-        timedelta(0)
-        self._time_barked[day] = self._time_barked[day] + value
-        self.save()
+        self._change(
+            {
+                "type": "time_barked",
+                "day": day,
+                "device": self._device,
+                "seconds": value.total_seconds(),
+            }
+        )
 
     @property
     def start(self) -> Optional[datetime]:
         return self._start
 
+    @property
+    def seq(self) -> int:
+        return self._seq
+
     @start.setter
     def start(self, value: datetime) -> None:
-        self._start = value
-        self.save()
+        self._change({"type": "start", "time": value.isoformat()})
 
     def end(self, value: datetime) -> None:
         assert self._start is not None
-        self._start_end.append((self._start, value))
-        self._start = None
-        self.save()
+        self._change({"type": "end", "time": value.isoformat()})
+
+    def _apply(self, event: dict) -> None:
+        """Apply the change described by `event` to the state in memory."""
+        match event["type"]:
+            case "activity":
+                time = datetime.fromisoformat(event["time"])
+                self._activity_tracker[time] = event["label"]
+            case "clear_activity":
+                self._activity_tracker = {}
+                self._rolled_up = {}
+            case "roll_up":
+                before = datetime.fromisoformat(event["before"])
+                kept = {}
+                for time, label in self._activity_tracker.items():
+                    if time < before:
+                        counts = self._rolled_up.setdefault(_hour_of(time), {})
+                        counts[label] = counts.get(label, 0) + 1
+                    else:
+                        kept[time] = label
+                self._activity_tracker = kept
+            case "time_barked":
+                devices = self._time_barked.setdefault(event["day"], {})
+                # Events written before the time was counted by device have none
+                device = event.get("device", "")
+                devices[device] = devices.get(device, timedelta(0)) + timedelta(
+                    seconds=event["seconds"]
+                )
+            case "start":
+                self._start = datetime.fromisoformat(event["time"])
+            case "end":
+                assert self._start is not None
+                self._start_end.append(
+                    (self._start, datetime.fromisoformat(event["time"]))
+                )
+                self._start = None
+            case _:
+                raise ValueError("Unknown recording event " + str(event["type"]))
+
+    def _change(self, event: dict) -> None:
+        """Apply `event` and append it to the journal, or store it in the database."""
+        with Recording.lock:
+            self._apply(event)
+            self._seq += 1
+            database = self.database
+            if database is not None:
+                database.apply(event, self._seq)
+                return
+            if not self.output_folder.exists():
+                self.output_folder.mkdir(parents=True, exist_ok=True)
+            self._journal.append(self._seq, event)
+            if self._seq - self._snapshot_seq >= Recording.compact_every:
+                self.save()
 
     @property
     def _path(self) -> Path:
         return Path(self.output_folder, "recording.json")
 
+    @property
+    def _journal(self) -> Journal:
+        return Journal(Path(self.output_folder, "recording.journal"))
+
     def save(self):
-        encoded = jsonpickle.encode(self, keys=True)
-        assert encoded is not None
-        if not self.output_folder.exists():
-            self.output_folder.mkdir(parents=True, exist_ok=True)
-        with self._path.open(mode="w") as outfile:
-            outfile.write(encoded)
+        """Save a snapshot of the state and empty the journal."""
+        with Recording.lock, _save_time.time(), tracer.span("save"):
+            database = self.database
+            if database is not None:
+                # After a merge, the database must hold the merged state
+                database.import_changes(self, self._unsaved)
+            self._unsaved = RecordingChanges()
+            self._snapshot_seq = self._seq
+            encoded = self.encode()
+            if not self.output_folder.exists():
+                self.output_folder.mkdir(parents=True, exist_ok=True)
+            write_atomic(self._path, encoded)
+            self._journal.clear()
 
     def save_to_google(self):
+        # The file on Google Drive must hold the changes still in the journal
+        self.save()
         GoogleSync.update_file(self._path)
 
     def merge(self, recording: "Recording") -> None:
-        for el in recording.start_end:
-            if el not in self.start_end:
-                self.start_end.append(el)
-        self._activity_tracker = recording.activity_tracker | self._activity_tracker
-        self._time_barked = recording.all_time_barked | self._time_barked
+        """Merge the state recorded by other devices in `recording` into this one.
+
+        The result does not depend on the order of the merges: sessions are the union
+        of both, sorted by start, and activities are sorted by time, with the largest
+        label kept when both states hold different labels at the same time. A device
+        only adds time barked to its own counter, so each counter keeps the largest of
+        its values, and the counters of all the devices add up to the time barked.
+
+        Once an hour is rolled up in either state, it is rolled up in the result with
+        the largest count of each label. The count of a state includes the raw
+        activities it still has in that hour, so the activities a device had not
+        synced before the other rolled up the hour are kept.
+        """
+        with Recording.lock:
+            sessions = set(self._start_end)
+            new_sessions = set(recording.start_end).difference(sessions)
+            self._unsaved.sessions.update(new_sessions)
+            sessions.update(new_sessions)
+            self._start_end = sorted(
+                sessions, key=lambda session: (session[0], session[1] or datetime.max)
+            )
+
+            # An hour rolled up in one state may still have raw activities in the
+            # other, they are counted with the hourly counts of that state
+            hours = self._rolled_up.keys() | recording.rolled_up_activities.keys()
+            rolled_up = self._hourly_counts(hours)
+            for hour, counts in recording._hourly_counts(hours).items():
+                own_counts = rolled_up.setdefault(hour, {})
+                for label, count in counts.items():
+                    own_counts[label] = max(own_counts.get(label, 0), count)
+            for hour, counts in rolled_up.items():
+                if counts != self._rolled_up.get(hour):
+                    self._unsaved.rolled_up.add(hour)
+            self._rolled_up = rolled_up
+
+            activities = recording.activity_tracker | self._activity_tracker
+            for time, label in recording.activity_tracker.items():
+                if activities[time] < label:
+                    activities[time] = label
+                if self._activity_tracker.get(time) != activities[time]:
+                    self._unsaved.activities.add(time)
+            # Activities of the rolled up hours are already counted
+            self._activity_tracker = {
+                time: label
+                for time, label in sorted(activities.items())
+                if _hour_of(time) not in self._rolled_up
+            }
+
+            for day, devices in recording.time_barked_by_device.items():
+                own_devices = self._time_barked.setdefault(day, {})
+                for device, value in devices.items():
+                    if value > own_devices.get(device, timedelta(0)):
+                        own_devices[device] = value
+                        self._unsaved.time_barked.add((day, device))
+
+    def _hourly_counts(self, hours: set[datetime]) -> dict[datetime, dict[str, int]]:
+        """Number of activities of each label in `hours`, rolled up or not.
+
+        :return: the counts by hour.
+        """
+        counts = {hour: dict(labels) for hour, labels in self._rolled_up.items()}
+        if len(hours) == 0:
+            return counts
+        end = max(hours) + timedelta(hours=1)
+        for time, label in self._activity_tracker.items():
+            hour = _hour_of(time)
+            if time < end and hour in hours:
+                labels = counts.setdefault(hour, {})
+                labels[label] = labels.get(label, 0) + 1
+        return counts
 
     @classmethod
-    def read(cls, output_folder: str) -> "Recording":
+    def _device_id(cls, output_folder: Path) -> str:
+        """Identifier of this device, created the first time the state in
+        `output_folder` is read."""
+        path = Path(output_folder, "device_id")
+        if path.exists():
+            return path.read_text().strip()
+        device = socket.gethostname() + "-" + uuid.uuid4().hex[:8]
+        if not output_folder.exists():
+            output_folder.mkdir(parents=True, exist_ok=True)
+        path.write_text(device)
+        return device
+
+    # Version of the format written by `encode`
+    version = 3
+    # Day of the time barked before it was counted by day, which is not the time
+    # barked of any actual day
+    legacy_day = "legacy"
+
+    def encode(self) -> bytes:
+        """Encode the state, without the output folder which is specific to the
+        device.
+
+        Times are microseconds from the epoch and activities refer to their label by
+        its index in the list of labels, so that each label is written once.
+        """
+        with Recording.lock:
+            labels = sorted(
+                set(self._activity_tracker.values()).union(
+                    *(counts.keys() for counts in self._rolled_up.values())
+                )
+            )
+            label_index = {label: index for index, label in enumerate(labels)}
+            return serialization.dumps(
+                {
+                    "version": Recording.version,
+                    "seq": self._seq,
+                    "start": (
+                        None
+                        if self._start is None
+                        else serialization.to_epoch(self._start)
+                    ),
+                    "sessions": [
+                        [
+                            serialization.to_epoch(start),
+                            None if end is None else serialization.to_epoch(end),
+                        ]
+                        for start, end in self._start_end
+                    ],
+                    "time_barked": {
+                        day: {
+                            device: value.total_seconds()
+                            for device, value in devices.items()
+                        }
+                        for day, devices in self._time_barked.items()
+                    },
+                    "labels": labels,
+                    "activities": [
+                        [serialization.to_epoch(time), label_index[label]]
+                        for time, label in self._activity_tracker.items()
+                    ],
+                    "rolled_up": [
+                        [serialization.to_epoch(hour), label_index[label], count]
+                        for hour, counts in self._rolled_up.items()
+                        for label, count in counts.items()
+                    ],
+                }
+            )
+
+    def _upgrade_jsonpickle(self) -> None:
+        """Bring a state decoded by jsonpickle, written by an older version, to the
+        current attributes."""
+        # Snapshots written before the journal existed
+        self._seq = getattr(self, "_seq", 0)
+        self._snapshot_seq = getattr(self, "_snapshot_seq", 0)
+        if isinstance(self._time_barked, timedelta):
+            # Before the time barked was counted per day, the day is not known
+            self._time_barked = {Recording.legacy_day: self._time_barked}
+        # Before the time barked was counted by device
+        self._time_barked = {
+            day: {"": value} for day, value in self._time_barked.items()
+        }
+        self._device = ""
+        self._rolled_up = {}
+        self._unsaved = RecordingChanges()
+        sessions = [
+            (start, end)
+            for start, end in self._start_end
+            if isinstance(start, datetime)
+            and (end is None or isinstance(end, datetime))
+        ]
+        if len(sessions) < len(self._start_end):
+            logging.getLogger("bark_monitor").warning(
+                "Ignoring "
+                + str(len(self._start_end) - len(sessions))
+                + " recording sessions without a date"
+            )
+            self._start_end = sessions
+        if any(not isinstance(time, datetime) for time in self._activity_tracker):
+            # Old versions of jsonpickle wrote the repr of the datetime keys
+            self._activity_tracker = {
+                _parse_datetime_repr(time): activity
+                for time, activity in self._activity_tracker.items()
+            }
+
+    @classmethod
+    def decode(cls, encoded: str | bytes) -> "Recording":
+        """Decode a state encoded by `encode` or, before that, by jsonpickle."""
+        data = serialization.loads(encoded)
+        if serialization.is_jsonpickle(data):
+            state: "Recording" = jsonpickle.decode(encoded, keys=True)  # type: ignore
+            state._upgrade_jsonpickle()
+            return state
+        if data["version"] > Recording.version:
+            raise ValueError(
+                "Recording state of version "
+                + str(data["version"])
+                + " is too recent, update bark_monitor"
+            )
+
+        state = Recording(cls.__create_key, ".")
+        state._seq = data["seq"]
+        state._snapshot_seq = data["seq"]
+        if data["start"] is not None:
+            state._start = serialization.from_epoch(data["start"])
+        state._start_end = [
+            (
+                serialization.from_epoch(start),
+                None if end is None else serialization.from_epoch(end),
+            )
+            for start, end in data["sessions"]
+        ]
+        if data["version"] == 1:
+            # Before the time barked was counted by device
+            state._time_barked = {
+                day: {"": timedelta(seconds=seconds)}
+                for day, seconds in data["time_barked"].items()
+            }
+        else:
+            state._time_barked = {
+                day: {
+                    device: timedelta(seconds=seconds)
+                    for device, seconds in devices.items()
+                }
+                for day, devices in data["time_barked"].items()
+            }
+        labels = data["labels"]
+        state._activity_tracker = {
+            serialization.from_epoch(time): labels[label]
+            for time, label in data["activities"]
+        }
+        # Activities were not rolled up before version 3
+        for hour, label, count in data.get("rolled_up", []):
+            state._rolled_up.setdefault(serialization.from_epoch(hour), {})[
+                labels[label]
+            ] = count
+        return state
+
+    @classmethod
+    def read(cls, output_folder: str | Path) -> "Recording":
         """Factory method to load the state.
 
-        The state is loaded and written from/to `output_folder`.
+        The state is loaded and written from/to `output_folder`. Only the first call
+        for a folder reads the disk and Google Drive.
 
         :return: the state in `output_folder`
         """
-        state = Recording(cls.__create_key, output_folder)
-        if state._path.exists():
-            with state._path.open(mode="r") as file:
-                lines = file.read()
-                state: "Recording" = jsonpickle.decode(lines, keys=True)  # type: ignore
+        folder = Path(output_folder).absolute()
+        with cls.lock:
+            state = cls._cache.get(folder)
+            if state is not None:
+                cls._cache_hits += 1
+                return state
+            cls._cache_misses += 1
+
+            state = cls._read_disk(folder)
+            state._merge_google()
+            cls._cache[folder] = state
+            return state
 
+    @classmethod
+    def _read_disk(cls, folder: Path) -> "Recording":
+        """Load the state in `folder` from its database if it is used, from the
+        snapshot and the journal otherwise.
+
+        :return: the state, without the changes on Google Drive.
+        """
+        state = Recording(cls.__create_key, str(folder))
+        database = cls._databases.get(folder)
+        if database is not None:
+            state._load_database(database)
+        elif state._path.exists():
+            with state._path.open(mode="rb") as file:
+                state = Recording.decode(file.read())
+            # The state lives where it is read from, whatever device wrote it
+            state._output_folder = folder
+        state._device = cls._device_id(folder)
+        if state.database is None:
+            for event in state._journal.events(after=state._snapshot_seq):
+                state._apply(event)
+                state._seq = event["seq"]
+        return state
+
+    def _merge_google(self) -> None:
+        """Merge the state on Google Drive into this one."""
         past_state_bytes = GoogleSync.load_state()
         if past_state_bytes is not None:
-            old_state: "Recording" = jsonpickle.decode(
-                past_state_bytes, keys=True
-            )  # type: ignore
-            state.merge(old_state)
+            self.merge(Recording.decode(past_state_bytes))
 
-        return state
+    def _load_database(self, database: RecordingDatabase) -> None:
+        self._start = database.start
+        self._start_end = database.sessions()
+        self._time_barked = database.time_barked_by_device()
+        self._activity_tracker = dict(database.activities())
+        self._rolled_up = database.activity_counts()
+        self._seq = database.seq
+        self._snapshot_seq = self._seq
+
+    @classmethod
+    def use_database(cls, output_folder: str | Path) -> RecordingDatabase:
+        """Store the state of `output_folder` in a SQLite database from now on.
+
+        The state saved in the snapshot and the journal is imported in the database
+        when it is the first time, or when changes were made since the database was
+        last used.
+
+        :return: the database.
+        """
+        folder = Path(output_folder).absolute()
+        with cls.lock:
+            database = cls._databases.get(folder)
+            if database is not None:
+                return database
+
+            # Google Drive is merged once the newer of the snapshot and the database
+            # is known
+            cls.forget(folder)
+            state = cls._read_disk(folder)
+            path = Path(folder, "recording.db")
+            new = not path.exists()
+            database = RecordingDatabase(path)
+            cls._databases[folder] = database
+            imported = new or database.seq < state.seq
+            if imported:
+                database.import_recording(state)
+            else:
+                # The database holds changes made after the last save
+                state = cls._read_disk(folder)
+            state._merge_google()
+            cls._cache[folder] = state
+            if imported:
+                state.save()
+            return database
+
+    @classmethod
+    def forget(cls, output_folder: str | Path) -> None:
+        """Drop the state of `output_folder` from memory, the next `read` loads it
+        again."""
+        with cls.lock:
+            cls._cache.pop(Path(output_folder).absolute(), None)
+
+    @classmethod
+    def cache_hit_rate(cls) -> Optional[float]:
+        """Ratio of the calls to `read` that did not load the state."""
+        reads = cls._cache_hits + cls._cache_misses
+        if reads == 0:
+            return None
+        return cls._cache_hits / reads
+
+
+class _PeriodicTask:
+    """Run `_run_once` every `interval_seconds` in a background thread."""
+
+    def __init__(self, interval_seconds: float, run_at_start: bool = False) -> None:
+        self._interval_seconds = interval_seconds
+        self._run_at_start = run_at_start
+        self._stop = threading.Event()
+        self._t: Optional[threading.Thread] = None
+        self._bark_logger = logging.getLogger("bark_monitor")
+
+    def start(self) -> None:
+        if self._t is not None:
+            return
+        self._stop.clear()
+        self._t = threading.Thread(target=self._run, daemon=True)
+        self._t.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._t is not None:
+            self._t.join()
+            self._t = None
+
+    def _run(self) -> None:
+        if self._run_at_start:
+            self._run_safely()
+        while not self._stop.wait(self._interval_seconds):
+            self._run_safely()
+
+    def _run_safely(self) -> None:
+        try:
+            self._run_once()
+        except Exception as e:
+            self._bark_logger.error("Error in " + type(self).__name__ + ": " + str(e))
+
+    def _run_once(self) -> None:
+        raise NotImplementedError()
+
+
+class RecordingSync(_PeriodicTask):
+    """Merge the recording state in `output_folder` with the one on Google Drive every
+    `interval_seconds`, in a background thread.
+
+    The merged state is saved and uploaded back to Google Drive so that the devices
+    sharing the drive converge.
+    """
+
+    def __init__(self, output_folder: str, interval_seconds: float = 600) -> None:
+        super().__init__(interval_seconds)
+        self._output_folder = output_folder
+        self._latencies: deque[float] = deque(maxlen=100)
+
+    @property
+    def syncs(self) -> int:
+        return len(self._latencies)
+
+    @property
+    def latency(self) -> Optional[float]:
+        """Mean duration in seconds of the last syncs."""
+        if len(self._latencies) == 0:
+            return None
+        return sum(self._latencies) / len(self._latencies)
+
+    def _run_once(self) -> None:
+        self.sync()
+
+    def sync(self) -> None:
+        start = perf_counter()
+        recording = Recording.read(self._output_folder)
+        # The download happens outside of the lock, the recorder is never blocked on
+        # the network
+        past_state_bytes = GoogleSync.load_state()
+        if past_state_bytes is not None:
+            past_state = Recording.decode(past_state_bytes)
+            recording.merge(past_state)
+            # Saves the merged state before uploading it
+            recording.save_to_google()
+        self._latencies.append(perf_counter() - start)
+        _sync_time.observe(self._latencies[-1])
+
+        hit_rate = Recording.cache_hit_rate()
+        self._bark_logger.info(
+            f"Recording state synced in {self._latencies[-1]:.2f} s"
+            + ("" if hit_rate is None else f", cache hit rate {hit_rate:.2f}")
+        )
+
+
+class RecordingRetention(_PeriodicTask):
+    """Roll up the activities of the recording state in `output_folder` older than
+    `retention_days` every `interval_seconds`, in a background thread.
+    """
+
+    def __init__(
+        self, output_folder: str, retention_days: float, interval_seconds: float = 3600
+    ) -> None:
+        super().__init__(interval_seconds, run_at_start=True)
+        self._output_folder = output_folder
+        self._retention_days = retention_days
+
+    def _run_once(self) -> None:
+        rolled_up = Recording.read(self._output_folder).roll_up_activities(
+            self._retention_days
+        )
+        if rolled_up > 0:
+            self._bark_logger.info(
+                "Rolled up " + str(rolled_up) + " activities into hourly counts"
+            )
@@ -0,0 +1,390 @@
+import sqlite3
+import threading
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import TYPE_CHECKING, Optional
+
+if TYPE_CHECKING:
+    from bark_monitor.recorders.recording import Recording
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    start TEXT PRIMARY KEY,
+    end TEXT
+);
+CREATE TABLE IF NOT EXISTS activities (
+    time TEXT PRIMARY KEY,
+    label TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS activities_label ON activities (label, time);
+CREATE TABLE IF NOT EXISTS bark_time (
+    day TEXT NOT NULL,
+    device TEXT NOT NULL,
+    seconds REAL NOT NULL,
+    PRIMARY KEY (day, device)
+);
+CREATE TABLE IF NOT EXISTS activity_counts (
+    hour TEXT NOT NULL,
+    label TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (hour, label)
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def _day_key(day: str) -> str:
+    """Convert a "%d-%m-%Y" day of `Recording` to an ISO date, which sorts.
+
+    The legacy day of `Recording` is not a date and is kept as it is, it is never in
+    a range of dates.
+    """
+    try:
+        return datetime.strptime(day, "%d-%m-%Y").date().isoformat()
+    except ValueError:
+        return day
+
+
+def _hour_key(hour: datetime) -> str:
+    return hour.strftime("%Y-%m-%d %H")
+
+
+def _day_name(key: str) -> str:
+    try:
+        return date.fromisoformat(key).strftime("%d-%m-%Y")
+    except ValueError:
+        return key
+
+
+class RecordingChanges:
+    """Rows of a `Recording` changed in memory since it was last saved, which the
+    database does not hold yet."""
+
+    def __init__(self) -> None:
+        self.sessions: set[tuple[datetime, Optional[datetime]]] = set()
+        # Times of the activities, which are stored or deleted
+        self.activities: set[datetime] = set()
+        self.rolled_up: set[datetime] = set()
+        # Day and device of the time barked
+        self.time_barked: set[tuple[str, str]] = set()
+
+
+class RecordingDatabase:
+    """SQLite storage of the recording state in `path`.
+
+    Sessions, activities and the bark time per day are stored in tables indexed by
+    time, so that a range of time is queried without going through the whole history.
+    Times are stored as ISO strings, which sort like the times they represent.
+
+    The database is in WAL mode: the bot can read while the recorder writes. Every
+    thread gets its own connection.
+    """
+
+    # Version of the schema, stored in the user_version of the database
+    version = 3
+
+    def __init__(self, path: Path) -> None:
+        self._path = path
+        self._local = threading.local()
+        with self._connection as connection:
+            version = connection.execute("PRAGMA user_version").fetchone()[0]
+            if version == 0 and self._has_table(connection, "bark_time"):
+                # Version 1 had one bark time per day, the devices were not counted
+                # separately
+                connection.execute("ALTER TABLE bark_time RENAME TO bark_time_v1")
+                connection.executescript(_SCHEMA)
+                connection.execute(
+                    "INSERT INTO bark_time SELECT day, '', seconds FROM bark_time_v1"
+                )
+                connection.execute("DROP TABLE bark_time_v1")
+            connection.executescript(_SCHEMA)
+            connection.execute(f"PRAGMA user_version = {RecordingDatabase.version}")
+
+    @staticmethod
+    def _has_table(connection: sqlite3.Connection, name: str) -> bool:
+        return (
+            connection.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table' AND name = ?",
+                (name,),
+            ).fetchone()
+            is not None
+        )
+
+    @property
+    def path(self) -> Path:
+        return self._path
+
+    @property
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self._path, timeout=10)
+            connection.execute("PRAGMA journal_mode=WAL")
+            # Enough to survive a crash of the program, WAL keeps the file consistent
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    @property
+    def seq(self) -> int:
+        """Sequence number of the last change of the `Recording` stored, 0 if none
+        was."""
+        row = self._connection.execute(
+            "SELECT value FROM meta WHERE key = 'seq'"
+        ).fetchone()
+        return 0 if row is None else int(row[0])
+
+    def apply(self, event: dict, seq: Optional[int] = None) -> None:
+        """Store the change described by `event`, an event of the `Recording`
+        journal, with its sequence number `seq`."""
+        with self._connection as connection:
+            if seq is not None:
+                connection.execute(
+                    "INSERT OR REPLACE INTO meta VALUES ('seq', ?)", (str(seq),)
+                )
+            match event["type"]:
+                case "activity":
+                    connection.execute(
+                        "INSERT OR REPLACE INTO activities VALUES (?, ?)",
+                        (
+                            datetime.fromisoformat(event["time"]).isoformat(" "),
+                            event["label"],
+                        ),
+                    )
+                case "clear_activity":
+                    connection.execute("DELETE FROM activities")
+                    connection.execute("DELETE FROM activity_counts")
+                case "roll_up":
+                    before = datetime.fromisoformat(event["before"]).isoformat(" ")
+                    # The first 13 characters of a time are its hour
+                    connection.execute(
+                        "INSERT INTO activity_counts "
+                        "SELECT substr(time, 1, 13), label, COUNT(*) FROM activities "
+                        "WHERE time < ? GROUP BY 1, 2 "
+                        "ON CONFLICT (hour, label) "
+                        "DO UPDATE SET count = count + excluded.count",
+                        (before,),
+                    )
+                    connection.execute(
+                        "DELETE FROM activities WHERE time < ?", (before,)
+                    )
+                case "time_barked":
+                    connection.execute(
+                        "INSERT INTO bark_time VALUES (?, ?, ?) "
+                        "ON CONFLICT (day, device) "
+                        "DO UPDATE SET seconds = seconds + excluded.seconds",
+                        (
+                            _day_key(event["day"]),
+                            event.get("device", ""),
+                            event["seconds"],
+                        ),
+                    )
+                case "start":
+                    connection.execute(
+                        "INSERT OR REPLACE INTO meta VALUES ('start', ?)",
+                        (datetime.fromisoformat(event["time"]).isoformat(" "),),
+                    )
+                case "end":
+                    connection.execute(
+                        "INSERT OR REPLACE INTO sessions SELECT value, ? FROM meta "
+                        "WHERE key = 'start'",
+                        (datetime.fromisoformat(event["time"]).isoformat(" "),),
+                    )
+                    connection.execute("DELETE FROM meta WHERE key = 'start'")
+                case _:
+                    raise ValueError("Unknown recording event " + str(event["type"]))
+
+    def import_recording(self, recording: "Recording") -> None:
+        """Replace what the database holds with the whole state of `recording`."""
+        with self._connection as connection:
+            for table in ("sessions", "activities", "bark_time", "activity_counts"):
+                connection.execute(f"DELETE FROM {table}")
+            connection.executemany(
+                "INSERT INTO activities VALUES (?, ?)",
+                (
+                    (time.isoformat(" "), label)
+                    for time, label in recording.activity_tracker.items()
+                ),
+            )
+            connection.executemany(
+                "INSERT OR REPLACE INTO sessions VALUES (?, ?)",
+                (
+                    (start.isoformat(" "), None if end is None else end.isoformat(" "))
+                    for start, end in recording.start_end
+                ),
+            )
+            connection.executemany(
+                "INSERT INTO bark_time VALUES (?, ?, ?)",
+                (
+                    (_day_key(day), device, value.total_seconds())
+                    for day, devices in recording.time_barked_by_device.items()
+                    for device, value in devices.items()
+                ),
+            )
+            connection.executemany(
+                "INSERT INTO activity_counts VALUES (?, ?, ?)",
+                (
+                    (_hour_key(hour), label, count)
+                    for hour, counts in recording.rolled_up_activities.items()
+                    for label, count in counts.items()
+                ),
+            )
+            connection.execute("DELETE FROM meta WHERE key = 'start'")
+            if recording.start is not None:
+                connection.execute(
+                    "INSERT INTO meta VALUES ('start', ?)",
+                    (recording.start.isoformat(" "),),
+                )
+            connection.execute(
+                "INSERT OR REPLACE INTO meta VALUES ('seq', ?)", (str(recording.seq),)
+            )
+
+    def import_changes(self, recording: "Recording", changes: RecordingChanges) -> None:
+        """Store the rows of `recording` listed in `changes`, a merge changes the
+        state without going through `apply`."""
+        activities = recording.activity_tracker
+        with self._connection as connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO sessions VALUES (?, ?)",
+                (
+                    (start.isoformat(" "), None if end is None else end.isoformat(" "))
+                    for start, end in sorted(
+                        changes.sessions,
+                        key=lambda session: (session[0], session[1] or datetime.max),
+                    )
+                ),
+            )
+            connection.executemany(
+                "INSERT OR REPLACE INTO bark_time VALUES (?, ?, ?)",
+                (
+                    (
+                        _day_key(day),
+                        device,
+                        recording.time_barked_by_device[day][device].total_seconds(),
+                    )
+                    for day, device in changes.time_barked
+                ),
+            )
+            connection.executemany(
+                "INSERT OR REPLACE INTO activity_counts VALUES (?, ?, ?)",
+                (
+                    (_hour_key(hour), label, count)
+                    for hour in changes.rolled_up
+                    for label, count in recording.rolled_up_activities[hour].items()
+                ),
+            )
+            # Activities of the hours rolled up by the merge
+            connection.executemany(
+                "DELETE FROM activities WHERE time >= ? AND time < ?",
+                (
+                    (hour.isoformat(" "), (hour + timedelta(hours=1)).isoformat(" "))
+                    for hour in changes.rolled_up
+                ),
+            )
+            connection.executemany(
+                "INSERT OR REPLACE INTO activities VALUES (?, ?)",
+                (
+                    (time.isoformat(" "), activities[time])
+                    for time in changes.activities
+                    if time in activities
+                ),
+            )
+            connection.execute(
+                "INSERT OR REPLACE INTO meta VALUES ('seq', ?)", (str(recording.seq),)
+            )
+
+    @property
+    def start(self) -> Optional[datetime]:
+        row = self._connection.execute(
+            "SELECT value FROM meta WHERE key = 'start'"
+        ).fetchone()
+        return None if row is None else datetime.fromisoformat(row[0])
+
+    def sessions(
+        self, start: Optional[datetime] = None, end: Optional[datetime] = None
+    ) -> list[tuple[datetime, Optional[datetime]]]:
+        """Recording sessions started in [`start`, `end`), all of them by default."""
+        rows = self._connection.execute(
+            "SELECT start, end FROM sessions WHERE start >= ? AND start < ? "
+            "ORDER BY start",
+            (
+                "" if start is None else start.isoformat(" "),
+                "~" if end is None else end.isoformat(" "),
+            ),
+        )
+        return [
+            (
+                datetime.fromisoformat(row[0]),
+                None if row[1] is None else datetime.fromisoformat(row[1]),
+            )
+            for row in rows
+        ]
+
+    def activities(
+        self, start: Optional[datetime] = None, end: Optional[datetime] = None
+    ) -> list[tuple[datetime, str]]:
+        """Activities in [`start`, `end`), in time order, all of them by default."""
+        rows = self._connection.execute(
+            "SELECT time, label FROM activities WHERE time >= ? AND time < ? "
+            "ORDER BY time",
+            (
+                "" if start is None else start.isoformat(" "),
+                "~" if end is None else end.isoformat(" "),
+            ),
+        )
+        return [(datetime.fromisoformat(row[0]), row[1]) for row in rows]
+
+    def activities_of_day(self, day: date) -> list[tuple[datetime, str]]:
+        start = datetime.combine(day, datetime.min.time())
+        return self.activities(start, start + timedelta(days=1))
+
+    def activities_of_hour(self, hour: datetime) -> list[tuple[datetime, str]]:
+        """Activities in the hour starting at `hour`, minutes and seconds ignored."""
+        start = hour.replace(minute=0, second=0, microsecond=0)
+        return self.activities(start, start + timedelta(hours=1))
+
+    def activity_counts(self) -> dict[datetime, dict[str, int]]:
+        """Number of rolled up activities of each label by hour."""
+        counts: dict[datetime, dict[str, int]] = {}
+        for hour, label, count in self._connection.execute(
+            "SELECT hour, label, count FROM activity_counts ORDER BY hour"
+        ):
+            counts.setdefault(datetime.strptime(hour, "%Y-%m-%d %H"), {})[label] = count
+        return counts
+
+    def time_barked(
+        self, first_day: Optional[date] = None, last_day: Optional[date] = None
+    ) -> dict[str, timedelta]:
+        """Time barked on each day from `first_day` to `last_day` included, all the
+        days by default. Days are "%d-%m-%Y" strings like in `Recording`."""
+        rows = self._connection.execute(
+            "SELECT day, SUM(seconds) FROM bark_time WHERE day >= ? AND day <= ? "
+            "GROUP BY day ORDER BY day",
+            (
+                "" if first_day is None else first_day.isoformat(),
+                "~" if last_day is None else last_day.isoformat(),
+            ),
+        )
+        return {_day_name(row[0]): timedelta(seconds=row[1]) for row in rows}
+
+    def time_barked_by_device(self) -> dict[str, dict[str, timedelta]]:
+        """Time barked on each day by each device."""
+        time_barked: dict[str, dict[str, timedelta]] = {}
+        for day, device, seconds in self._connection.execute(
+            "SELECT day, device, seconds FROM bark_time ORDER BY day"
+        ):
+            time_barked.setdefault(_day_name(day), {})[device] = timedelta(
+                seconds=seconds
+            )
+        return time_barked
+
+    def time_barked_last_days(self, days: int = 7) -> timedelta:
+        """Total time barked over the last `days` days, today included."""
+        today = date.today()
+        return sum(
+            self.time_barked(today - timedelta(days=days - 1), today).values(),
+            timedelta(0),
+        )
@@ -0,0 +1,78 @@
+from functools import lru_cache
+from math import gcd
+
+import numpy as np
+
+
+@lru_cache(maxsize=8)
+def _polyphase_filter(up: int, down: int, half_length: int) -> np.ndarray:
+    """Low-pass filter for a rational resampling by `up / down`, split in phases.
+
+    Row `p` holds, in reverse order, the taps applied to the input samples for an
+    output sample falling on phase `p` of the upsampled signal.
+    """
+    cutoff = 1 / max(up, down)
+    t = np.arange(-half_length, half_length + 1)
+    taps = cutoff * np.sinc(cutoff * t) * np.kaiser(len(t), 5.0)
+    taps *= up / taps.sum()
+
+    taps_per_phase = -(-len(taps) // up)
+    taps = np.pad(taps, (0, taps_per_phase * up - len(taps)))
+    phases = taps.reshape(taps_per_phase, up).T
+    return np.ascontiguousarray(phases[:, ::-1], dtype=np.float32)
+
+
+class StreamingResampler:
+    """Resample a stream of audio chunks from `input_rate` to `output_rate`.
+
+    This is a rational polyphase FIR resampler. It keeps the end of the previous chunk
+    so that consecutive chunks are resampled without discontinuities, and each chunk
+    costs the same regardless of how long the stream has been running. Unlike
+    `scipy.signal.resample_poly`, the delay of the filter is not compensated: the
+    output lags by `filter_half_length * max(up, down) / down` output samples, which
+    is `filter_half_length` samples when downsampling.
+    """
+
+    def __init__(
+        self, input_rate: int, output_rate: int, filter_half_length: int = 10
+    ) -> None:
+        divisor = gcd(input_rate, output_rate)
+        self._up = output_rate // divisor
+        self._down = input_rate // divisor
+        self._phases = _polyphase_filter(
+            self._up, self._down, filter_half_length * max(self._up, self._down)
+        )
+        self._taps_per_phase = self._phases.shape[1]
+
+        self._history = np.zeros(self._taps_per_phase - 1, dtype=np.float32)
+        # Number of input samples received and output samples produced
+        self._consumed = 0
+        self._produced = 0
+
+    def process(self, samples: np.ndarray) -> np.ndarray:
+        """Resample the next chunk of the stream.
+
+        :return: the float32 output samples that can be computed with the input
+        received so far.
+        """
+        signal = np.concatenate((self._history, samples.astype(np.float32)))
+        # Index in the input stream of `signal[0]`
+        base = self._consumed - len(self._history)
+        self._consumed += len(samples)
+
+        # Output sample `n` needs the input up to `n * down // up`
+        end = -(-self._consumed * self._up // self._down)
+        outputs = np.arange(self._produced, end)
+        self._produced = end
+
+        position = outputs * self._down
+        last_inputs = position // self._up - base
+        windows = np.lib.stride_tricks.sliding_window_view(
+            signal, self._taps_per_phase
+        )[last_inputs - self._taps_per_phase + 1]
+        resampled = np.einsum(
+            "ij,ij->i", windows, self._phases[position % self._up], dtype=np.float32
+        )
+
+        self._history = signal[len(signal) - len(self._history) :].copy()
+        return resampled
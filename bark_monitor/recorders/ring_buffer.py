@@ -0,0 +1,75 @@
+import numpy as np
+
+
+class RingBuffer:
+    """A fixed capacity buffer holding the latest captured audio samples.
+
+    Every sample is stored twice, at `i` and `i + capacity`, so that the latest samples
+    are always contiguous in memory and can be read as views without copying them.
+    Views are only valid until the next `write`.
+    """
+
+    def __init__(self, capacity: int, dtype: type = np.int16) -> None:
+        if capacity <= 0:
+            raise ValueError("The capacity of a ring buffer must be positive")
+        self._capacity = capacity
+        self._data = np.zeros(2 * capacity, dtype=dtype)
+        self._written = 0
+
+    @property
+    def capacity(self) -> int:
+        return self._capacity
+
+    @property
+    def dtype(self) -> np.dtype:
+        return self._data.dtype
+
+    @property
+    def written(self) -> int:
+        """Total number of samples written since the creation of the buffer.
+
+        It is used as an absolute index in the stream of samples.
+        """
+        return self._written
+
+    def __len__(self) -> int:
+        return min(self._written, self._capacity)
+
+    def write(self, samples: np.ndarray) -> None:
+        n = len(samples)
+        if n > self._capacity:
+            # Only the end of `samples` fits in the buffer
+            self._written += n - self._capacity
+            samples = samples[-self._capacity :]
+            n = self._capacity
+
+        start = self._written % self._capacity
+        first = min(n, self._capacity - start)
+        self._data[start : start + first] = samples[:first]
+        self._data[start + self._capacity : start + self._capacity + first] = samples[
+            :first
+        ]
+        rest = n - first
+        if rest > 0:
+            self._data[:rest] = samples[first:]
+            self._data[self._capacity : self._capacity + rest] = samples[first:]
+        self._written += n
+
+    def latest(self, n: int) -> np.ndarray:
+        """Read-only view on the last `n` samples written."""
+        if n > len(self):
+            raise ValueError(
+                f"Cannot read {n} samples from a buffer holding {len(self)} samples"
+            )
+        end = self._written % self._capacity + self._capacity
+        view = self._data[end - n : end]
+        view.flags.writeable = False
+        return view
+
+    def since(self, index: int) -> np.ndarray:
+        """Read-only view on the samples written since the absolute `index`.
+
+        If some of those samples were already overwritten, only the ones still in the
+        buffer are returned.
+        """
+        return self.latest(max(0, min(self._written - index, len(self))))
@@ -0,0 +1,243 @@
+import json
+import logging
+import threading
+from collections import deque
+from pathlib import Path
+from time import time
+from typing import Optional
+
+import requests
+
+from bark_monitor import metrics
+from bark_monitor.recorders.journal import write_atomic
+
+_send_time = metrics.registry.histogram(
+    "bark_monitor_telemetry_send_seconds", "Time of a request to the telemetry server"
+)
+
+
+class TelemetrySpool:
+    """Bounded queue of telemetry records on disk, stored as one JSON object per line
+    in `path`.
+
+    When more than `max_records` records are spooled, the oldest ones are dropped.
+    """
+
+    def __init__(self, path: Path, max_records: int = 10000) -> None:
+        self._path = path
+        self._max_records = max_records
+        self._records = 0
+        self._dropped = 0
+        if path.exists():
+            self._records = len(self.read())
+
+    def __len__(self) -> int:
+        return self._records
+
+    @property
+    def dropped(self) -> int:
+        return self._dropped
+
+    def append(self, records: list[dict]) -> None:
+        with open(self._path, "a") as file:
+            for record in records:
+                file.write(json.dumps(record) + "\n")
+        self._records += len(records)
+        if self._records > self._max_records:
+            self._dropped += self._records - self._max_records
+            self._rewrite(self.read()[-self._max_records :])
+
+    def read(self) -> list[dict]:
+        """The spooled records, oldest first. A line cut by a crash is ignored."""
+        if not self._path.exists():
+            return []
+        records = []
+        with open(self._path, "r") as file:
+            for line in file:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue
+        return records
+
+    def remove(self, count: int) -> None:
+        """Remove the `count` oldest records."""
+        self._rewrite(self.read()[count:])
+
+    def _rewrite(self, records: list[dict]) -> None:
+        if len(records) == 0:
+            self._path.unlink(missing_ok=True)
+        else:
+            write_atomic(
+                self._path, "".join(json.dumps(record) + "\n" for record in records)
+            )
+        self._records = len(records)
+
+
+class TelemetryExporter:
+    """Send telemetry to a ThingsBoard `url` from a background thread.
+
+    `export` only queues the values with their time, so that the audio loop never
+    waits on the network. Every `flush_seconds`, or as soon as `batch_size` values are
+    queued, a worker thread sends them in one request in the timestamped format of
+    ThingsBoard, `[{"ts": <ms>, "values": {...}}, ...]`, through a keep-alive session.
+    Requests time out after `timeout_seconds`.
+
+    While the server cannot be reached, the batches are spooled to `spool_path`, up to
+    `spool_max_records` values, and sent again in order once it answers.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        spool_path: Path,
+        batch_size: int = 50,
+        flush_seconds: float = 10,
+        timeout_seconds: float = 5,
+        spool_max_records: int = 10000,
+    ) -> None:
+        self._url = url
+        self._batch_size = batch_size
+        self._flush_seconds = flush_seconds
+        self._timeout_seconds = timeout_seconds
+        self._session = requests.Session()
+        self._spool = TelemetrySpool(spool_path, spool_max_records)
+
+        self._condition = threading.Condition()
+        # Values waiting for the next batch, bounded in case the worker is stuck
+        self._pending: deque[dict] = deque(maxlen=spool_max_records)
+        self._closing = False
+        self._t: Optional[threading.Thread] = None
+        self._bark_logger = logging.getLogger("bark_monitor")
+
+        self._sent = 0
+        self._rejected = 0
+        self._failed_requests = 0
+
+        metrics.registry.gauge(
+            "bark_monitor_telemetry_spooled",
+            "Telemetry values waiting on disk for the server to answer",
+            lambda: self.spooled,
+        )
+        metrics.registry.gauge(
+            "bark_monitor_telemetry_failed_requests_total",
+            "Requests to the telemetry server that failed",
+            lambda: self.failed_requests,
+            kind="counter",
+        )
+
+    @property
+    def sent(self) -> int:
+        """Number of values received by the server."""
+        return self._sent
+
+    @property
+    def rejected(self) -> int:
+        """Number of values refused by the server as invalid."""
+        return self._rejected
+
+    @property
+    def failed_requests(self) -> int:
+        return self._failed_requests
+
+    @property
+    def spooled(self) -> int:
+        """Number of values waiting on disk for the server to answer."""
+        return len(self._spool)
+
+    @property
+    def dropped(self) -> int:
+        """Number of values dropped because the spool was full."""
+        return self._spool.dropped
+
+    def start(self) -> None:
+        if self._t is not None:
+            return
+        self._closing = False
+        self._t = threading.Thread(target=self._run, daemon=True)
+        self._t.start()
+
+    def stop(self) -> None:
+        """Send the queued values, or spool them, and stop the worker."""
+        if self._t is None:
+            return
+        with self._condition:
+            self._closing = True
+            self._condition.notify()
+        self._t.join()
+        self._t = None
+
+    def export(self, values: dict) -> None:
+        """Queue `values` to be sent with the current time."""
+        with self._condition:
+            self._pending.append({"ts": int(time() * 1000), "values": values})
+            if len(self._pending) >= self._batch_size:
+                self._condition.notify()
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                if len(self._pending) < self._batch_size and not self._closing:
+                    self._condition.wait(self._flush_seconds)
+                batch = list(self._pending)
+                self._pending.clear()
+                closing = self._closing
+            try:
+                self._flush(batch)
+            except Exception as e:
+                self._bark_logger.error("Error while exporting telemetry: " + str(e))
+            if closing:
+                return
+
+    def _flush(self, batch: list[dict]) -> None:
+        """Send `batch` after the spooled values, spooling what cannot be sent."""
+        if len(self._spool) > 0:
+            # Keep the values in order, behind the spooled ones
+            self._spool.append(batch)
+            self._replay()
+            return
+        for start in range(0, len(batch), self._batch_size):
+            if not self._post(batch[start : start + self._batch_size]):
+                self._spool.append(batch[start:])
+                return
+
+    def _replay(self) -> None:
+        records = self._spool.read()
+        sent = 0
+        while sent < len(records):
+            if not self._post(records[sent : sent + self._batch_size]):
+                break
+            sent += self._batch_size
+        sent = min(sent, len(records))
+        if sent > 0:
+            self._spool.remove(sent)
+            self._bark_logger.info(f"Sent {sent} spooled telemetry values")
+
+    def _post(self, records: list[dict]) -> bool:
+        """Send `records` in one request.
+
+        :return: True if the server received them, or rejected them as invalid.
+        """
+        try:
+            with _send_time.time():
+                response = self._session.post(
+                    self._url, json=records, timeout=self._timeout_seconds
+                )
+            if response.ok:
+                self._sent += len(records)
+                return True
+            if response.status_code < 500 and response.status_code not in (408, 429):
+                # Sending the same values again would not help
+                self._rejected += len(records)
+                self._bark_logger.error(
+                    "Telemetry rejected by " + self._url + ": " + response.text
+                )
+                return True
+            error = "HTTP " + str(response.status_code)
+        except requests.RequestException as e:
+            error = str(e)
+        self._failed_requests += 1
+        self._bark_logger.warning(
+            "Error " + error + " sending telemetry to " + self._url
+        )
+        return False
@@ -1,23 +1,58 @@
 import csv
-import logging
-import tempfile
 from abc import abstractmethod
+from collections import deque
 from datetime import datetime, timedelta
 from pathlib import Path
+from time import perf_counter
 from typing import Optional
 
 import numpy as np
-import requests
 import scipy
 import tensorflow as tf
 
+from bark_monitor import metrics
+from bark_monitor.recorders.amplitude import EnergyGate
 from bark_monitor.recorders.base_recorder import BaseRecorder
+from bark_monitor.recorders.clip_writer import read_clip
+from bark_monitor.recorders.detection_runs import DetectionRuns
 from bark_monitor.recorders.recording import Recording
+from bark_monitor.recorders.resampler import StreamingResampler
+from bark_monitor.recorders.ring_buffer import RingBuffer
+from bark_monitor.recorders.telemetry import TelemetryExporter
+from bark_monitor.tracing import tracer
+
+_inference_time = metrics.registry.histogram(
+    "bark_monitor_inference_seconds", "Time to score a window with the neural network"
+)
+_analysis_time = metrics.registry.histogram(
+    "bark_monitor_analysis_seconds", "Time to analyse a window of audio"
+)
+_resample_time = metrics.registry.histogram(
+    "bark_monitor_resample_seconds",
+    "Time to resample a captured chunk to the rate of the neural network",
+)
+_window_buffer_time = metrics.registry.histogram(
+    "bark_monitor_window_buffer_seconds",
+    "Time to write a resampled chunk to the buffer of the windows",
+)
+_gate_time = metrics.registry.histogram(
+    "bark_monitor_energy_gate_seconds", "Time to check the energy gate on a window"
+)
 
 
 class WaveRecorder(BaseRecorder):
     """A recorder that records a wav file"""
 
+    # Sample rate of the waveforms given to `_scores`
+    _nn_rate = 16000
+    # Number of samples at `_nn_rate` analysed by `_scores`, None if it depends on
+    # the sampling time
+    _window_size: Optional[int] = None
+    # Names of the classes scored by `_scores`
+    _labels: list[str]
+    # Label of the windows that do not pass the energy gate
+    _gated_label = "Silence"
+
     def __init__(
         self,
         output_folder: str,
@@ -25,6 +60,11 @@ class WaveRecorder(BaseRecorder):
         http_url: Optional[str] = None,
         framerate: int = 16000,
         chunk: int = 4096,
+        hop_seconds: Optional[float] = None,
+        score_smoothing: float = 0,
+        energy_gate: bool = False,
+        gate_margin_db: float = 6,
+        **kwargs,
     ) -> None:
         """
         `api_key` is the key of telegram bot and `config_folder` is the folder with the
@@ -34,11 +74,61 @@ class WaveRecorder(BaseRecorder):
         `sampling_time_bark_seconds` on the recording---defaults to none, in which case
         the detection is run after every `self._chunk` samples have been collected
         instead.
+
+        Windows overlap if `hop_seconds`, the time between two detections, is shorter
+        than the window---defaults to none, in which case windows do not overlap. The
+        class scores of consecutive windows are smoothed with an exponential moving
+        average where `score_smoothing` in [0, 1) is the weight of the past
+        scores---defaults to 0, no smoothing.
+
+        If `energy_gate` is True, the neural network only runs on windows at least
+        `gate_margin_db` louder than the background noise. If `http_url` is given, the
+        animal labels detected in each window are sent there as ThingsBoard telemetry,
+        in batches from a background thread. Other keyword arguments are passed to
+        `BaseRecorder`.
         """
         self._sampling_time_bark_seconds = sampling_time_bark_seconds
+        if self._window_size is None:
+            self._window_size = (
+                chunk * self._nn_rate // framerate
+                if sampling_time_bark_seconds is None
+                else sampling_time_bark_seconds * self._nn_rate
+            )
+        self._hop_size = (
+            self._window_size
+            if hop_seconds is None
+            else min(self._window_size, int(hop_seconds * self._nn_rate))
+        )
+        if self._hop_size <= 0:
+            raise ValueError("The hop between two detections must be positive")
+        if not 0 <= score_smoothing < 1:
+            raise ValueError("The score smoothing must be in [0, 1)")
+        self._score_smoothing = score_smoothing
+        self._smoothed_scores: Optional[np.ndarray] = None
+        self._gate = EnergyGate(gate_margin_db) if energy_gate else None
+
+        # Captured audio resampled for the detection. All the overlapping windows are
+        # views on that one buffer.
+        self._nn_buffer = RingBuffer(
+            2 * self._window_size + chunk * self._nn_rate // framerate,
+            dtype=np.float32,
+        )
+        self._resampler: Optional[StreamingResampler] = None
+        # Number of samples written in `self._nn_buffer` since the last detection
+        self._nn_samples = 0
+        # Consecutive windows in which an animal is detected make one activity
+        self._runs = DetectionRuns(self._window_size, self._hop_size)
+        self._telemetry = (
+            TelemetryExporter(http_url, Path(output_folder, "telemetry.spool"))
+            if http_url is not None
+            else None
+        )
 
-        self._nn_frames: list[bytes] = []
-        self._http_url = http_url
+        # Duration in seconds of the last calls to `_scores` and of the whole analysis
+        # of the last windows
+        self._inference_times: deque[float] = deque(maxlen=100)
+        self._analysis_times: deque[float] = deque(maxlen=100)
+        self._windows_analysed = 0
 
         self._animal_labels = [
             "Animal",
@@ -59,6 +149,18 @@ class WaveRecorder(BaseRecorder):
             output_folder=output_folder,
             framerate=framerate,
             chunk=chunk,
+            **kwargs,
+        )
+
+        metrics.registry.gauge(
+            "bark_monitor_real_time_factor",
+            "Mean time to analyse a window divided by the hop between windows",
+            lambda: self.real_time_factor,
+        )
+        metrics.registry.gauge(
+            "bark_monitor_energy_gate_skip_rate",
+            "Ratio of the windows on which the neural network did not run",
+            lambda: self.gate_skip_rate,
         )
 
     @staticmethod
@@ -83,86 +185,231 @@ class WaveRecorder(BaseRecorder):
             waveform = scipy.signal.resample(waveform, desired_length)
         return desired_sample_rate, waveform
 
+    @staticmethod
+    def to_waveform(sample_rate: int, samples: np.ndarray) -> np.ndarray:
+        """Convert int16 `samples` recorded at `sample_rate` to the waveform expected
+        by `_detect`.
+
+        :return: a float32 waveform in [-1, 1] sampled at 16kHz.
+        """
+        _, samples = WaveRecorder.ensure_sample_rate(sample_rate, samples)
+        waveform = samples.astype(np.float32)
+        waveform /= np.iinfo(np.int16).max
+        return waveform
+
+    def detect_file(self, audio_file: Path) -> str:
+        """Run the detection on a recording saved in `audio_file`, in any of the
+        codecs used to save clips.
+
+        This is meant for offline analysis, the live recording never goes through the
+        disk.
+        """
+        sample_rate, samples = read_clip(audio_file)
+        return self._detect(WaveRecorder.to_waveform(sample_rate, samples))
+
     @abstractmethod
-    def _detect(self, wave_file: Path) -> str:
+    def _scores(self, waveform: np.ndarray) -> np.ndarray:
+        """Score the classes in `self._labels` for `waveform`, a float32 signal in
+        [-1, 1] sampled at 16kHz.
+
+        :return: one score per class.
+        """
         raise NotImplementedError()
 
+    def _detect(self, waveform: np.ndarray) -> str:
+        """Classify `waveform`, a float32 signal in [-1, 1] sampled at 16kHz."""
+        return self._labels[self._scores(waveform).argmax()]
+
+    def _smooth(self, scores: np.ndarray) -> np.ndarray:
+        if self._smoothed_scores is None or self._score_smoothing == 0:
+            self._smoothed_scores = scores
+        else:
+            self._smoothed_scores = (
+                self._score_smoothing * self._smoothed_scores
+                + (1 - self._score_smoothing) * scores
+            )
+        return self._smoothed_scores
+
+    @property
+    def _window_seconds(self) -> float:
+        assert self._window_size is not None
+        return self._window_size / self._nn_rate
+
+    @property
+    def _hop_seconds(self) -> float:
+        return self._hop_size / self._nn_rate
+
+    def _init(self) -> None:
+        super()._init()
+        self._reset_analysis()
+        if self._telemetry is not None:
+            self._telemetry.start()
+
+    def _resume(self) -> None:
+        self._reset_analysis()
+
+    def _reset_analysis(self) -> None:
+        """Forget the audio analysed so far, a new stream starts. The windows, the
+        resampler and the smoothed scores must not use the end of the last one."""
+        self._nn_buffer = RingBuffer(self._nn_buffer.capacity, dtype=np.float32)
+        self._resampler = (
+            StreamingResampler(self._fs, self._nn_rate)
+            if self._fs != self._nn_rate
+            else None
+        )
+        self._nn_samples = 0
+        self._smoothed_scores = None
+        self._runs.reset()
+
+    def stop(self) -> None:
+        super().stop()
+        if self._telemetry is not None:
+            self._telemetry.stop()
+
+    def _to_nn_rate(self, samples: np.ndarray) -> np.ndarray:
+        """Convert captured int16 `samples` to the waveform expected by `_detect`.
+
+        :return: a float32 waveform in [-1, 1] sampled at 16kHz.
+        """
+        if self._resampler is None:
+            waveform = samples.astype(np.float32)
+        else:
+            waveform = self._resampler.process(samples)
+        waveform /= np.iinfo(np.int16).max
+        return waveform
+
+    @property
+    def inference_latency(self) -> Optional[float]:
+        """Mean duration in seconds of the detection over the last windows."""
+        if len(self._inference_times) == 0:
+            return None
+        return sum(self._inference_times) / len(self._inference_times)
+
+    @property
+    def real_time_factor(self) -> Optional[float]:
+        """Mean time spent analysing a window divided by the hop between windows.
+
+        Above 1, the recorder cannot keep up with real time.
+        """
+        if len(self._analysis_times) == 0:
+            return None
+        return sum(self._analysis_times) / len(self._analysis_times) / self._hop_seconds
+
+    @property
+    def gate_skip_rate(self) -> Optional[float]:
+        """Ratio of the windows on which the neural network did not run."""
+        if self._gate is None:
+            return None
+        return self._gate.skip_rate
+
     def _record_loop(self) -> None:
         self._start_stream()
         self._bark_logger.info("Recording started")
 
-        assert self._stream is not None
-
-        while self.running:
-            if self.is_paused:
+        while self._wait_while_paused():
+            data = self._read()
+            if data is None:
                 continue
+            samples = self._capture(data)
+            with _resample_time.time(), tracer.span("resample"):
+                waveform = self._to_nn_rate(samples)
+            with _window_buffer_time.time():
+                self._nn_buffer.write(waveform)
+            self._nn_samples += len(waveform)
+
+            self._analyse_windows()
 
-            # Exception overflow is needed when running on the rpi
-            # Because processing is slow and frame can be lost.
-            data = self._stream.read(self._chunk, exception_on_overflow=False)
-            self._nn_frames.append(data)
-            duration = int((len(self._nn_frames) * self._chunk) / self._fs)
-
-            # Guard clause: do not run bark detection if recording time is less than
-            # `self._sampling_time_bark_seconds`
-            if (
-                self._sampling_time_bark_seconds is not None
-                and duration < self._sampling_time_bark_seconds
-            ):
+        self._stop_stream()
+
+    def _analyse_windows(self) -> None:
+        """Analyse every window ending on a hop in the samples captured since the last
+        detection.
+
+        Windows are read from the ring buffer without copying them. If the analysis
+        fell so much behind that some windows are not in the buffer anymore, they are
+        skipped.
+        """
+        assert self._window_size is not None
+        self._nn_samples = min(
+            self._nn_samples, self._nn_buffer.capacity - self._window_size
+        )
+        while self._nn_samples >= self._hop_size:
+            self._nn_samples -= self._hop_size
+            # The window ends `self._nn_samples` before the last captured sample
+            end = self._nn_samples
+            if len(self._nn_buffer) < self._window_size + end:
                 continue
 
-            with tempfile.TemporaryDirectory() as tmpdirname:
-                nn_recording = self._save_recording_to(
-                    self._nn_frames, Path(tmpdirname, "rec.wav")
-                )
-                self._analyse_recording(nn_recording)
+            start = perf_counter()
+            self._analyse_recording(
+                self._nn_buffer.latest(self._window_size + end)[: self._window_size],
+                self._nn_buffer.written - end,
+            )
+            self._analysis_times.append(perf_counter() - start)
+            _analysis_time.observe(self._analysis_times[-1])
 
-            # remove temporary recording
-            self._nn_frames = []
+            self._windows_analysed += 1
+            if self._windows_analysed % 100 == 0:
+                message = f"real time factor {self.real_time_factor:.2f}"
+                if self._gate is not None:
+                    message += f", energy gate skip rate {self._gate.skip_rate:.2f}"
+                self._bark_logger.info(message)
 
-        self._stop_stream()
+    def _classify(self, waveform: np.ndarray) -> str:
+        is_open = True
+        if self._gate is not None:
+            with _gate_time.time():
+                is_open = self._gate.is_open(waveform)
+        if not is_open:
+            # The scores before a quiet window must not make the next one a detection
+            self._smoothed_scores = None
+            return self._gated_label
 
-    def _analyse_recording(self, nn_recording: Path) -> None:
-        label = self._detect(nn_recording)
+        start = perf_counter()
+        scores = self._scores(waveform)
+        self._inference_times.append(perf_counter() - start)
+        _inference_time.observe(self._inference_times[-1])
+        self._bark_logger.debug(
+            f"inference took {self._inference_times[-1] * 1000:.1f} ms"
+        )
+        return self._labels[self._smooth(scores).argmax()]
+
+    def _analyse_recording(self, waveform: np.ndarray, end: int) -> None:
+        """Analyse `waveform`, the window ending at the sample `end` of the stream
+        at 16kHz."""
+        with tracer.span("detect"):
+            label = self._classify(waveform)
         self._bark_logger.info("detected " + label)
 
         payload = dict.fromkeys(self._animal_labels, 0)
+        barked = self._runs.update(label in self._animal_labels, end)
 
         if label in self._animal_labels:
             payload[label] = 1
-            # notify
-            self._chat_bot.send_text("detected: " + label)
+            # notify once for the consecutive windows in which an animal is detected
+            if self._runs.started:
+                with tracer.span("notify"):
+                    self._chat_bot.send_detection(label)
 
-            # save all frame to make one large recording
-            self._frames += self._nn_frames
+            with tracer.span("state update"):
+                # extend the current clip, or start one, to make one large recording
+                self._start_clip(int(self._window_seconds * self._fs))
 
-            # increase time barked in state
-            recording = Recording.read(self.output_folder)
-            duration = timedelta(
-                seconds=(len(self._nn_frames) * self._chunk) / self._fs
-            )
-            recording.add_time_barked(duration)
-
-            # Log in activity logger
-            recording.add_activity(datetime.now(), label)
-
-        elif len(self._frames) > 0:
-            recording = Recording.read(self.output_folder)
-            label = ""
-            time = None
-            for key in recording.activity_tracker:
-                if time is None or time < key:
-                    time = key
-                    label = recording.activity_tracker[key]
-            self._save_recording(self._frames, label)
-            self._frames = []
-
-        try:
-            if self._http_url is not None:
-                requests.post(self._http_url, json=payload)
-        except Exception as e:
-            self._bark_logger = logging.getLogger("bark_monitor")
-            assert self._http_url is not None
-            self._bark_logger.error(
-                "Error " + str(e) + "sending data to http address: " + self._http_url
-            )
+                # increase time barked in state, without counting twice the samples of
+                # overlapping windows
+                recording = Recording.read(self.output_folder)
+                if barked > 0:
+                    recording.add_time_barked(timedelta(seconds=barked / self._nn_rate))
+
+                # Log in activity logger
+                if self._runs.started:
+                    recording.add_activity(datetime.now(), label)
+
+        elif self._is_clipping:
+            with tracer.span("save"):
+                last_activity = Recording.read(self.output_folder).last_activity()
+                self._end_clip("" if last_activity is None else last_activity[1])
+
+        if self._telemetry is not None:
+            with tracer.span("notify"):
+                self._telemetry.export(payload)
@@ -4,7 +4,6 @@ from typing import Optional
 
 import numpy as np
 import tensorflow as tf
-from scipy.io import wavfile
 
 from bark_monitor.recorders.wave_recorder import WaveRecorder
 
@@ -12,14 +11,33 @@ from bark_monitor.recorders.wave_recorder import WaveRecorder
 class YamnetLiteRecorder(WaveRecorder):
     """https://tfhub.dev/google/lite-model/yamnet/classification/tflite/1"""
 
+    # Number of samples at 16kHz expected by the model
+    _window_size = 15600
+
     def __init__(
         self,
         output_folder: str,
         http_url: Optional[str] = None,
         framerate: int = 16000,
+        num_threads: Optional[int] = None,
+        use_xnnpack: bool = True,
+        **kwargs,
     ) -> None:
+        """The interpreter runs on `num_threads` threads---defaults to TF lite's
+        choice---and uses the XNNPACK delegate if `use_xnnpack` is True. Other keyword
+        arguments are passed to `WaveRecorder`.
+        """
         model_path = Path("models", "lite-model_yamnet_classification_tflite_1.tflite")
-        self._interpreter = tf.lite.Interpreter(str(model_path))
+        op_resolver_type = (
+            tf.lite.experimental.OpResolverType.AUTO
+            if use_xnnpack
+            else tf.lite.experimental.OpResolverType.BUILTIN_WITHOUT_DEFAULT_DELEGATES
+        )
+        self._interpreter = tf.lite.Interpreter(
+            str(model_path),
+            num_threads=num_threads,
+            experimental_op_resolver_type=op_resolver_type,
+        )
         labels_file = zipfile.ZipFile(model_path).open("yamnet_label_list.txt")
         self._labels = [
             label.decode("utf-8").strip() for label in labels_file.readlines()
@@ -30,28 +48,28 @@ class YamnetLiteRecorder(WaveRecorder):
         output_details = self._interpreter.get_output_details()
         self._scores_output_index = output_details[0]["index"]
 
+        # The input shape never changes, tensors are allocated once
+        self._interpreter.resize_tensor_input(
+            self._waveform_input_index, [self._window_size], strict=True
+        )
+        self._interpreter.allocate_tensors()
+
         super().__init__(
             output_folder=output_folder,
             sampling_time_bark_seconds=None,
             http_url=http_url,
             framerate=framerate,
-            chunk=15600,
+            chunk=self._window_size,
+            **kwargs,
         )
 
-    def _detect(self, wave_file: Path) -> str:
-        sample_rate, wav_data = wavfile.read(wave_file, "rb")  # type: ignore
-        sample_rate, wav_data = WaveRecorder.ensure_sample_rate(sample_rate, wav_data)
-        waveform = wav_data / tf.int16.max
-
-        if waveform.shape[0] != self._chunk:
+    def _scores(self, waveform: np.ndarray) -> np.ndarray:
+        if waveform.shape[0] != self._window_size:
             raise RuntimeError("Wrong sample size for tf lite Yamnet model")
 
-        self._interpreter.resize_tensor_input(
-            self._waveform_input_index, [waveform.size], strict=True
-        )
-        self._interpreter.allocate_tensors()
-        self._interpreter.set_tensor(self._waveform_input_index, np.float32(waveform))
+        # Copy the waveform straight into the input buffer owned by the interpreter.
+        # The buffer must not be referenced anymore when calling `invoke`.
+        self._interpreter.tensor(self._waveform_input_index)()[:] = waveform
         self._interpreter.invoke()
         scores = self._interpreter.get_tensor(self._scores_output_index)
-
-        return self._labels[scores.argmax()]
+        return scores.mean(axis=0)
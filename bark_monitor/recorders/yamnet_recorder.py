@@ -1,9 +1,7 @@
-from pathlib import Path
 from typing import Optional
 
-import tensorflow as tf
+import numpy as np
 import tensorflow_hub as hub
-from scipy.io import wavfile
 
 from bark_monitor.recorders.wave_recorder import WaveRecorder
 
@@ -22,30 +20,29 @@ class YamnetRecorder(WaveRecorder):
         sampling_time_bark_seconds: int = 1,
         http_url: Optional[str] = None,
         framerate: int = 16000,
+        **kwargs,
     ) -> None:
         """
         `api_key` is the key of telegram bot and `config_folder` is the folder with the
         chats config for telegram bot. `output_folder` define where to save the
         recordings. If `accept_new_users` is True new users can register to the telegram
         bot---defaults to False. The ML model is run every `sampling_time_bark_seconds`
-        on the recording---defaults to 30.
+        on the recording---defaults to 30. Other keyword arguments are passed to
+        `WaveRecorder`.
         """
         self._model = hub.load("https://tfhub.dev/google/yamnet/1")
 
         class_map_path = self._model.class_map_path().numpy()
-        self._class_names = WaveRecorder.class_names_from_csv(class_map_path)
+        self._labels = WaveRecorder.class_names_from_csv(class_map_path)
 
         super().__init__(
             output_folder,
             sampling_time_bark_seconds,
             http_url,
             framerate,
+            **kwargs,
         )
 
-    def _detect(self, wave_file: Path) -> str:
-        sample_rate, wav_data = wavfile.read(wave_file, "rb")  # type: ignore
-        sample_rate, wav_data = WaveRecorder.ensure_sample_rate(sample_rate, wav_data)
-        waveform = wav_data / tf.int16.max
+    def _scores(self, waveform: np.ndarray) -> np.ndarray:
         scores, _, _ = self._model(waveform)
-        scores_np = scores.numpy()
-        return self._class_names[scores_np.mean(axis=0).argmax()]
+        return scores.numpy().mean(axis=0)
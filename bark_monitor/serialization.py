@@ -0,0 +1,40 @@
+import json
+from datetime import datetime, timedelta
+from typing import Any
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - json is only slower
+    orjson = None
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def dumps(data: dict) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, separators=(",", ":")).encode()
+
+
+def loads(encoded: str | bytes) -> Any:
+    if orjson is not None:
+        return orjson.loads(encoded)
+    return json.loads(encoded)
+
+
+def to_epoch(time: datetime) -> int:
+    """Microseconds from the epoch to the naive `time`.
+
+    Naive times are wall clock times, they are converted without timezone so that the
+    conversion is exact and does not depend on daylight saving time.
+    """
+    return (time - _EPOCH) // timedelta(microseconds=1)
+
+
+def from_epoch(microseconds: int) -> datetime:
+    return _EPOCH + timedelta(microseconds=microseconds)
+
+
+def is_jsonpickle(data: Any) -> bool:
+    """True if `data`, decoded from JSON, was written by jsonpickle."""
+    return isinstance(data, dict) and "py/object" in data
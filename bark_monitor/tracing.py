@@ -0,0 +1,137 @@
+import json
+import os
+import threading
+import tracemalloc
+from collections import deque
+from contextlib import AbstractContextManager, nullcontext
+from pathlib import Path
+from time import perf_counter_ns
+from typing import Optional
+
+# Returned by `Tracer.span` when tracing is disabled, does nothing
+_NO_SPAN = nullcontext()
+
+
+class _Span(AbstractContextManager):
+    def __init__(self, tracer: "Tracer", name: str) -> None:
+        self._tracer = tracer
+        self._name = name
+        self._start = 0
+
+    def __enter__(self) -> "_Span":
+        self._start = perf_counter_ns()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self._tracer._record(self._name, self._start, perf_counter_ns() - self._start)
+
+
+class Tracer:
+    """Record how long each stage of the pipeline takes, to find out where the time
+    goes on a device that falls behind real time.
+
+    Stages are timed with `with tracer.span("name"):`. While the tracer is disabled,
+    `span` returns the same object that does nothing, so the spans can stay in the
+    record loop. Once enabled, the last `capacity` spans are kept in memory and
+    `dump` writes them in the Chrome trace format, which chrome://tracing and
+    https://ui.perfetto.dev open.
+
+    With `memory` tracing, the allocations are also traced with tracemalloc, which
+    slows down the whole program.
+    """
+
+    def __init__(self, capacity: int = 100000) -> None:
+        self._enabled = False
+        # Spans as (name, thread id, start, duration), in nanoseconds
+        self._spans: deque[tuple[str, int, int, int]] = deque(maxlen=capacity)
+
+    @property
+    def enabled(self) -> bool:
+        return self._enabled
+
+    @property
+    def memory(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def enable(self, memory: bool = False, frames: int = 1) -> None:
+        """Start recording spans, and allocations with `frames` frames of traceback
+        if `memory` is True."""
+        self._enabled = True
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+
+    def disable(self) -> None:
+        self._enabled = False
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def clear(self) -> None:
+        self._spans.clear()
+
+    def __len__(self) -> int:
+        return len(self._spans)
+
+    def span(self, name: str) -> AbstractContextManager:
+        """Context manager timing its block as the stage `name`."""
+        if not self._enabled:
+            return _NO_SPAN
+        return _Span(self, name)
+
+    def _record(self, name: str, start: int, duration: int) -> None:
+        # Appending to a deque is atomic, spans are recorded from any thread
+        self._spans.append((name, threading.get_ident(), start, duration))
+
+    def chrome_trace(self) -> dict:
+        """The recorded spans as a Chrome trace."""
+        pid = os.getpid()
+        thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+        spans = list(self._spans)
+        events: list[dict] = [
+            {
+                "name": "thread_name",
+                "ph": "M",
+                "pid": pid,
+                "tid": tid,
+                "args": {"name": thread_names.get(tid, str(tid))},
+            }
+            for tid in sorted({span[1] for span in spans})
+        ]
+        events.extend(
+            {
+                "name": name,
+                "ph": "X",
+                "pid": pid,
+                "tid": tid,
+                "ts": start / 1000,
+                "dur": duration / 1000,
+            }
+            for name, tid, start, duration in spans
+        )
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def dump(self, path: Path) -> Path:
+        """Write the recorded spans to `path` in the Chrome trace format.
+
+        :return: `path`
+        """
+        with open(path, "w") as file:
+            json.dump(self.chrome_trace(), file)
+        return path
+
+    def top_allocations(self, limit: int = 10) -> Optional[str]:
+        """The lines of code holding the most allocated memory, None if memory is not
+        traced."""
+        if not tracemalloc.is_tracing():
+            return None
+        statistics = tracemalloc.take_snapshot().statistics("lineno")
+        lines = []
+        for statistic in statistics[:limit]:
+            frame = statistic.traceback[0]
+            lines.append(
+                f"{frame.filename}:{frame.lineno}: {statistic.size / 1024:.1f} kB "
+                + f"in {statistic.count} blocks"
+            )
+        return "\n".join(lines)
+
+
+tracer = Tracer()
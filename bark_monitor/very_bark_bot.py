@@ -1,11 +1,10 @@
-from datetime import timedelta
+from datetime import date, datetime, timedelta
 from enum import Enum
 from pathlib import Path
 from typing import Optional
 
 import oauth2client.client
-import requests
-from telegram import Update
+from telegram import Message, Update
 from telegram.ext import (
     ApplicationBuilder,
     CommandHandler,
@@ -15,14 +14,22 @@ from telegram.ext import (
     filters,
 )
 
+from bark_monitor import metrics
 from bark_monitor.chats import Chats
 from bark_monitor.google_sync import GoogleSync
+from bark_monitor.notifier import Notifier
+from bark_monitor.recorders.clip_catalog import Clip
+from bark_monitor.recorders.clip_writer import AudioCodec, codec_of
 from bark_monitor.recorders.recording import Recording
+from bark_monitor.tracing import tracer
 
 
 class Commands(Enum):
     help = "Display a help message"
-    activity = "Display the day activity of the pets"
+    activity = (
+        "Display the day activity of the pets. Add a date as dd-mm-YYYY to see the "
+        + "activity of another day"
+    )
     start = "Start the recorder"
     stop = "Stop the recorder"
     pause = "Pause the recorder"
@@ -35,10 +42,12 @@ class Commands(Enum):
     login = "Log in to google drive"
     audio = (
         "Send an audio file based on file name. If used without a file name, it "
-        + "will list the available files"
+        + "will list the available files, add a page number to see the next ones"
     )
 
     last = "Download last recording"
+    perf = "Performance of the recording pipeline"
+    trace = "Download the trace of the last stages of the recording pipeline"
 
     @staticmethod
     def help_message() -> str:
@@ -57,7 +66,20 @@ class VeryBarkBot:
         config_folder: str,
         accept_new_users: bool = False,
         google_creds: Optional[str] = None,
+        notification_queue_size: int = 100,
+        notification_timeout_seconds: float = 10,
+        notification_coalesce_seconds: float = 30,
+        notification_digest_seconds: Optional[float] = 3600,
+        chat_messages_per_minute: float = 20,
     ) -> None:
+        """Notifications sent by the recorder wait in a queue of
+        `notification_queue_size` messages and are sent in the background, each
+        request to Telegram timing out after `notification_timeout_seconds`.
+
+        Detections are merged into one message every `notification_coalesce_seconds`
+        and summed up in a digest every `notification_digest_seconds`. At most
+        `chat_messages_per_minute` messages are sent to each chat.
+        """
         self._api_key = api_key
 
         self._application = (
@@ -71,6 +93,15 @@ class VeryBarkBot:
 
         self._config_folder = config_folder
         self._google_cred = google_creds
+        self._notifier = Notifier(
+            api_key,
+            config_folder,
+            queue_size=notification_queue_size,
+            timeout_seconds=notification_timeout_seconds,
+            coalesce_seconds=notification_coalesce_seconds,
+            digest_seconds=notification_digest_seconds,
+            chat_messages_per_minute=chat_messages_per_minute,
+        )
 
         register_handler = CommandHandler("register", self.register)
         self._application.add_handler(register_handler)
@@ -99,6 +130,10 @@ class VeryBarkBot:
         self._application.add_handler(audio_handler)
         last_audio_handler = CommandHandler("last", self.last_audio)
         self._application.add_handler(last_audio_handler)
+        perf_handler = CommandHandler("perf", self.perf)
+        self._application.add_handler(perf_handler)
+        trace_handler = CommandHandler("trace", self.trace)
+        self._application.add_handler(trace_handler)
 
         conv_handler = ConversationHandler(
             entry_points=[CommandHandler("login", self.start_login_to_google_drive)],
@@ -129,17 +164,15 @@ class VeryBarkBot:
     def start(self, recorder: "BaseRecorder") -> None:
         self._recorder = recorder
 
-        chats = Chats.read(self._config_folder)
-        for chat in chats.chats:
-            url = (
-                f"https://api.telegram.org/"
-                f"bot{self._api_key}/"
-                f"sendMessage?chat_id={chat}&text=Bot is ready with "
-                + self._recorder.__class__.__name__
-            )
-            requests.get(url).json()
+        self._notifier.start()
+        self.send_text("Bot is ready with " + self._recorder.__class__.__name__)
         self._application.run_polling()
         self._stop_recorder_sync()
+        self._notifier.stop(timeout_seconds=10)
+
+    @property
+    def notifier(self) -> Notifier:
+        return self._notifier
 
     async def _is_recording(self, update: Update, signal_to_user: bool = True) -> bool:
         if not self._recorder.running:
@@ -229,7 +262,7 @@ class VeryBarkBot:
         ):
             return
 
-        self._recorder.is_paused = True
+        self._recorder.pause()
         await self._application.bot.send_message(
             chat_id=update.effective_chat.id,
             text="Recorder paused",
@@ -242,7 +275,7 @@ class VeryBarkBot:
         ):
             return
 
-        self._recorder.is_paused = False
+        self._recorder.unpause()
         await self._application.bot.send_message(
             chat_id=update.effective_chat.id,
             text="Recorder unpaused",
@@ -253,12 +286,7 @@ class VeryBarkBot:
         if not await self._is_registered(update.effective_chat.id, context):
             return
 
-        status = "The program is not recording. "
-
-        if await self._is_recording(update, signal_to_user=False):
-            status = "The program is recording. "
-            if self._recorder.is_paused:
-                status = "The program is paused. "
+        status = "The program is " + self._recorder.state.value + ". "
 
         connected_to_google = "Not connected to google"
         got_cred, _ = GoogleSync.get_cred()
@@ -281,13 +309,26 @@ class VeryBarkBot:
         if not await self._is_registered(update.effective_chat.id, context):
             return
 
+        day = None
+        assert update.message is not None
+        assert update.message.text is not None
+        split_command = update.message.text.split(" ", 1)
+        if len(split_command) > 1:
+            try:
+                day = datetime.strptime(split_command[1].strip(), "%d-%m-%Y").date()
+            except ValueError:
+                await update.message.reply_text(
+                    "Unknown date " + split_command[1] + ", use dd-mm-YYYY"
+                )
+                return
+
         recording = Recording.read(self._recorder.output_folder)
-        activities = recording.daily_activities_formated()
+        activities = recording.daily_activities_formated(day)
 
         if activities == "":
             await self._application.bot.send_message(
                 chat_id=update.effective_chat.id,
-                text="No activities today",
+                text="No activities today" if day is None else "No activities",
             )
             return
 
@@ -320,14 +361,13 @@ class VeryBarkBot:
         self.send_text("bark: " + str(intensity))
 
     def send_text(self, text: str) -> None:
-        chats = Chats.read(self._config_folder)
-        for chat in chats.chats:
-            url = (
-                f"https://api.telegram.org/"
-                f"bot{self._api_key}/"
-                f"sendMessage?chat_id={chat}&text=" + text
-            )
-            requests.get(url).json()
+        """Send `text` to the registered chats, without waiting for it to be sent."""
+        self._notifier.send(text)
+
+    def send_detection(self, label: str) -> None:
+        """Notify the registered chats that `label` was detected, together with the
+        other detections of the same time window."""
+        self._notifier.detect(label)
 
     def send_end_bark(self, time_barking: timedelta) -> None:
         self.send_text("barking stopped after: " + str(time_barking))
@@ -339,38 +379,57 @@ class VeryBarkBot:
         if not await self._is_registered(update.effective_chat.id, context):
             return
 
-        async def error_message_audio_file(update: Update) -> None:
-            assert update.message is not None
-            await update.message.reply_text("Recordings of today:")
-            for file in audio_folder.iterdir():
-                await update.message.reply_text("/audio " + file.name)
-
         assert update.message is not None
         assert update.message.text is not None
-        audio_folder = self._recorder.today_audio_folder
+        clips = self._recorder.catalog.of_day(date.today())
 
-        if not audio_folder.exists() or len(list(audio_folder.iterdir())) == 0:
+        if len(clips) == 0:
             await update.message.reply_text(
                 "No recording today. Your dog has been a good boy :3"
             )
             return
 
         split_command = update.message.text.split(" ", 1)
-        if len(split_command) == 1:
-            await update.message.reply_text("no file specified.")
-            await error_message_audio_file(update)
+        if len(split_command) == 1 or split_command[1].strip().isdigit():
+            page = 1 if len(split_command) == 1 else int(split_command[1])
+            await update.message.reply_text(self._clip_page(clips, page))
             return
 
-        audio_file = Path(audio_folder, split_command[1])
+        audio_file = Path(self._recorder.today_audio_folder, split_command[1])
         if not audio_file.exists():
             await update.message.reply_text(
-                "Audio file " + str(audio_file) + " does not exists."
+                "Audio file "
+                + str(audio_file)
+                + " does not exists.\n"
+                + self._clip_page(clips, 1)
             )
-            await error_message_audio_file(update)
             return
 
+        await self._reply_clip(update.message, audio_file)
+
+    @staticmethod
+    def _clip_page(clips: list[Clip], page: int, page_size: int = 20) -> str:
+        """List the `page`-th `page_size` clips of `clips`, in one message."""
+        pages = (len(clips) + page_size - 1) // page_size
+        page = min(max(page, 1), pages)
+        message = f"Recordings of today, page {page}/{pages}:\n"
+        for clip in clips[(page - 1) * page_size : page * page_size]:
+            message += f"/audio {clip.name} ({clip.duration:.0f} s)\n"
+        if page < pages:
+            message += f"Next page: /audio {page + 1}"
+        return message
+
+    @staticmethod
+    async def _reply_clip(message: Message, audio_file: Path) -> None:
+        """Send the clip in `audio_file` as is, in the way telegram plays its codec."""
+        codec = codec_of(audio_file)
         with open(audio_file, mode="rb") as audio:
-            await update.message.reply_audio(audio=audio)
+            if codec == AudioCodec.opus:
+                await message.reply_voice(voice=audio, filename=audio_file.name)
+            elif codec == AudioCodec.flac:
+                await message.reply_document(document=audio, filename=audio_file.name)
+            else:
+                await message.reply_audio(audio=audio)
 
     async def last_audio(
         self, update: Update, context: ContextTypes.DEFAULT_TYPE
@@ -380,12 +439,45 @@ class VeryBarkBot:
         if not await self._is_registered(update.effective_chat.id, context):
             return
 
-        audio_folder = self._recorder.today_audio_folder
-        audio_files = audio_folder.glob("*")
-        audio_file = max(audio_files, key=lambda p: p.stat().st_ctime)
+        clip = self._recorder.catalog.last()
+        if clip is None or not self._recorder.catalog.path(clip).exists():
+            await update.message.reply_text("No recording yet")
+            return
 
-        with open(audio_file, mode="rb") as audio:
-            await update.message.reply_audio(audio=audio)
+        await self._reply_clip(update.message, self._recorder.catalog.path(clip))
+
+    async def perf(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        assert update.effective_chat is not None
+        if not await self._is_registered(update.effective_chat.id, context):
+            return
+
+        await self._application.bot.send_message(
+            chat_id=update.effective_chat.id,
+            text=metrics.registry.summary(),
+        )
+
+    async def trace(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        assert update.message is not None
+        assert update.effective_chat is not None
+        if not await self._is_registered(update.effective_chat.id, context):
+            return
+
+        if not tracer.enabled:
+            await update.message.reply_text(
+                'Tracing is disabled, set "tracing" to true in the config'
+            )
+            return
+
+        path = tracer.dump(Path(self._recorder.output_folder, "trace.json"))
+        with open(path, mode="rb") as trace:
+            await update.message.reply_document(
+                document=trace,
+                filename=path.name,
+                caption="Open it in https://ui.perfetto.dev",
+            )
+        allocations = tracer.top_allocations()
+        if allocations is not None:
+            await update.message.reply_text("Top allocations:\n" + allocations)
 
     async def help(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         assert update.effective_chat is not None
@@ -0,0 +1,154 @@
+"""Benchmarks of the paths that decide whether the bark monitor keeps up with real
+time, run with pytest-benchmark from the root of the repository:
+
+```
+python -m pytest benchmarks --benchmark-autosave \
+    --benchmark-storage=benchmarks/results
+```
+
+Each run is saved as JSON in `benchmarks/results`, compare runs with
+`pytest-benchmark --storage benchmarks/results compare`, or fail a run that is more
+than 10% slower than the last one with
+`--benchmark-compare --benchmark-compare-fail=mean:10%`.
+
+The benchmarks of the neural networks are skipped when tensorflow or the models are
+not available, and the end-to-end benchmarks when pyaudio is not installed. Set
+`BARK_MONITOR_BENCHMARK_AUDIO` to a recorded clip to also measure the real time
+factor on real audio.
+"""
+
+import functools
+import os
+import tempfile
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Iterator
+from unittest import mock
+
+import numpy as np
+import pytest
+
+from bark_monitor.recorders.chunk_queue import ChunkQueue
+from bark_monitor.recorders.clip_writer import read_clip
+from bark_monitor.recorders.recording import Recording
+from bark_monitor.recorders.resampler import StreamingResampler
+
+if TYPE_CHECKING:
+    from bark_monitor.recorders.base_recorder import BaseRecorder
+
+LABELS = ["Bark", "Howl", "Growling", "Whimper (dog)", "Dog", "Animal"]
+
+EMPTY_STATE = (
+    b'{"version": 2, "seq": 0, "start": null, "sessions": [], "time_barked": {}, '
+    b'"labels": [], "activities": []}'
+)
+
+
+@pytest.fixture(autouse=True)
+def google_sync() -> Iterator[mock.MagicMock]:
+    """Nothing is read from or written to Google Drive."""
+    with mock.patch("bark_monitor.recorders.recording.GoogleSync") as google_sync:
+        google_sync.load_state.return_value = None
+        yield google_sync
+
+
+@pytest.fixture
+def output_folder() -> Iterator[Path]:
+    with tempfile.TemporaryDirectory() as folder:
+        yield Path(folder)
+        Recording.forget(folder)
+
+
+@functools.cache
+def _history(activities: int, device: int) -> Recording:
+    recording = Recording.decode(EMPTY_STATE)
+    recording._device = str(device)
+    first_day = datetime(2023, 1, 1) + timedelta(weeks=device)
+    per_day = 200
+    for day in range((activities + per_day - 1) // per_day):
+        start = first_day + timedelta(days=day, hours=8)
+        recording._start_end.append((start, start + timedelta(hours=10)))
+        recording._time_barked[start.strftime("%d-%m-%Y")] = {
+            str(device): timedelta(minutes=5)
+        }
+        for i in range(min(per_day, activities - day * per_day)):
+            time = start + timedelta(seconds=i * 180)
+            recording._activity_tracker[time] = LABELS[i % len(LABELS)]
+    return recording
+
+
+@pytest.fixture(scope="session")
+def history() -> Callable[..., Recording]:
+    """State of a device recording `activities` activities, 200 a day during 10 hour
+    sessions, starting one week after the previous device.
+
+    States are built once per run, they must not be modified.
+    """
+
+    def history(activities: int, device: int = 0) -> Recording:
+        return _history(activities, device)
+
+    return history
+
+
+@pytest.fixture(scope="session")
+def synthetic_audio() -> Callable[[float, int], np.ndarray]:
+    """Background noise with a half second bark every 5 seconds, as int16 samples."""
+
+    def synthetic_audio(seconds: float, framerate: int) -> np.ndarray:
+        generator = np.random.default_rng(0)
+        samples = generator.normal(0, 300, int(seconds * framerate))
+        time = np.arange(len(samples)) / framerate
+        barking = (time % 5) < 0.5
+        samples[barking] += 8000 * np.sin(2 * np.pi * 700 * time[barking])
+        return np.clip(samples, -32768, 32767).astype(np.int16)
+
+    return synthetic_audio
+
+
+@pytest.fixture(scope="session")
+def recorded_audio() -> Callable[[int], np.ndarray]:
+    """The clip in `BARK_MONITOR_BENCHMARK_AUDIO` resampled to a frame rate, as int16
+    samples."""
+
+    def recorded_audio(framerate: int) -> np.ndarray:
+        path = os.environ.get("BARK_MONITOR_BENCHMARK_AUDIO")
+        if path is None:
+            pytest.skip("BARK_MONITOR_BENCHMARK_AUDIO is not set")
+        sample_rate, samples = read_clip(Path(path))
+        if samples.ndim > 1:
+            samples = samples[:, 0]
+        if sample_rate != framerate:
+            resampled = StreamingResampler(sample_rate, framerate).process(samples)
+            samples = np.clip(resampled, -32768, 32767).astype(np.int16)
+        return samples
+
+    return recorded_audio
+
+
+@pytest.fixture
+def replay() -> Callable[["BaseRecorder", np.ndarray], None]:
+    """Run the record loop of a recorder on samples instead of a stream.
+
+    The chunks are queued before the loop starts, in a queue large enough to hold
+    all of them, and the loop stops once they are all analysed.
+    """
+
+    def replay(recorder: "BaseRecorder", samples: np.ndarray) -> None:
+        chunks = [
+            samples[start : start + recorder._chunk].tobytes()
+            for start in range(0, len(samples), recorder._chunk)
+        ]
+        recorder._queue = ChunkQueue(len(chunks))
+        recorder._chat_bot = mock.MagicMock()
+        recorder._start_stream = lambda: None
+        recorder._stop_stream = lambda: recorder._queue.clear()
+        recorder._wait_while_paused = lambda: len(recorder._queue) > 0
+        recorder._init()
+        for chunk in chunks:
+            recorder._queue.put(chunk)
+        recorder._record_loop()
+        if recorder._is_clipping:
+            recorder._end_clip()
+
+    return replay
@@ -0,0 +1,59 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from bark_monitor.recorders.amplitude import signal_to_intensity
+from bark_monitor.recorders.resampler import StreamingResampler
+
+
+def test_signal_to_intensity(benchmark, synthetic_audio) -> None:
+    """Intensity of a chunk as computed by `Recorder._signal_to_intensity`, which
+    only calls `signal_to_intensity`."""
+    data = synthetic_audio(1, 44100)[:4096].tobytes()
+    benchmark.extra_info["samples"] = 4096
+    benchmark(signal_to_intensity, data)
+
+
+def test_streaming_resampler(benchmark, synthetic_audio) -> None:
+    """Resampling of a chunk captured at 44.1kHz to the 16kHz of the networks."""
+    samples = synthetic_audio(1, 44100)[:4096]
+    resampler = StreamingResampler(44100, 16000)
+    benchmark.extra_info["samples"] = 4096
+    benchmark(resampler.process, samples)
+
+
+def test_ensure_sample_rate(benchmark, synthetic_audio) -> None:
+    """Resampling of a second of audio at 44.1kHz to 16kHz, used on clips."""
+    wave_recorder = pytest.importorskip("bark_monitor.recorders.wave_recorder")
+    samples = synthetic_audio(1, 44100)
+    benchmark.extra_info["samples"] = len(samples)
+    benchmark(wave_recorder.WaveRecorder.ensure_sample_rate, 44100, samples)
+
+
+def _window(synthetic_audio, size: int) -> np.ndarray:
+    waveform = synthetic_audio(1, 16000)[:size].astype(np.float32)
+    return waveform / np.iinfo(np.int16).max
+
+
+def test_yamnet_lite_detect(benchmark, synthetic_audio, output_folder: Path) -> None:
+    module = pytest.importorskip("bark_monitor.recorders.yamnet_lite_recorder")
+    if not Path("models", "lite-model_yamnet_classification_tflite_1.tflite").exists():
+        pytest.skip("The benchmarks must run from the root of the repository")
+    recorder = module.YamnetLiteRecorder(
+        str(output_folder), sync_interval_seconds=None, retention_days=None
+    )
+    waveform = _window(synthetic_audio, recorder._window_size)
+    benchmark.extra_info["window_seconds"] = len(waveform) / 16000
+    benchmark(recorder._detect, waveform)
+
+
+def test_yamnet_detect(benchmark, synthetic_audio, output_folder: Path) -> None:
+    """Needs to download the model from TensorFlow Hub."""
+    module = pytest.importorskip("bark_monitor.recorders.yamnet_recorder")
+    recorder = module.YamnetRecorder(
+        str(output_folder), sync_interval_seconds=None, retention_days=None
+    )
+    waveform = _window(synthetic_audio, 16000)
+    benchmark.extra_info["window_seconds"] = len(waveform) / 16000
+    benchmark(recorder._detect, waveform)
@@ -0,0 +1,62 @@
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import pytest
+
+if TYPE_CHECKING:
+    from bark_monitor.recorders.base_recorder import BaseRecorder
+
+
+def _amplitude(output_folder: Path) -> "BaseRecorder":
+    module = pytest.importorskip("bark_monitor.recorders.recorder")
+    return module.Recorder(
+        str(output_folder), sync_interval_seconds=None, retention_days=None
+    )
+
+
+def _yamnet_lite(output_folder: Path) -> "BaseRecorder":
+    module = pytest.importorskip("bark_monitor.recorders.yamnet_lite_recorder")
+    if not Path("models", "lite-model_yamnet_classification_tflite_1.tflite").exists():
+        pytest.skip("The benchmarks must run from the root of the repository")
+    return module.YamnetLiteRecorder(
+        str(output_folder), sync_interval_seconds=None, retention_days=None
+    )
+
+
+def _yamnet(output_folder: Path) -> "BaseRecorder":
+    module = pytest.importorskip("bark_monitor.recorders.yamnet_recorder")
+    return module.YamnetRecorder(
+        str(output_folder), sync_interval_seconds=None, retention_days=None
+    )
+
+
+RECORDERS = {"amplitude": _amplitude, "yamnet lite": _yamnet_lite, "yamnet": _yamnet}
+
+
+@pytest.mark.parametrize("audio", ["synthetic", "recorded"])
+@pytest.mark.parametrize("recorder_type", list(RECORDERS))
+def test_real_time_factor(
+    benchmark,
+    replay,
+    synthetic_audio,
+    recorded_audio,
+    output_folder: Path,
+    recorder_type: str,
+    audio: str,
+) -> None:
+    """Time the record loop takes to capture and analyse audio, from the queue of
+    captured chunks to the notifications and the clips.
+
+    The real time factor is the time divided by the duration of the audio, above 1
+    the recorder cannot keep up.
+    """
+    recorder = RECORDERS[recorder_type](output_folder)
+    if audio == "synthetic":
+        samples = synthetic_audio(60, recorder._fs)
+    else:
+        samples = recorded_audio(recorder._fs)
+    benchmark.pedantic(replay, args=(recorder, samples), rounds=3)
+
+    seconds = len(samples) / recorder._fs
+    benchmark.extra_info["audio_seconds"] = seconds
+    benchmark.extra_info["real_time_factor"] = benchmark.stats.stats.mean / seconds
@@ -0,0 +1,69 @@
+from pathlib import Path
+
+import pytest
+
+from bark_monitor.recorders.recording import Recording
+
+ACTIVITIES = [1000, 100000, 1000000]
+IDS = ["1k", "100k", "1M"]
+# Rounds of each benchmark, a round on a million activities takes seconds
+ROUNDS = {1000: 50, 100000: 5, 1000000: 3}
+
+
+def _copy(recording: Recording, output_folder: Path) -> Recording:
+    copy = Recording.decode(recording.encode())
+    copy._output_folder = output_folder
+    return copy
+
+
+@pytest.mark.parametrize("activities", ACTIVITIES, ids=IDS)
+def test_save(benchmark, history, output_folder: Path, activities: int) -> None:
+    recording = _copy(history(activities), output_folder)
+    benchmark.extra_info["activities"] = activities
+    benchmark.pedantic(recording.save, rounds=ROUNDS[activities])
+    benchmark.extra_info["bytes"] = recording._path.stat().st_size
+
+
+@pytest.mark.parametrize("activities", ACTIVITIES, ids=IDS)
+def test_read(benchmark, history, output_folder: Path, activities: int) -> None:
+    _copy(history(activities), output_folder).save()
+    benchmark.extra_info["activities"] = activities
+    recording = benchmark.pedantic(
+        Recording.read,
+        args=(output_folder,),
+        # Read from the disk every round, not from the cache
+        setup=lambda: Recording.forget(output_folder),
+        rounds=ROUNDS[activities],
+    )
+    assert len(recording.activity_tracker) == activities
+
+
+@pytest.mark.parametrize("activities", ACTIVITIES, ids=IDS)
+def test_merge(benchmark, history, output_folder: Path, activities: int) -> None:
+    """Merge the state of another device, which recorded as many activities, a week
+    later."""
+    other = history(activities, 1)
+    benchmark.extra_info["activities"] = activities
+    benchmark.pedantic(
+        Recording.merge,
+        setup=lambda: ((_copy(history(activities), output_folder), other), {}),
+        rounds=ROUNDS[activities],
+    )
+
+
+@pytest.mark.parametrize("devices", [3, 10])
+def test_merge_devices(benchmark, history, output_folder: Path, devices: int) -> None:
+    """Merge the states of `devices` devices, each with 100k activities and starting
+    a week after the previous one, as the first read of a shared state does."""
+    others = [history(100000, device) for device in range(1, devices)]
+    benchmark.extra_info["activities"] = 100000 * devices
+
+    def merge_all(recording: Recording) -> None:
+        for other in others:
+            recording.merge(other)
+
+    benchmark.pedantic(
+        merge_all,
+        setup=lambda: ((_copy(history(100000), output_folder),), {}),
+        rounds=3,
+    )
@@ -0,0 +1,102 @@
+import unittest
+
+import numpy as np
+
+from bark_monitor.recorders.amplitude import (
+    AmplitudeDetector,
+    EnergyGate,
+    NoiseFloor,
+    rms,
+    signal_to_intensity,
+)
+
+
+class TestAmplitude(unittest.TestCase):
+    def test_signal_to_intensity(self) -> None:
+        signal = np.array([3, -32768, 4, -4], dtype=np.int16).tobytes()
+        self.assertEqual(signal_to_intensity(signal, frames=1), 16384)
+        # The median of the frames
+        signal = np.repeat(np.array([1, -2, 30000], dtype=np.int16), 10).tobytes()
+        self.assertEqual(signal_to_intensity(signal, frames=3), 2)
+
+    def test_rms(self) -> None:
+        self.assertAlmostEqual(rms(np.full(10, -3, dtype=np.int16)), 3)
+        self.assertAlmostEqual(rms(np.array([3, -4], dtype=np.float32)), 12.5**0.5)
+        self.assertEqual(rms(np.zeros(0, dtype=np.float32)), 0)
+
+    def test_noise_floor(self) -> None:
+        noise_floor = NoiseFloor(rise=0.1, fall=0.5)
+        self.assertEqual(noise_floor.update(1), 1)
+        # A loud value barely moves the floor, a quiet one moves it quickly
+        self.assertAlmostEqual(noise_floor.update(11), 2)
+        self.assertAlmostEqual(noise_floor.update(0), 1)
+
+    def test_energy_gate(self) -> None:
+        gate = EnergyGate(margin_db=6, hangover=1)
+        rng = np.random.default_rng(0)
+        noise = rng.normal(0, 0.01, 1000).astype(np.float32)
+
+        # Without noise floor yet, the first window passes
+        self.assertTrue(gate.is_open(noise))
+        # Hangover
+        self.assertTrue(gate.is_open(noise))
+        for _ in range(9):
+            self.assertFalse(gate.is_open(noise))
+        self.assertTrue(gate.is_open(noise * 10))
+        self.assertTrue(gate.is_open(noise))
+        self.assertFalse(gate.is_open(noise))
+        self.assertEqual(gate.skipped, 10)
+        self.assertAlmostEqual(gate.skip_rate, 10 / 14)
+
+    def test_energy_gate_digital_silence(self) -> None:
+        gate = EnergyGate()
+        self.assertFalse(gate.is_open(np.zeros(1000, dtype=np.float32)))
+        self.assertEqual(gate.silent, 1)
+        self.assertIsNone(gate.noise_floor)
+
+    def test_amplitude_detector_hysteresis(self) -> None:
+        detector = AmplitudeDetector(on_ratio=2, off_ratio=1.5, minimum_level=100)
+        self.assertIsNone(detector.on_threshold)
+        self.assertFalse(detector.update(1000))
+        self.assertEqual(detector.on_threshold, 2000)
+        self.assertEqual(detector.off_threshold, 1500)
+
+        self.assertFalse(detector.update(1900))
+        self.assertTrue(detector.update(2500))
+        # Under the on threshold but above the off threshold, the event goes on
+        self.assertTrue(detector.update(1800))
+        self.assertFalse(detector.update(1000))
+        self.assertFalse(detector.update(1800))
+
+    def test_amplitude_detector_adapts(self) -> None:
+        detector = AmplitudeDetector(minimum_level=100)
+        detector.update(5000)
+        # The background gets quieter, the threshold follows
+        for _ in range(100):
+            detector.update(500)
+        self.assertTrue(detector.update(2000))
+
+        detector = AmplitudeDetector(minimum_level=100)
+        detector.update(500)
+        # The background gets louder, the threshold follows slowly
+        for _ in range(5000):
+            detector.update(5000)
+        self.assertFalse(detector.active)
+        self.assertGreater(detector.on_threshold, 5000)  # type: ignore
+
+    def test_amplitude_detector_click(self) -> None:
+        detector = AmplitudeDetector()
+        rng = np.random.default_rng(0)
+
+        def chunk(amplitude: float = 0) -> np.ndarray:
+            noise = rng.normal(0, 100, 4096)
+            noise += amplitude * np.sin(np.arange(4096) * 2 * np.pi * 700 / 44100)
+            return noise.astype(np.int16)
+
+        for _ in range(50):
+            self.assertFalse(detector.update(signal_to_intensity(chunk().tobytes())))
+        # A click of a few samples is not a bark
+        click = chunk()
+        click[1000:1003] = 30000
+        self.assertFalse(detector.update(signal_to_intensity(click.tobytes())))
+        self.assertTrue(detector.update(signal_to_intensity(chunk(1000).tobytes())))
@@ -0,0 +1,70 @@
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import jsonpickle
+
+from bark_monitor.chats import Chats
+
+
+class TestChats(unittest.TestCase):
+    def test_save_read(self) -> None:
+        with tempfile.TemporaryDirectory() as folder:
+            chats = Chats.read(folder)
+            self.assertEqual(chats.chats, set())
+            chats.add(mock.Mock(id=12))
+            chats.add(mock.Mock(id=-5))
+            self.assertEqual(Chats.read(folder).chats, {12, -5})
+
+    def test_cache(self) -> None:
+        with tempfile.TemporaryDirectory() as folder:
+            chats = Chats.read(folder)
+            self.assertIs(Chats.read(folder), chats)
+            chats.add(mock.Mock(id=1))
+            self.assertIs(Chats.read(folder), chats)
+
+            # A set being iterated is not modified by `add`
+            registered = chats.chats
+            chats.add(mock.Mock(id=2))
+            self.assertEqual(registered, {1})
+            self.assertEqual(Chats.read(folder).chats, {1, 2})
+
+            # The file is read again when it is modified by someone else
+            with open(Path(folder, "chats.json"), "w") as file:
+                file.write('{"version": 1, "chats": [1, 2, 3]}')
+            self.assertEqual(Chats.read(folder).chats, {1, 2, 3})
+
+    def test_read_jsonpickle(self) -> None:
+        with tempfile.TemporaryDirectory() as folder:
+            chats = Chats.read(folder)
+            chats.chats.add(7)
+            with open(Path(folder, "chats.json"), "w") as file:
+                file.write(jsonpickle.encode(chats, keys=False))  # type: ignore
+            self.assertEqual(Chats.read(folder).chats, {7})
+            # Saving converts to the current format
+            Chats.read(folder).save()
+            with open(Path(folder, "chats.json"), "rb") as file:
+                self.assertNotIn(b"py/object", file.read())
+            self.assertEqual(Chats.read(folder).chats, {7})
+
+    def test_read_jsonpickle_moved(self) -> None:
+        with tempfile.TemporaryDirectory() as root:
+            old_folder = Path(root, "old")
+            chats = Chats.read(str(old_folder))
+            chats.chats.add(7)
+            encoded = jsonpickle.encode(chats, keys=False)  # type: ignore
+            # The config folder moved, as on a snap refresh
+            folder = Path(root, "new")
+            old_folder.rename(folder)
+            with open(Path(folder, "chats.json"), "w") as file:
+                file.write(encoded)
+
+            Chats.read(str(folder)).add(mock.Mock(id=8))
+            self.assertFalse(old_folder.exists())
+            Chats._cache.clear()
+            self.assertEqual(Chats.read(str(folder)).chats, {7, 8})
+
+
+if __name__ == "__main__":
+    unittest.main()
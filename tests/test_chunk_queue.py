@@ -0,0 +1,41 @@
+import unittest
+
+from bark_monitor.recorders.chunk_queue import BackpressurePolicy, ChunkQueue
+
+
+class TestChunkQueue(unittest.TestCase):
+    def test_drop_oldest(self) -> None:
+        queue = ChunkQueue(2, BackpressurePolicy.drop_oldest)
+        for chunk in [b"aa", b"bb", b"cc"]:
+            queue.put(chunk)
+        self.assertEqual(queue.dropped_chunks, 1)
+        self.assertEqual(queue.dropped_frames, 1)
+        self.assertEqual(queue.get(0), b"bb")
+        self.assertEqual(queue.get(0), b"cc")
+        self.assertIsNone(queue.get(0))
+
+    def test_skip(self) -> None:
+        queue = ChunkQueue(2, BackpressurePolicy.skip, frame_size=1)
+        for chunk in [b"aa", b"bb", b"cc", b"dd"]:
+            queue.put(chunk)
+        self.assertEqual(queue.dropped_chunks, 2)
+        self.assertEqual(queue.dropped_frames, 4)
+        self.assertEqual(queue.get(0), b"aa")
+        self.assertEqual(queue.get(0), b"bb")
+
+    def test_coalesce(self) -> None:
+        queue = ChunkQueue(1, BackpressurePolicy.coalesce, coalesce_limit=2)
+        for chunk in [b"aa", b"bb", b"cc"]:
+            queue.put(chunk)
+        # The second chunk is merged, the third one makes the queued chunk too large
+        self.assertEqual(queue.coalesced_chunks, 1)
+        self.assertEqual(queue.dropped_chunks, 1)
+        self.assertEqual(queue.dropped_frames, 2)
+        self.assertEqual(queue.get(0), b"cc")
+
+    def test_from_name(self) -> None:
+        self.assertEqual(
+            BackpressurePolicy.from_name("coalesce"), BackpressurePolicy.coalesce
+        )
+        with self.assertRaises(ValueError):
+            BackpressurePolicy.from_name("unknown")
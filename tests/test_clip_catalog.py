@@ -0,0 +1,77 @@
+import tempfile
+import unittest
+from datetime import date, datetime
+from pathlib import Path
+
+import numpy as np
+
+from bark_monitor.recorders.clip_catalog import ClipCatalog
+from bark_monitor.recorders.clip_writer import ClipWriter
+
+
+class TestClipCatalog(unittest.TestCase):
+    def _write_clip(self, audio_folder: Path, name: str, seconds: float) -> Path:
+        path = Path(audio_folder, name[name.index(" ") + 1 : name.index("_")], name)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        writer = ClipWriter(path, 16000)
+        writer.write(np.zeros(int(seconds * 16000), dtype=np.int16))
+        return writer.close()
+
+    def test_add(self) -> None:
+        with tempfile.TemporaryDirectory() as folder:
+            audio_folder = Path(folder, "audio")
+            catalog = ClipCatalog(Path(folder, "clips.jsonl"), audio_folder)
+            self.assertIsNone(catalog.last())
+
+            path = self._write_clip(audio_folder, "Bark 01-02-2023_10-00-00.wav", 1)
+            clip = catalog.add(path, 1)
+            self.assertEqual(clip.path, Path("01-02-2023", path.name))
+            self.assertEqual(clip.start, datetime(2023, 2, 1, 10))
+            self.assertEqual(clip.label, "Bark")
+            self.assertEqual(clip.size, path.stat().st_size)
+            self.assertEqual(catalog.path(clip), path)
+
+            path = self._write_clip(audio_folder, " 02-02-2023_09-00-00.wav", 0.5)
+            catalog.add(path)
+            path = self._write_clip(audio_folder, "Howl 01-02-2023_11-00-00.wav", 2)
+            catalog.add(path, 2)
+
+            for loaded in (catalog, ClipCatalog(catalog._path, audio_folder)):
+                last = loaded.last()
+                assert last is not None
+                self.assertEqual(last.start, datetime(2023, 2, 2, 9))
+                self.assertEqual(last.label, "")
+                self.assertAlmostEqual(last.duration, 0.5)
+                self.assertEqual(
+                    [clip.label for clip in loaded.of_day(date(2023, 2, 1))],
+                    ["Bark", "Howl"],
+                )
+                self.assertEqual(
+                    len(
+                        loaded.between(
+                            datetime(2023, 2, 1, 10, 30), datetime(2023, 2, 2, 9)
+                        )
+                    ),
+                    1,
+                )
+
+    def test_rebuild(self) -> None:
+        with tempfile.TemporaryDirectory() as folder:
+            audio_folder = Path(folder, "audio")
+            self._write_clip(audio_folder, "Bark 01-02-2023_10-00-00.wav", 1)
+            self._write_clip(audio_folder, "Bark 01-02-2023_09-00-00.wav", 0.25)
+            Path(audio_folder, "01-02-2023", "notes.txt").touch()
+            Path(audio_folder, "01-02-2023", "Bark 01-02-2023_11.wav.part").touch()
+
+            catalog = ClipCatalog(Path(folder, "clips.jsonl"), audio_folder)
+            self.assertEqual(
+                [clip.duration for clip in catalog.of_day(date(2023, 2, 1))],
+                [0.25, 1],
+            )
+            self.assertEqual(
+                len(ClipCatalog(Path(folder, "clips.jsonl"), audio_folder)), 2
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+import shutil
+import tempfile
+import unittest
+import wave
+from pathlib import Path
+
+import numpy as np
+
+from bark_monitor.recorders.clip_writer import (
+    AudioCodec,
+    ClipWriter,
+    codec_of,
+    read_clip,
+)
+
+
+class TestClipWriter(unittest.TestCase):
+    def _read(self, path: Path) -> tuple[int, np.ndarray]:
+        with wave.open(str(path), "rb") as wf:
+            return wf.getframerate(), np.frombuffer(
+                wf.readframes(wf.getnframes()), dtype=np.int16
+            )
+
+    def test_write(self) -> None:
+        samples = np.arange(-5000, 5000, dtype=np.int16)
+        with tempfile.TemporaryDirectory() as folder:
+            path = Path(folder, "clip.wav")
+            writer = ClipWriter(path, 16000, fsync_seconds=0.1)
+            for chunk in np.split(samples, 10):
+                writer.write(chunk)
+            self.assertFalse(path.exists())
+            self.assertTrue(Path(folder, "clip.wav.part").exists())
+            self.assertAlmostEqual(writer.duration, len(samples) / 16000)
+
+            saved = writer.close(Path(folder, "Bark clip.wav"))
+            self.assertEqual(saved, Path(folder, "Bark clip.wav"))
+            self.assertEqual([p.name for p in Path(folder).iterdir()], [saved.name])
+            framerate, read = self._read(saved)
+            self.assertEqual(framerate, 16000)
+            np.testing.assert_array_equal(read, samples)
+
+    def test_recover(self) -> None:
+        samples = np.arange(1000, dtype=np.int16)
+        with tempfile.TemporaryDirectory() as folder:
+            day = Path(folder, "01-01-2024")
+            day.mkdir()
+            writer = ClipWriter(Path(day, "clip.wav"), 16000)
+            writer.write(samples)
+            # Crash with half a sample at the end of the file
+            writer._file.write(b"\x01")
+            writer._file.close()
+            Path(folder, "empty.wav.part").touch()
+
+            recovered = ClipWriter.recover(Path(folder))
+            self.assertEqual(recovered, [Path(day, "clip.wav")])
+            self.assertFalse(Path(folder, "empty.wav.part").exists())
+            _, read = self._read(recovered[0])
+            np.testing.assert_array_equal(read, samples)
+
+    def test_compressed(self) -> None:
+        samples = (np.sin(np.arange(16000) / 10) * 8000).astype(np.int16)
+        with tempfile.TemporaryDirectory() as folder:
+            for codec in (AudioCodec.flac, AudioCodec.opus):
+                path = Path(folder, "clip" + codec.suffix)
+                writer = ClipWriter(path, 16000, codec=codec)
+                for chunk in np.split(samples, 4):
+                    writer.write(chunk)
+                writer.close()
+                self.assertEqual(codec_of(path), codec)
+                self.assertLess(path.stat().st_size, samples.nbytes / 2)
+
+                framerate, read = read_clip(path)
+                self.assertEqual(framerate, 16000)
+                self.assertEqual(len(read), len(samples))
+                if codec == AudioCodec.flac:
+                    np.testing.assert_array_equal(read, samples)
+
+    def test_recover_compressed(self) -> None:
+        samples = (np.sin(np.arange(16000) / 10) * 8000).astype(np.int16)
+        with tempfile.TemporaryDirectory() as folder:
+            path = Path(folder, "clip.flac")
+            writer = ClipWriter(
+                Path(folder, "other.flac"),
+                16000,
+                fsync_seconds=0.1,
+                codec=AudioCodec.flac,
+            )
+            writer.write(samples)
+            # What is on disk if the program crashes before the clip is closed
+            shutil.copy(writer._part_path, Path(folder, "clip.flac.part"))
+            writer.close().unlink()
+
+            self.assertEqual(ClipWriter.recover(Path(folder)), [path])
+            _, read = read_clip(path)
+            self.assertGreater(len(read), 0)
+            np.testing.assert_array_equal(read, samples[: len(read)])
+
+    def test_codec_check(self) -> None:
+        AudioCodec.opus.check(16000)
+        with self.assertRaises(ValueError):
+            AudioCodec.opus.check(44100)
+        with self.assertRaises(ValueError):
+            AudioCodec.from_name("mp3")
+
+
+if __name__ == "__main__":
+    unittest.main()
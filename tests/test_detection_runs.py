@@ -0,0 +1,60 @@
+import unittest
+
+from bark_monitor.recorders.detection_runs import DetectionRuns
+
+
+class TestDetectionRuns(unittest.TestCase):
+    def _run(
+        self, window: int, hop: int, bark: tuple[int, int], windows: int
+    ) -> tuple[int, int]:
+        """`windows` windows of `window` samples every `hop` samples, positive if
+        they overlap `bark`.
+
+        :return: the samples counted as barked and the number of runs started.
+        """
+        runs = DetectionRuns(window, hop)
+        counted = 0
+        started = 0
+        for i in range(windows):
+            end = window + i * hop
+            start = end - window
+            counted += runs.update(start < bark[1] and bark[0] < end, end)
+            started += runs.started
+        return counted, started
+
+    def test_overlapping_windows(self) -> None:
+        # One second of bark, windows of 0.975 s every 0.25 s
+        counted, started = self._run(15600, 4000, (40000, 56000), 30)
+        self.assertEqual(started, 1)
+        # The 7 windows overlapping the bark count it within a hop on each side
+        self.assertGreaterEqual(counted, 16000)
+        self.assertLessEqual(counted, 16000 + 2 * 4000)
+
+    def test_disjoint_windows(self) -> None:
+        # Positive windows are counted whole when the windows do not overlap
+        counted, started = self._run(16000, 16000, (20000, 40000), 5)
+        self.assertEqual(counted, 2 * 16000)
+        self.assertEqual(started, 1)
+
+    def test_runs(self) -> None:
+        runs = DetectionRuns(4, 2)
+        self.assertEqual(runs.update(True, 4), 2)
+        self.assertTrue(runs.started)
+        self.assertEqual(runs.update(True, 6), 2)
+        self.assertFalse(runs.started)
+        self.assertTrue(runs.running)
+        self.assertEqual(runs.update(False, 8), 0)
+        self.assertFalse(runs.running)
+        # The negative window rules out the end of the previous positive one
+        self.assertEqual(runs.update(True, 10), 0)
+        self.assertTrue(runs.started)
+        self.assertEqual(runs.update(True, 12), 2)
+
+        runs.reset()
+        self.assertFalse(runs.running)
+        self.assertEqual(runs.update(True, 4), 2)
+        self.assertTrue(runs.started)
+
+
+if __name__ == "__main__":
+    unittest.main()
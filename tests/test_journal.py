@@ -0,0 +1,36 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from bark_monitor.recorders.journal import Journal, write_atomic
+
+
+class TestJournal(unittest.TestCase):
+    def test_events(self) -> None:
+        with tempfile.TemporaryDirectory() as folder:
+            journal = Journal(Path(folder, "journal"))
+            self.assertEqual(list(journal.events()), [])
+            for seq in range(1, 4):
+                journal.append(seq, {"value": seq * 10})
+            # A crash in the middle of an append
+            with open(journal.path, "a") as file:
+                file.write('{"seq": 4, "val')
+
+            self.assertEqual(
+                [event["value"] for event in journal.events()], [10, 20, 30]
+            )
+            self.assertEqual([event["seq"] for event in journal.events(after=2)], [3])
+            journal.clear()
+            self.assertFalse(journal.path.exists())
+
+    def test_write_atomic(self) -> None:
+        with tempfile.TemporaryDirectory() as folder:
+            path = Path(folder, "state.json")
+            write_atomic(path, "old")
+            write_atomic(path, "new")
+            self.assertEqual(path.read_text(), "new")
+            self.assertEqual([p.name for p in Path(folder).iterdir()], ["state.json"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+import unittest
+import urllib.error
+import urllib.request
+
+from bark_monitor import metrics
+from bark_monitor.metrics import MetricsRegistry, MetricsServer
+
+
+class TestMetrics(unittest.TestCase):
+    def test_histogram(self) -> None:
+        registry = MetricsRegistry()
+        histogram = registry.histogram("latency_seconds", "Latency", (0.1, 1))
+        self.assertIs(registry.histogram("latency_seconds", "Latency"), histogram)
+        self.assertIsNone(histogram.quantile(0.5))
+        for value in [0.05, 0.1, 0.5, 2]:
+            histogram.observe(value)
+        with histogram.time():
+            pass
+
+        self.assertEqual(histogram.count, 5)
+        self.assertAlmostEqual(histogram.sum, 2.65, places=2)
+        self.assertEqual(histogram.quantile(0.5), 0.1)
+        self.assertEqual(histogram.quantile(0.8), 1)
+        self.assertEqual(histogram.quantile(1), float("inf"))
+        self.assertIn(
+            'latency_seconds_bucket{le="0.1"} 3\n'
+            + 'latency_seconds_bucket{le="1"} 4\n'
+            + 'latency_seconds_bucket{le="+Inf"} 5\n',
+            registry.render(),
+        )
+
+    def test_render(self) -> None:
+        registry = MetricsRegistry()
+        registry.counter("windows_total", "Windows analysed").inc(3)
+        registry.gauge("queue_depth", "Queue depth", lambda: 2)
+        registry.gauge("real_time_factor", "Real time factor", lambda: None)
+        self.assertEqual(
+            registry.render(),
+            "# HELP queue_depth Queue depth\n"
+            + "# TYPE queue_depth gauge\n"
+            + "queue_depth 2\n"
+            + "# HELP real_time_factor Real time factor\n"
+            + "# TYPE real_time_factor gauge\n"
+            + "# HELP windows_total Windows analysed\n"
+            + "# TYPE windows_total counter\n"
+            + "windows_total 3.0\n",
+        )
+        self.assertEqual(registry.summary(), "queue_depth: 2\nwindows_total: 3")
+
+    def test_process(self) -> None:
+        text = metrics.registry.render()
+        self.assertIn("# TYPE process_cpu_seconds_total counter\n", text)
+        rss = next(
+            line
+            for line in text.splitlines()
+            if line.startswith("process_resident_memory_bytes ")
+        )
+        self.assertGreater(float(rss.split()[1]), 1e6)
+
+    def test_server(self) -> None:
+        registry = MetricsRegistry()
+        registry.counter("windows_total", "Windows analysed").inc()
+        server = MetricsServer(0, metrics=registry)
+        server.start()
+        try:
+            url = "http://127.0.0.1:" + str(server.port)
+            with urllib.request.urlopen(url + "/metrics") as response:
+                self.assertEqual(response.read().decode(), registry.render())
+            with self.assertRaises(urllib.error.HTTPError):
+                urllib.request.urlopen(url + "/other")
+        finally:
+            server.stop()
+
+
+if __name__ == "__main__":
+    unittest.main()
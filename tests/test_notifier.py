@@ -0,0 +1,165 @@
+import json
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+from bark_monitor.chats import Chats
+from bark_monitor.notifier import Notifier, TokenBucket
+
+
+class _TelegramStub(BaseHTTPRequestHandler):
+    """Answer the requests with the next status of `statuses`, 200 once empty."""
+
+    statuses: list[int] = []
+    messages: list[dict] = []
+
+    def do_POST(self) -> None:
+        length = int(self.headers["Content-Length"])
+        message = json.loads(self.rfile.read(length))
+        status = self.statuses.pop(0) if len(self.statuses) > 0 else 200
+        if status == 200:
+            self.messages.append(message)
+        body = json.dumps({"ok": status == 200, "parameters": {"retry_after": 0}})
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body.encode())
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+
+class TestNotifier(unittest.TestCase):
+    def setUp(self) -> None:
+        _TelegramStub.statuses = []
+        _TelegramStub.messages = []
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _TelegramStub)
+        threading.Thread(
+            target=self._server.serve_forever, args=(0.05,), daemon=True
+        ).start()
+        self._folder = tempfile.TemporaryDirectory()
+        chats = Chats.read(self._folder.name)
+        chats.add(mock.Mock(id=1))
+        chats.add(mock.Mock(id=2))
+
+    def tearDown(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+        self._folder.cleanup()
+
+    def _notifier(self, **kwargs) -> Notifier:
+        return Notifier(
+            "key",
+            self._folder.name,
+            api_url="http://127.0.0.1:" + str(self._server.server_port),
+            backoff_seconds=0,
+            **kwargs,
+        )
+
+    def test_send(self) -> None:
+        notifier = self._notifier()
+        notifier.start()
+        notifier.send("bark & howl")
+        notifier.send("bark")
+        notifier.stop()
+
+        self.assertEqual(notifier.sent, 4)
+        self.assertEqual(notifier.failed, 0)
+        self.assertEqual(notifier.queue_depth, 0)
+        self.assertIsNotNone(notifier.latency)
+        self.assertEqual(
+            sorted((m["chat_id"], m["text"]) for m in _TelegramStub.messages),
+            [(1, "bark"), (1, "bark & howl"), (2, "bark"), (2, "bark & howl")],
+        )
+
+    def test_retry(self) -> None:
+        _TelegramStub.statuses = [500, 429, 200, 500, 500, 500]
+        notifier = self._notifier(retries=2)
+        notifier.start()
+        notifier.send("bark")
+        # Retries are cancelled by `stop`
+        while notifier.sent + notifier.failed < 2:
+            time.sleep(0.01)
+        notifier.stop()
+
+        # The first chat gets the message on the third try, the second one after the
+        # retries run out
+        self.assertEqual(notifier.sent, 1)
+        self.assertEqual(notifier.failed, 1)
+        self.assertEqual(len(_TelegramStub.messages), 1)
+
+    def test_rejected(self) -> None:
+        _TelegramStub.statuses = [400]
+        notifier = self._notifier()
+        notifier.start()
+        notifier.send("bark")
+        notifier.stop()
+        self.assertEqual(notifier.sent, 1)
+        self.assertEqual(notifier.failed, 1)
+
+    def test_full_queue(self) -> None:
+        notifier = self._notifier(queue_size=2)
+        for i in range(5):
+            notifier.send(str(i))
+        self.assertEqual(notifier.queue_depth, 2)
+        self.assertEqual(notifier.dropped, 3)
+
+        notifier.start()
+        notifier.stop()
+        self.assertEqual(
+            sorted(m["text"] for m in _TelegramStub.messages), ["3", "3", "4", "4"]
+        )
+
+    def test_coalesce(self) -> None:
+        notifier = self._notifier(coalesce_seconds=0.2)
+        notifier.start()
+        for label in ["Bark", "Dog", "Bark", "Bark"]:
+            notifier.detect(label)
+        time.sleep(0.5)
+        notifier.detect("Howl")
+        notifier.stop()
+
+        # The last detection is sent when stopping
+        self.assertEqual(
+            sorted(m["text"] for m in _TelegramStub.messages if m["chat_id"] == 1),
+            ["Bark ×3, Dog ×1 over 0 s", "detected: Howl"],
+        )
+
+    def test_digest(self) -> None:
+        notifier = self._notifier(coalesce_seconds=10, digest_seconds=0.2)
+        notifier.start()
+        notifier.detect("Bark")
+        notifier.detect("Bark")
+        time.sleep(0.5)
+        notifier.stop()
+        self.assertEqual(
+            [m["text"] for m in _TelegramStub.messages if m["chat_id"] == 1],
+            ["Detections of the last 0 min: Bark ×2", "Bark ×2 over 0 s"],
+        )
+
+    def test_rate_limit(self) -> None:
+        notifier = self._notifier(chat_messages_per_minute=600)
+        notifier.start()
+        start = time.perf_counter()
+        for i in range(6):
+            notifier.send(str(i))
+        while notifier.sent < 12:
+            time.sleep(0.01)
+        notifier.stop()
+        # 3 messages are sent at once to each chat, the others at 10 per second
+        self.assertGreater(time.perf_counter() - start, 0.25)
+
+    def test_token_bucket(self) -> None:
+        bucket = TokenBucket(10, 2)
+        self.assertEqual(bucket.reserve(), 0)
+        self.assertEqual(bucket.reserve(), 0)
+        self.assertAlmostEqual(bucket.reserve(), 0.1, places=2)
+        self.assertAlmostEqual(bucket.reserve(), 0.2, places=2)
+
+
+if __name__ == "__main__":
+    unittest.main()
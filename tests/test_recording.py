@@ -1,17 +1,36 @@
+import shutil
+import tempfile
 import unittest
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from pathlib import Path
 from unittest import mock
 
-import jsonpickle
-
-from bark_monitor.recorders.recording import Recording
+from bark_monitor.recorders.recording import (
+    Recording,
+    RecordingRetention,
+    RecordingSync,
+)
 
 
 class TestRecording(unittest.TestCase):
+    def _fixture_folder(self) -> str:
+        """Copy of the recording state in tests/data, which the test may change.
+
+        :return: the folder of the copy.
+        """
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        self.addCleanup(Recording.forget, folder.name)
+        shutil.copy(Path("tests", "data", "recording.json"), folder.name)
+        return folder.name
+
     def test_goal(self) -> None:
-        recording = Recording.read("tests/data")
-        self.assertEqual(recording.time_barked, timedelta(23))
+        recording = Recording.read(self._fixture_folder())
+        # The time barked before it was counted by day is not barked today
+        self.assertEqual(recording.time_barked, timedelta(0))
+        self.assertEqual(
+            recording.all_time_barked, {Recording.legacy_day: timedelta(23)}
+        )
         self.assertEqual(len(recording.start_end), 1)
         self.assertEqual(
             recording.start_end[0],
@@ -38,19 +57,20 @@ class TestRecording(unittest.TestCase):
         )
 
     def test_activity(self) -> None:
-        recording = Recording.read("tests/data")
-        recording.output_folder = Path("tests/data")
+        folder = self._fixture_folder()
+        recording = Recording.read(folder)
+        recording.output_folder = Path(folder)
         recording.clear_activity()
         self.assertEqual(len(recording.activity_tracker), 0)
 
-        recording = Recording.read("tests/data")
+        recording = Recording.read(folder)
         self.assertEqual(len(recording.activity_tracker), 0)
         time = datetime(year=2023, month=1, day=1)
         recording.add_activity(time, "test activity")
         key = list(recording.activity_tracker.keys())[0]
         self.assertEqual(key, time)
 
-        recording = Recording.read("tests/data")
+        recording = Recording.read(folder)
         key = list(recording.activity_tracker.keys())[0]
         self.assertEqual(key, time)
 
@@ -58,15 +78,19 @@ class TestRecording(unittest.TestCase):
         recording.add_activity(time, "test activity")
         self.assertEqual(len(recording.activity_tracker), 2)
 
-        recording = Recording.read("tests/data")
+        recording = Recording.read(folder)
         self.assertEqual(len(recording.activity_tracker), 2)
 
     @mock.patch.object(Recording, "save", return_value="None")
     def test_merge(self, _: Recording) -> None:
-        with open("tests/data/recording.json", "r") as file:
+        with open("tests/data/recording.json", "rb") as file:
             lines = file.read()
-        state: "Recording" = jsonpickle.decode(lines, keys=True)
-        state2: "Recording" = jsonpickle.decode(lines, keys=True)
+        state = Recording.decode(lines)
+        state2 = Recording.decode(lines)
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        # The journal of the changes is written next to the state
+        state2._output_folder = Path(folder.name)
 
         state.merge(state2)
         self.assertEqual(len(state.start_end), 1)
@@ -76,3 +100,289 @@ class TestRecording(unittest.TestCase):
 
         state.merge(state2)
         self.assertEqual(len(state.start_end), 2)
+        self.assertEqual(state.all_time_barked, {Recording.legacy_day: timedelta(23)})
+
+    @mock.patch("bark_monitor.recorders.recording.GoogleSync")
+    def test_cache(self, google_sync: mock.MagicMock) -> None:
+        google_sync.load_state.return_value = None
+        with tempfile.TemporaryDirectory() as folder:
+            recording = Recording.read(folder)
+            recording.add_activity(datetime(year=2023, month=1, day=1), "Bark")
+            self.assertIs(Recording.read(folder), recording)
+            # Google Drive is only read once
+            google_sync.load_state.assert_called_once()
+            self.assertGreater(Recording.cache_hit_rate(), 0)  # type: ignore
+
+            Recording.forget(folder)
+            reloaded = Recording.read(folder)
+            self.assertIsNot(reloaded, recording)
+            self.assertEqual(reloaded.last_activity()[1], "Bark")  # type: ignore
+            Recording.forget(folder)
+
+    @mock.patch("bark_monitor.recorders.recording.GoogleSync")
+    def test_sync(self, google_sync: mock.MagicMock) -> None:
+        google_sync.load_state.return_value = None
+        with tempfile.TemporaryDirectory() as remote_folder:
+            remote = Recording.read(remote_folder)
+            remote.add_activity(datetime(year=2023, month=1, day=2), "Howl")
+            remote.save()
+            Recording.forget(remote_folder)
+            with open(Path(remote_folder, "recording.json"), "rb") as file:
+                remote_bytes = file.read()
+
+        with tempfile.TemporaryDirectory() as folder:
+            recording = Recording.read(folder)
+            google_sync.load_state.return_value = remote_bytes
+            sync = RecordingSync(folder)
+            sync.sync()
+            self.assertEqual(sync.syncs, 1)
+            self.assertEqual(recording.last_activity()[1], "Howl")  # type: ignore
+            google_sync.update_file.assert_called_once()
+            Recording.forget(folder)
+
+    @mock.patch("bark_monitor.recorders.recording.GoogleSync")
+    def test_journal(self, google_sync: mock.MagicMock) -> None:
+        google_sync.load_state.return_value = None
+        with tempfile.TemporaryDirectory() as folder:
+            recording = Recording.read(folder)
+            recording.start = datetime(year=2023, month=1, day=1)
+            recording.add_activity(datetime(year=2023, month=1, day=1, hour=1), "Bark")
+            recording.add_time_barked(timedelta(seconds=2), "01-01-2023")
+            recording.add_time_barked(timedelta(seconds=3), "01-01-2023")
+            # Changes are only in the journal
+            self.assertFalse(Path(folder, "recording.json").exists())
+            Recording.forget(folder)
+
+            recording = Recording.read(folder)
+            self.assertEqual(recording.start, datetime(year=2023, month=1, day=1))
+            self.assertEqual(recording.last_activity()[1], "Bark")  # type: ignore
+            self.assertEqual(
+                recording.all_time_barked["01-01-2023"], timedelta(seconds=5)
+            )
+
+            recording.end(datetime(year=2023, month=1, day=2))
+            recording.save()
+            self.assertFalse(Path(folder, "recording.journal").exists())
+            recording.add_activity(datetime(year=2023, month=1, day=3), "Howl")
+            Recording.forget(folder)
+
+            recording = Recording.read(folder)
+            self.assertEqual(len(recording.start_end), 1)
+            self.assertEqual(len(recording.activity_tracker), 2)
+            Recording.forget(folder)
+
+    @mock.patch("bark_monitor.recorders.recording.GoogleSync")
+    @mock.patch.object(Recording, "compact_every", 10)
+    def test_compaction(self, google_sync: mock.MagicMock) -> None:
+        google_sync.load_state.return_value = None
+        with tempfile.TemporaryDirectory() as folder:
+            recording = Recording.read(folder)
+            for i in range(25):
+                recording.add_time_barked(timedelta(seconds=1), "01-01-2023")
+            with open(Path(folder, "recording.journal")) as file:
+                self.assertEqual(len(file.readlines()), 5)
+            Recording.forget(folder)
+
+            recording = Recording.read(folder)
+            self.assertEqual(
+                recording.all_time_barked["01-01-2023"], timedelta(seconds=25)
+            )
+            Recording.forget(folder)
+
+    def test_encode(self) -> None:
+        with tempfile.TemporaryDirectory() as folder:
+            recording = Recording.decode(
+                b'{"version": 1, "seq": 0, "start": null, "sessions": [], '
+                b'"time_barked": {}, "labels": [], "activities": []}'
+            )
+            recording.output_folder = Path(folder)
+            recording.start = datetime(2023, 1, 1, microsecond=1)
+            recording.end(datetime(2023, 1, 1, 1))
+            recording.start = datetime(2023, 1, 2)
+            for hour in range(10):
+                recording.add_activity(
+                    datetime(2023, 1, 1, hour), ["Bark", "Howl"][hour % 2]
+                )
+            recording.add_time_barked(timedelta(seconds=1.5), "01-01-2023")
+
+            decoded = Recording.decode(recording.encode())
+            self.assertEqual(decoded.start, recording.start)
+            self.assertEqual(decoded.start_end, recording.start_end)
+            self.assertEqual(decoded.activity_tracker, recording.activity_tracker)
+            self.assertEqual(decoded.all_time_barked, recording.all_time_barked)
+            # Labels are written once
+            self.assertEqual(recording.encode().count(b"Howl"), 1)
+
+    def test_decode_jsonpickle(self) -> None:
+        with open("tests/data/recording_jsonpickle.json", "rb") as file:
+            encoded = file.read()
+        recording = Recording.decode(encoded)
+        self.assertEqual(
+            list(recording.activity_tracker),
+            [datetime(2023, 1, 1), datetime(2023, 1, 2)],
+        )
+        self.assertIsInstance(recording.all_time_barked, dict)
+
+    def _device_state(self, device: str, first_day: int, days: int) -> Recording:
+        recording = Recording.decode(
+            b'{"version": 2, "seq": 0, "start": null, "sessions": [], '
+            b'"time_barked": {}, "labels": [], "activities": []}'
+        )
+        recording._device = device
+        for day in range(first_day, first_day + days):
+            start = datetime(2023, 1, 1) + timedelta(days=day)
+            recording._apply({"type": "start", "time": start.isoformat()})
+            recording._apply(
+                {"type": "end", "time": (start + timedelta(hours=1)).isoformat()}
+            )
+            recording._apply(
+                {
+                    "type": "activity",
+                    "time": start.isoformat(),
+                    "label": "Bark " + device,
+                }
+            )
+            recording._apply(
+                {
+                    "type": "time_barked",
+                    "day": start.strftime("%d-%m-%Y"),
+                    "device": device,
+                    "seconds": 10,
+                }
+            )
+        return recording
+
+    def test_merge_devices(self) -> None:
+        # Two devices recording on overlapping days, 100 to 150 in common
+        states = [
+            self._device_state("a", 0, 150),
+            self._device_state("b", 100, 100),
+        ]
+        merged_ab = self._device_state("a", 0, 150)
+        merged_ab.merge(states[1])
+        merged_ba = self._device_state("b", 100, 100)
+        merged_ba.merge(states[0])
+
+        for merged in (merged_ab, merged_ba):
+            self.assertEqual(len(merged.start_end), 200)
+            self.assertEqual(merged.start_end, sorted(merged.start_end))
+            self.assertEqual(len(merged.activity_tracker), 200)
+            # The bark time of both devices adds up on the common days
+            self.assertEqual(
+                merged.all_time_barked["15-04-2023"], timedelta(seconds=20)
+            )
+            self.assertEqual(
+                merged.all_time_barked["01-01-2023"], timedelta(seconds=10)
+            )
+        self.assertEqual(merged_ab.start_end, merged_ba.start_end)
+        self.assertEqual(
+            list(merged_ab.activity_tracker.items()),
+            list(merged_ba.activity_tracker.items()),
+        )
+        self.assertEqual(merged_ab.all_time_barked, merged_ba.all_time_barked)
+
+        # Merging the same state again changes nothing
+        merged_ab.merge(states[1])
+        self.assertEqual(merged_ab.all_time_barked, merged_ba.all_time_barked)
+        self.assertEqual(len(merged_ab.start_end), 200)
+
+    def test_merge_counter_grows(self) -> None:
+        local = self._device_state("a", 0, 1)
+        remote = self._device_state("a", 0, 1)
+        # The remote copy is older, the local counter went on
+        local._apply(
+            {"type": "time_barked", "day": "01-01-2023", "device": "a", "seconds": 5}
+        )
+        local.merge(remote)
+        self.assertEqual(local.all_time_barked["01-01-2023"], timedelta(seconds=15))
+        remote.merge(local)
+        self.assertEqual(remote.all_time_barked["01-01-2023"], timedelta(seconds=15))
+
+    @mock.patch("bark_monitor.recorders.recording.GoogleSync")
+    def test_roll_up(self, google_sync: mock.MagicMock) -> None:
+        google_sync.load_state.return_value = None
+        with tempfile.TemporaryDirectory() as folder:
+            recording = Recording.read(folder)
+            for minute in range(0, 120, 10):
+                recording.add_activity(
+                    datetime(2023, 1, 1, 10, minute % 60)
+                    + timedelta(hours=minute // 60),
+                    "Bark" if minute % 20 == 0 else "Howl",
+                )
+            recording.add_activity(datetime(2023, 1, 20, 10), "Bark")
+
+            rolled_up = recording.roll_up_activities(10, now=datetime(2023, 1, 20, 12))
+            self.assertEqual(rolled_up, 12)
+            self.assertEqual(recording.roll_up_activities(10, datetime(2023, 1, 20)), 0)
+            self.assertEqual(len(recording.activity_tracker), 1)
+            self.assertEqual(
+                recording.rolled_up_activities[datetime(2023, 1, 1, 10)],
+                {"Bark": 3, "Howl": 3},
+            )
+            self.assertEqual(
+                recording.activity_counts(date(2023, 1, 1)), {"Bark": 6, "Howl": 6}
+            )
+            self.assertEqual(
+                recording.daily_activities_formated(date(2023, 1, 1)),
+                "10 h: Bark x3, Howl x3\n11 h: Bark x3, Howl x3\n",
+            )
+
+            # The roll up is replayed from the journal, and saved in the snapshot
+            Recording.forget(folder)
+            recording = Recording.read(folder)
+            self.assertEqual(len(recording.activity_tracker), 1)
+            self.assertEqual(len(recording.rolled_up_activities), 2)
+            recording.save()
+            Recording.forget(folder)
+            recording = Recording.read(folder)
+            self.assertEqual(
+                recording.activity_counts(date(2023, 1, 1)), {"Bark": 6, "Howl": 6}
+            )
+            Recording.forget(folder)
+
+    def test_merge_rolled_up(self) -> None:
+        local = self._device_state("a", 0, 30)
+        remote = self._device_state("a", 0, 30)
+        local._apply({"type": "roll_up", "before": "2023-01-21T00:00:00"})
+        # The remote state still has the raw activities of the rolled up hours
+        remote.merge(local)
+        local.merge(self._device_state("a", 0, 30))
+        for merged in (local, remote):
+            self.assertEqual(len(merged.activity_tracker), 10)
+            self.assertEqual(merged.activity_counts(date(2023, 1, 1)), {"Bark a": 1})
+
+    def test_merge_rolled_up_unsynced(self) -> None:
+        device_a = self._device_state("a", 0, 1)
+        device_b = self._device_state("a", 0, 1)
+        # Device b records activities in the hour before it syncs
+        for minute in (10, 20):
+            device_b._apply(
+                {
+                    "type": "activity",
+                    "time": datetime(2023, 1, 1, 0, minute).isoformat(),
+                    "label": "Bark a",
+                }
+            )
+        device_a._apply({"type": "roll_up", "before": "2023-01-02T00:00:00"})
+        self.assertEqual(device_a.activity_counts(date(2023, 1, 1)), {"Bark a": 1})
+
+        device_a.merge(device_b)
+        device_b.merge(device_a)
+        for merged in (device_a, device_b):
+            self.assertEqual(len(merged.activity_tracker), 0)
+            self.assertEqual(merged.activity_counts(date(2023, 1, 1)), {"Bark a": 3})
+        # Merging the same state again does not count its activities twice
+        device_a.merge(device_b)
+        self.assertEqual(device_a.activity_counts(date(2023, 1, 1)), {"Bark a": 3})
+
+    @mock.patch("bark_monitor.recorders.recording.GoogleSync")
+    def test_retention_task(self, google_sync: mock.MagicMock) -> None:
+        google_sync.load_state.return_value = None
+        with tempfile.TemporaryDirectory() as folder:
+            recording = Recording.read(folder)
+            recording.add_activity(datetime(2020, 1, 1), "Bark")
+            retention = RecordingRetention(folder, 30)
+            retention.start()
+            retention.stop()
+            self.assertEqual(len(recording.activity_tracker), 0)
+            Recording.forget(folder)
@@ -0,0 +1,221 @@
+import sqlite3
+import tempfile
+import threading
+import unittest
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from unittest import mock
+
+from bark_monitor.recorders.recording import Recording
+from bark_monitor.recorders.recording_db import RecordingDatabase
+
+
+class TestRecordingDatabase(unittest.TestCase):
+    def test_range_queries(self) -> None:
+        with tempfile.TemporaryDirectory() as folder:
+            database = RecordingDatabase(Path(folder, "recording.db"))
+            for hour in range(24):
+                time = datetime(year=2023, month=1, day=1, hour=hour, minute=30)
+                database.apply(
+                    {"type": "activity", "time": time.isoformat(), "label": "Bark"}
+                )
+            database.apply(
+                {"type": "activity", "time": "2023-01-02T00:00:00", "label": "Howl"}
+            )
+            for day in (
+                "31-12-2022",
+                "01-01-2023",
+                "01-01-2023",
+                "02-01-2023",
+                Recording.legacy_day,
+            ):
+                database.apply({"type": "time_barked", "day": day, "seconds": 1.5})
+
+            self.assertEqual(len(database.activities_of_day(date(2023, 1, 1))), 24)
+            self.assertEqual(
+                database.activities_of_hour(datetime(2023, 1, 1, 5, 10)),
+                [(datetime(2023, 1, 1, 5, 30), "Bark")],
+            )
+            self.assertEqual(
+                database.activities(datetime(2023, 1, 1, 23, 59))[-1][1], "Howl"
+            )
+            # Days sort by date, not by their "%d-%m-%Y" name
+            self.assertEqual(
+                database.time_barked(date(2023, 1, 1), date(2023, 1, 2)),
+                {
+                    "01-01-2023": timedelta(seconds=3),
+                    "02-01-2023": timedelta(seconds=1.5),
+                },
+            )
+            # The legacy day is in no range of dates
+            self.assertEqual(
+                database.time_barked()[Recording.legacy_day], timedelta(seconds=1.5)
+            )
+
+    def test_sessions(self) -> None:
+        with tempfile.TemporaryDirectory() as folder:
+            database = RecordingDatabase(Path(folder, "recording.db"))
+            database.apply({"type": "start", "time": "2023-01-01T10:00:00"})
+            self.assertEqual(database.start, datetime(2023, 1, 1, 10))
+            database.apply({"type": "end", "time": "2023-01-01T11:00:00"})
+            self.assertIsNone(database.start)
+            self.assertEqual(
+                database.sessions(),
+                [(datetime(2023, 1, 1, 10), datetime(2023, 1, 1, 11))],
+            )
+
+    def test_concurrent_threads(self) -> None:
+        with tempfile.TemporaryDirectory() as folder:
+            database = RecordingDatabase(Path(folder, "recording.db"))
+
+            def write() -> None:
+                for _ in range(100):
+                    database.apply(
+                        {"type": "time_barked", "day": "01-01-2023", "seconds": 1}
+                    )
+
+            threads = [threading.Thread(target=write) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for _ in range(100):
+                database.time_barked()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(
+                database.time_barked()["01-01-2023"], timedelta(seconds=400)
+            )
+
+    def test_schema_upgrade(self) -> None:
+        with tempfile.TemporaryDirectory() as folder:
+            path = Path(folder, "recording.db")
+            connection = sqlite3.connect(path)
+            connection.execute(
+                "CREATE TABLE bark_time (day TEXT PRIMARY KEY, seconds REAL)"
+            )
+            connection.execute("INSERT INTO bark_time VALUES ('2023-01-01', 3)")
+            connection.commit()
+            connection.close()
+
+            database = RecordingDatabase(path)
+            database.apply(
+                {
+                    "type": "time_barked",
+                    "day": "01-01-2023",
+                    "device": "a",
+                    "seconds": 2,
+                }
+            )
+            self.assertEqual(
+                database.time_barked_by_device(),
+                {"01-01-2023": {"": timedelta(seconds=3), "a": timedelta(seconds=2)}},
+            )
+            self.assertEqual(database.time_barked()["01-01-2023"], timedelta(seconds=5))
+
+    def test_roll_up(self) -> None:
+        with tempfile.TemporaryDirectory() as folder:
+            database = RecordingDatabase(Path(folder, "recording.db"))
+            for minute in (0, 10, 20):
+                time = datetime(2023, 1, 1, 10, minute)
+                database.apply(
+                    {"type": "activity", "time": time.isoformat(), "label": "Bark"}
+                )
+            database.apply({"type": "roll_up", "before": "2023-01-01T10:15:00"})
+            database.apply({"type": "roll_up", "before": "2023-01-01T11:00:00"})
+            self.assertEqual(database.activities(), [])
+            self.assertEqual(
+                database.activity_counts(), {datetime(2023, 1, 1, 10): {"Bark": 3}}
+            )
+
+    @mock.patch("bark_monitor.recorders.recording.GoogleSync")
+    def test_migration(self, google_sync: mock.MagicMock) -> None:
+        google_sync.load_state.return_value = None
+        with tempfile.TemporaryDirectory() as folder:
+            recording = Recording.read(folder)
+            recording.add_activity(datetime(2023, 1, 1, 1), "Bark")
+            recording.save()
+            recording.add_activity(datetime(2023, 1, 1, 2), "Howl")
+            recording.add_time_barked(timedelta(seconds=4), "01-01-2023")
+            Recording.forget(folder)
+
+            database = Recording.use_database(folder)
+            self.assertEqual(len(database.activities_of_day(date(2023, 1, 1))), 2)
+            recording = Recording.read(folder)
+            recording.add_activity(datetime(2023, 1, 1, 3), "Bark")
+            self.assertFalse(Path(folder, "recording.journal").exists())
+            Recording.forget(folder)
+
+            recording = Recording.read(folder)
+            self.assertIs(recording.database, database)
+            self.assertEqual(len(recording.activity_tracker), 3)
+            self.assertEqual(
+                recording.all_time_barked["01-01-2023"], timedelta(seconds=4)
+            )
+            Recording.forget(folder)
+            Recording._databases.clear()
+
+    @mock.patch("bark_monitor.recorders.recording.GoogleSync")
+    def test_database_flag(self, google_sync: mock.MagicMock) -> None:
+        google_sync.load_state.return_value = None
+        with tempfile.TemporaryDirectory() as folder:
+            Recording.use_database(folder)
+            recording = Recording.read(folder)
+            recording.add_activity(datetime(2023, 1, 1, 1), "Bark")
+            recording.save()
+            Recording.forget(folder)
+            Recording._databases.clear()
+
+            # Without the flag, the state is read from the snapshot
+            recording = Recording.read(folder)
+            self.assertIsNone(recording.database)
+            self.assertEqual(len(recording.activity_tracker), 1)
+            recording.add_activity(datetime(2023, 1, 1, 2), "Howl")
+            Recording.forget(folder)
+
+            # The changes made without the database are imported
+            google_sync.load_state.reset_mock()
+            database = Recording.use_database(folder)
+            google_sync.load_state.assert_called_once()
+            self.assertEqual(len(database.activities()), 2)
+            recording = Recording.read(folder)
+            recording.add_activity(datetime(2023, 1, 1, 3), "Bark")
+            Recording.forget(folder)
+            Recording._databases.clear()
+
+            # The database is newer than the snapshot, which was not saved
+            google_sync.load_state.reset_mock()
+            database = Recording.use_database(folder)
+            self.assertEqual(len(Recording.read(folder).activity_tracker), 3)
+            google_sync.load_state.assert_called_once()
+            Recording.forget(folder)
+            Recording._databases.clear()
+
+    @mock.patch("bark_monitor.recorders.recording.GoogleSync")
+    def test_save_changed_rows(self, google_sync: mock.MagicMock) -> None:
+        google_sync.load_state.return_value = None
+        with tempfile.TemporaryDirectory() as folder:
+            database = Recording.use_database(folder)
+            recording = Recording.read(folder)
+            for hour in range(24):
+                recording.add_activity(datetime(2023, 1, 1, hour), "Bark")
+            recording.add_time_barked(timedelta(seconds=4), "01-01-2023")
+
+            other = Recording.decode(recording.encode())
+            other._activity_tracker[datetime(2023, 1, 2, 1)] = "Howl"
+            other._time_barked["01-01-2023"]["other"] = timedelta(seconds=2)
+            recording.merge(other)
+            changes = database._connection.total_changes
+            recording.save()
+            # The new activity, the time barked of the other device and the seq
+            self.assertEqual(database._connection.total_changes - changes, 3)
+
+            self.assertEqual(len(database.activities()), 25)
+            self.assertEqual(database.time_barked()["01-01-2023"], timedelta(seconds=6))
+            changes = database._connection.total_changes
+            recording.save()
+            self.assertEqual(database._connection.total_changes - changes, 1)
+            Recording.forget(folder)
+            Recording._databases.clear()
+
+
+if __name__ == "__main__":
+    unittest.main()
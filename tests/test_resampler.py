@@ -0,0 +1,36 @@
+import unittest
+
+import numpy as np
+
+from bark_monitor.recorders.resampler import StreamingResampler
+
+
+class TestStreamingResampler(unittest.TestCase):
+    def _tone(
+        self, rate: int, seconds: float = 1, frequency: float = 440
+    ) -> np.ndarray:
+        t = np.arange(int(rate * seconds)) / rate
+        return (np.sin(2 * np.pi * frequency * t) * 10000).astype(np.int16)
+
+    def test_length(self) -> None:
+        for rate in [8000, 16000, 44100, 48000]:
+            resampler = StreamingResampler(rate, 16000)
+            self.assertEqual(len(resampler.process(self._tone(rate, 2))), 32000)
+
+    def test_chunks_match_whole_signal(self) -> None:
+        signal = self._tone(44100)
+        whole = StreamingResampler(44100, 16000).process(signal)
+
+        resampler = StreamingResampler(44100, 16000)
+        chunks = [resampler.process(chunk) for chunk in np.array_split(signal, 13)]
+        np.testing.assert_array_equal(np.concatenate(chunks), whole)
+
+    def test_keeps_tone(self) -> None:
+        resampled = StreamingResampler(48000, 16000).process(self._tone(48000))
+        expected = self._tone(16000).astype(np.float32)
+        # Skip the start of the signal, where the filter has no history, and account
+        # for the delay of the filter
+        delay = 10
+        np.testing.assert_allclose(
+            resampled[100:], expected[100 - delay : -delay], atol=10
+        )
@@ -0,0 +1,51 @@
+import unittest
+
+import numpy as np
+
+from bark_monitor.recorders.ring_buffer import RingBuffer
+
+
+class TestRingBuffer(unittest.TestCase):
+    def test_latest(self) -> None:
+        buffer = RingBuffer(10)
+        buffer.write(np.arange(4, dtype=np.int16))
+        self.assertEqual(len(buffer), 4)
+        np.testing.assert_array_equal(buffer.latest(3), [1, 2, 3])
+
+        # Wrap around the end of the buffer
+        buffer.write(np.arange(4, 12, dtype=np.int16))
+        self.assertEqual(len(buffer), 10)
+        self.assertEqual(buffer.written, 12)
+        np.testing.assert_array_equal(buffer.latest(10), np.arange(2, 12))
+
+    def test_latest_is_a_view(self) -> None:
+        buffer = RingBuffer(8)
+        buffer.write(np.arange(13, dtype=np.int16))
+        view = buffer.latest(8)
+        self.assertFalse(view.flags.owndata)
+        self.assertFalse(view.flags.writeable)
+        np.testing.assert_array_equal(view, np.arange(5, 13))
+
+    def test_write_larger_than_capacity(self) -> None:
+        buffer = RingBuffer(5)
+        buffer.write(np.arange(3, dtype=np.int16))
+        buffer.write(np.arange(3, 15, dtype=np.int16))
+        self.assertEqual(buffer.written, 15)
+        np.testing.assert_array_equal(buffer.latest(5), np.arange(10, 15))
+
+    def test_since(self) -> None:
+        buffer = RingBuffer(6)
+        buffer.write(np.arange(4, dtype=np.int16))
+        start = buffer.written - 2
+        buffer.write(np.arange(4, 6, dtype=np.int16))
+        np.testing.assert_array_equal(buffer.since(start), [2, 3, 4, 5])
+
+        # Samples that were overwritten are lost
+        buffer.write(np.arange(6, 10, dtype=np.int16))
+        np.testing.assert_array_equal(buffer.since(start), np.arange(4, 10))
+
+    def test_latest_too_many(self) -> None:
+        buffer = RingBuffer(6)
+        buffer.write(np.arange(2, dtype=np.int16))
+        with self.assertRaises(ValueError):
+            buffer.latest(3)
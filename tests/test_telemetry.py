@@ -0,0 +1,133 @@
+import json
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from bark_monitor.recorders.telemetry import TelemetryExporter, TelemetrySpool
+
+
+class _ThingsBoardStub(BaseHTTPRequestHandler):
+    """Store the posted telemetry, answer with `status`."""
+
+    status = 200
+    batches: list[list[dict]] = []
+
+    def do_POST(self) -> None:
+        length = int(self.headers["Content-Length"])
+        batch = json.loads(self.rfile.read(length))
+        if self.status == 200:
+            self.batches.append(batch)
+        self.send_response(self.status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+
+class TestTelemetry(unittest.TestCase):
+    def setUp(self) -> None:
+        _ThingsBoardStub.status = 200
+        _ThingsBoardStub.batches = []
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _ThingsBoardStub)
+        threading.Thread(
+            target=self._server.serve_forever, args=(0.05,), daemon=True
+        ).start()
+        self._folder = tempfile.TemporaryDirectory()
+        self._url = "http://127.0.0.1:" + str(self._server.server_port) + "/telemetry"
+
+    def tearDown(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+        self._folder.cleanup()
+
+    def _exporter(self, url: str | None = None) -> TelemetryExporter:
+        return TelemetryExporter(
+            self._url if url is None else url,
+            Path(self._folder.name, "telemetry.spool"),
+            batch_size=3,
+            flush_seconds=60,
+            timeout_seconds=1,
+        )
+
+    def test_batch(self) -> None:
+        exporter = self._exporter()
+        exporter.start()
+        for bark in range(7):
+            exporter.export({"Bark": bark})
+        exporter.stop()
+
+        self.assertEqual(exporter.sent, 7)
+        self.assertTrue(all(len(batch) <= 3 for batch in _ThingsBoardStub.batches))
+        records = [record for batch in _ThingsBoardStub.batches for record in batch]
+        self.assertEqual(
+            [record["values"]["Bark"] for record in records], list(range(7))
+        )
+        self.assertTrue(all(isinstance(record["ts"], int) for record in records))
+
+    def test_spool(self) -> None:
+        _ThingsBoardStub.status = 503
+        exporter = self._exporter()
+        exporter.start()
+        for bark in range(4):
+            exporter.export({"Bark": bark})
+        exporter.stop()
+        self.assertEqual(exporter.sent, 0)
+        self.assertEqual(exporter.spooled, 4)
+
+        # The spool is sent first once the server is back, from a new process
+        _ThingsBoardStub.status = 200
+        exporter = self._exporter()
+        self.assertEqual(exporter.spooled, 4)
+        exporter.start()
+        exporter.export({"Bark": 4})
+        exporter.stop()
+        self.assertEqual(exporter.spooled, 0)
+        records = [record for batch in _ThingsBoardStub.batches for record in batch]
+        self.assertEqual(
+            [record["values"]["Bark"] for record in records], list(range(5))
+        )
+        self.assertFalse(Path(self._folder.name, "telemetry.spool").exists())
+
+    def test_unreachable(self) -> None:
+        # Nothing listens on the port of a closed server
+        server = ThreadingHTTPServer(("127.0.0.1", 0), _ThingsBoardStub)
+        url = "http://127.0.0.1:" + str(server.server_port)
+        server.server_close()
+
+        exporter = self._exporter(url)
+        exporter.start()
+        exporter.export({"Bark": 1})
+        exporter.stop()
+        self.assertEqual(exporter.failed_requests, 1)
+        self.assertEqual(exporter.spooled, 1)
+
+    def test_rejected(self) -> None:
+        _ThingsBoardStub.status = 400
+        exporter = self._exporter()
+        exporter.start()
+        exporter.export({"Bark": 1})
+        exporter.stop()
+        self.assertEqual(exporter.rejected, 1)
+        self.assertEqual(exporter.spooled, 0)
+
+    def test_spool_bound(self) -> None:
+        spool = TelemetrySpool(Path(self._folder.name, "telemetry.spool"), 5)
+        spool.append([{"ts": i, "values": {}} for i in range(4)])
+        spool.append([{"ts": i, "values": {}} for i in range(4, 8)])
+        self.assertEqual(len(spool), 5)
+        self.assertEqual(spool.dropped, 3)
+        self.assertEqual([record["ts"] for record in spool.read()], [3, 4, 5, 6, 7])
+        spool.remove(2)
+        self.assertEqual([record["ts"] for record in spool.read()], [5, 6, 7])
+        with open(Path(self._folder.name, "telemetry.spool"), "a") as file:
+            file.write('{"ts": 8, "val')
+        self.assertEqual(
+            len(TelemetrySpool(Path(self._folder.name, "telemetry.spool"))), 3
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
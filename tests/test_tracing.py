@@ -0,0 +1,74 @@
+import json
+import tempfile
+import threading
+import timeit
+import unittest
+from pathlib import Path
+
+from bark_monitor.tracing import Tracer
+
+
+class TestTracing(unittest.TestCase):
+    def test_disabled(self) -> None:
+        tracer = Tracer()
+        with tracer.span("capture"):
+            pass
+        self.assertEqual(len(tracer), 0)
+        self.assertIs(tracer.span("capture"), tracer.span("detect"))
+
+        def traced() -> None:
+            with tracer.span("capture"):
+                pass
+
+        # A disabled span costs about as much as a function call
+        self.assertLess(timeit.timeit(traced, number=10000) / 10000, 5e-6)
+
+    def test_dump(self) -> None:
+        tracer = Tracer(capacity=3)
+        tracer.enable()
+        for name in ["read", "capture", "resample", "detect"]:
+            with tracer.span(name):
+                pass
+        thread = threading.Thread(target=lambda: tracer.span("save").__enter__())
+        thread.start()
+        thread.join()
+        self.assertEqual(len(tracer), 3)
+
+        with tempfile.TemporaryDirectory() as folder:
+            path = tracer.dump(Path(folder, "trace.json"))
+            with open(path, "r") as file:
+                events = json.load(file)["traceEvents"]
+        spans = [event for event in events if event["ph"] == "X"]
+        self.assertEqual(
+            [span["name"] for span in spans], ["capture", "resample", "detect"]
+        )
+        self.assertTrue(all(span["dur"] >= 0 for span in spans))
+        self.assertLessEqual(spans[0]["ts"], spans[1]["ts"])
+        self.assertEqual(
+            [event["args"]["name"] for event in events if event["ph"] == "M"],
+            ["MainThread"],
+        )
+
+        tracer.clear()
+        tracer.disable()
+        self.assertEqual(len(tracer), 0)
+        self.assertFalse(tracer.enabled)
+
+    def test_memory(self) -> None:
+        tracer = Tracer()
+        self.assertIsNone(tracer.top_allocations())
+        tracer.enable(memory=True)
+        try:
+            self.assertTrue(tracer.memory)
+            blocks = [bytearray(1000) for _ in range(100)]
+            allocations = tracer.top_allocations(limit=5)
+            assert allocations is not None
+            self.assertIn("test_tracing.py", allocations)
+            del blocks
+        finally:
+            tracer.disable()
+        self.assertFalse(tracer.memory)
+
+
+if __name__ == "__main__":
+    unittest.main()